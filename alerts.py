@@ -0,0 +1,482 @@
+# alerts.py
+
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from config import ALERT_RULES, MONITOR_INTERVAL
+from data_handler import fetch_since
+from metric_registry import registry
+from session_store import session_store
+
+# above/below: the value crosses `level`; rate: the value changes by more than
+# `level` per minute; stuck: the value has not changed for `level` seconds;
+# bits: bits of an alarm word go on or off; change: every change of value
+KINDS = ('above', 'below', 'rate', 'stuck', 'bits', 'change')
+_ABOVE, _BELOW, _RATE, _STUCK, _BITS, _CHANGE = range(len(KINDS))
+
+AlertRule = namedtuple('AlertRule', ['category', 'metric', 'kind', 'level', 'hysteresis', 'delay', 'bits'])
+AlertEvent = namedtuple('AlertEvent', ['rule_id', 'rule', 'time', 'value', 'previous', 'firing', 'bits'])
+
+def alert_rule(category, metric, kind, level=None, hysteresis=0, delay=0, bits=-1):
+    """
+    Validates and builds an AlertRule.
+
+    Parameters:
+    - category (str), metric (str): The series to watch.
+    - kind (str): One of KINDS.
+    - level (float): Threshold, rate per minute or stuck duration in seconds.
+    - hysteresis (float): How far back past `level` a threshold or rate alert
+      must go before it clears.
+    - delay (float): Seconds a condition must hold before the alert fires or clears.
+    - bits (int): Mask of the alarm bits a 'bits' rule reports; all by default.
+    """
+    registry.validate(category, metric)
+    if kind not in KINDS:
+        raise ValueError(f"Unknown alert kind '{kind}'. Please use one of {KINDS}.")
+    if kind in ('above', 'below', 'rate', 'stuck') and level is None:
+        raise ValueError(f"'{kind}' alerts need a level.")
+    if hysteresis < 0 or delay < 0:
+        raise ValueError("Hysteresis and delay cannot be negative.")
+    return AlertRule(category, metric, kind, None if level is None else float(level),
+                     float(hysteresis), float(delay), int(bits))
+
+ALERT_USAGE = ("🔔 Usage: /alert <category> <metric> <above|below|rate|stuck|bits|change> "
+               "[level] [hysteresis] [delay seconds]")
+
+def parse_alert_command(text):
+    """
+    Builds the AlertRule of an '/alert <category> <metric> <kind> [level] [hysteresis] [delay]' message.
+
+    Raises:
+    - ValueError: With ALERT_USAGE or the reason the rule is invalid.
+    """
+    args = text.split()[1:]
+    if len(args) < 3 or len(args) > 6:
+        raise ValueError(ALERT_USAGE)
+    try:
+        numbers = [float(arg) for arg in args[3:]]
+    except ValueError:
+        raise ValueError(ALERT_USAGE) from None
+    return alert_rule(args[0], args[1], args[2], *numbers)
+
+def describe_rule(rule):
+    level = f" {rule.level:g}" if rule.level is not None else ''
+    return f"{rule.category} {rule.metric} {rule.kind}{level}"
+
+class AlertEngine:
+    """
+    Evaluates alert rules over the new points of the watched series.
+
+    Identical rules of different chats are stored once, and each rule keeps
+    the set of chats subscribed to it; only series with at least one
+    subscribed rule are read. Every tick, the new points of all series are
+    concatenated and each rule's condition is computed for all of its points
+    at once with NumPy; only the rules of series that received points are
+    looked at, plus the 'stuck' rules, which depend on the clock.
+
+    A threshold or rate condition turns on past `level` and off only once it
+    is `hysteresis` back on the other side; in between it keeps its state.
+    The alert follows the condition once it has held for `delay` seconds of
+    data time, so flapping shorter than that is ignored.
+
+    Each series is read from a watermark: the newest point read, or the time
+    up to which the last poll saw everything, `lateness` seconds before it
+    started, whichever is later. A series that stops sending points keeps
+    being read from a recent time instead of from its last point.
+    """
+
+    def __init__(self, lookback='-1m', lateness=MONITOR_INTERVAL):
+        self.lookback = lookback
+        self.lateness = lateness
+        self._lock = threading.Lock()
+        self._rules = []            # rule id -> AlertRule
+        self._rule_ids = {}         # AlertRule -> rule id
+        self._subscribers = []      # rule id -> set of chat ids
+        self._subscriptions = {}    # chat id -> set of rule ids
+        self._series = {}           # (category, metric) -> series id
+        self._series_keys = []      # series id -> (category, metric)
+        self._series_rules = []     # series id -> list of rule ids
+        self._cursors = []          # series id -> watermark (see above), or None
+        self._stuck = []            # ids of the 'stuck' rules
+        # Per rule: parameters, then the condition, since when it holds (ns),
+        # the value that turned it and the state of the alert
+        self._rule_series = np.zeros(0, dtype=np.int64)
+        self._kind = np.zeros(0, dtype=np.int64)
+        self._level = np.zeros(0)
+        self._clear = np.zeros(0)
+        self._delay = np.zeros(0, dtype=np.int64)
+        self._mask = np.zeros(0, dtype=np.int64)
+        self._raw = np.zeros(0, dtype=np.int64)
+        self._since = np.zeros(0, dtype=np.int64)
+        self._since_value = np.zeros(0)
+        self._active = np.zeros(0, dtype=np.int64)
+        # Per series: last value, its time and the time of the last change (ns, 0 if none)
+        self._last_value = np.zeros(0)
+        self._last_time = np.zeros(0, dtype=np.int64)
+        self._last_change = np.zeros(0, dtype=np.int64)
+        self.ticks = 0
+        self.events = 0
+
+    # Rules and subscriptions
+
+    def _add_rule(self, rule):
+        rule_id = self._rule_ids.get(rule)
+        if rule_id is not None:
+            return rule_id
+        key = (rule.category, rule.metric)
+        series_id = self._series.get(key)
+        if series_id is None:
+            series_id = self._series[key] = len(self._series_keys)
+            self._series_keys.append(key)
+            self._series_rules.append([])
+            self._cursors.append(None)
+            self._last_value = np.append(self._last_value, np.nan)
+            self._last_time = np.append(self._last_time, 0)
+            self._last_change = np.append(self._last_change, 0)
+        rule_id = self._rule_ids[rule] = len(self._rules)
+        self._rules.append(rule)
+        self._subscribers.append(set())
+        self._series_rules[series_id].append(rule_id)
+        kind = KINDS.index(rule.kind)
+        if kind == _STUCK:
+            self._stuck.append(rule_id)
+        level = np.nan if rule.level is None else rule.level
+        self._rule_series = np.append(self._rule_series, series_id)
+        self._kind = np.append(self._kind, kind)
+        self._level = np.append(self._level, level)
+        self._clear = np.append(self._clear, level + rule.hysteresis if kind == _BELOW else level - rule.hysteresis)
+        self._delay = np.append(self._delay, int(rule.delay * 10**9))
+        self._mask = np.append(self._mask, rule.bits)
+        self._raw = np.append(self._raw, 0)
+        self._since = np.append(self._since, 0)
+        self._since_value = np.append(self._since_value, np.nan)
+        self._active = np.append(self._active, 0)
+        return rule_id
+
+    def _reset(self, rule_id):
+        self._raw[rule_id] = self._active[rule_id] = self._since[rule_id] = 0
+        self._since_value[rule_id] = np.nan
+
+    def subscribe(self, chat_id, rule):
+        """
+        Subscribes a chat to a rule, adding the rule if no chat had it yet; returns the rule id.
+        """
+        with self._lock:
+            rule_id = self._add_rule(rule)
+            subscribers = self._subscribers[rule_id]
+            if not subscribers:
+                self._reset(rule_id)
+            subscribers.add(chat_id)
+            self._subscriptions.setdefault(chat_id, set()).add(rule_id)
+            return rule_id
+
+    def unsubscribe(self, chat_id, rule=None):
+        """
+        Removes a chat from one rule, or from all of its rules.
+        """
+        with self._lock:
+            rule_ids = self._subscriptions.get(chat_id, set())
+            if rule is not None:
+                rule_id = self._rule_ids.get(rule)
+                rule_ids = {rule_id} & rule_ids
+            for rule_id in list(rule_ids):
+                self._subscribers[rule_id].discard(chat_id)
+                self._subscriptions[chat_id].discard(rule_id)
+                if not self._subscribers[rule_id]:
+                    series_id = self._rule_series[rule_id]
+                    if not any(self._subscribers[other] for other in self._series_rules[series_id]):
+                        # Read it again from the lookback, not from a stale cursor, if it comes back
+                        self._cursors[series_id] = None
+                        self._last_value[series_id] = np.nan
+                        self._last_time[series_id] = self._last_change[series_id] = 0
+            if not self._subscriptions.get(chat_id):
+                self._subscriptions.pop(chat_id, None)
+
+    def subscribers(self, rule_id):
+        with self._lock:
+            return list(self._subscribers[rule_id])
+
+    def subscriptions(self, chat_id):
+        """
+        Returns the rules a chat is subscribed to.
+        """
+        with self._lock:
+            return [self._rules[rule_id] for rule_id in sorted(self._subscriptions.get(chat_id, ()))]
+
+    # Evaluation
+
+    def cursors(self):
+        """
+        Returns the fetch_since cursor of every series with a subscribed rule.
+        """
+        with self._lock:
+            return {
+                key: self._cursors[series_id]
+                for key, series_id in self._series.items()
+                if any(self._subscribers[rule_id] for rule_id in self._series_rules[series_id])
+            }
+
+    def watermark(self, started):
+        """
+        Returns the watermark (ns) of a read that started at `started` (ns).
+        """
+        return started - int(self.lateness * 10**9)
+
+    def poll(self):
+        """
+        Reads the new points of the watched series and returns the resulting AlertEvents.
+        """
+        started = time.time_ns()
+        cursors = self.cursors()
+        frames = fetch_since(cursors, lookback=self.lookback)
+        return self.apply(frames, cursors=cursors, watermark=self.watermark(started))
+
+    def apply(self, frames, now=None, cursors=None, watermark=None):
+        """
+        Evaluates the rules against a fetch_since result.
+
+        Parameters:
+        - frames (dict): Maps (category, metric) to the new points of a series.
+        - now (int): Current time in ns, for 'stuck' rules; the wall clock by default.
+        - cursors (dict): The cursors() the read was made with.
+        - watermark (int): Time (ns) up to which the series in `cursors` are now complete.
+
+        Returns:
+        - list of AlertEvent: Alerts that fired or cleared, in time order per rule.
+        """
+        now = time.time_ns() if now is None else now
+        with self._lock:
+            events = []
+            series_ids, times, values = [], [], []
+            for key, df in frames.items():
+                series_id = self._series.get(key)
+                if series_id is None or df.empty:
+                    continue
+                self._cursors[series_id] = df['_time'].iloc[-1]
+                value = pd.to_numeric(df['_value'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+                numeric = ~np.isnan(value)
+                if numeric.any():
+                    series_ids.append(series_id)
+                    times.append(pd.DatetimeIndex(df['_time']).asi8[numeric])
+                    values.append(value[numeric])
+            if watermark is not None:
+                mark = pd.Timestamp(watermark, tz='UTC')
+                for key in cursors or ():
+                    series_id = self._series.get(key)
+                    # Not if every rule of the series was unsubscribed during the read
+                    if series_id is None or not self._enabled(self._series_rules[series_id]):
+                        continue
+                    cursor = self._cursors[series_id]
+                    self._cursors[series_id] = mark if cursor is None else max(cursor, mark)
+            if series_ids:
+                events.extend(self._evaluate_points(np.array(series_ids), times, values))
+            events.extend(self._evaluate_stuck(now))
+            self.ticks += 1
+            self.events += len(events)
+            return events
+
+    def _enabled(self, rule_ids):
+        return [rule_id for rule_id in rule_ids if self._subscribers[rule_id]]
+
+    def _evaluate_points(self, series_ids, times, values):
+        lengths = np.array([len(t) for t in times])
+        starts = np.cumsum(lengths) - lengths
+        ends = starts + lengths
+        t_all = np.concatenate(times)
+        v_all = np.concatenate(values)
+
+        # Each point against the previous one of its series
+        prev_v = np.empty_like(v_all)
+        prev_t = np.empty_like(t_all)
+        prev_v[1:], prev_t[1:] = v_all[:-1], t_all[:-1]
+        prev_v[starts], prev_t[starts] = self._last_value[series_ids], self._last_time[series_ids]
+        first = np.isnan(prev_v)
+        changed = first | (v_all != prev_v)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dt = t_all - prev_t
+            rate = np.where(~first & (dt > 0), (v_all - prev_v) * 60e9 / np.where(dt > 0, dt, 1), np.nan)
+
+        events = []
+        change_points = np.flatnonzero(changed & ~first)
+        if len(change_points):
+            point_series = np.repeat(series_ids, lengths)
+            for point in change_points:
+                for rule_id in self._enabled(self._series_rules[point_series[point]]):
+                    if self._kind[rule_id] == _CHANGE:
+                        events.append(self._event(rule_id, t_all[point], v_all[point], prev_v[point], True, 0))
+
+        self._last_change[series_ids] = np.maximum(self._last_change[series_ids],
+                                                   np.maximum.reduceat(np.where(changed, t_all, 0), starts))
+        self._last_value[series_ids] = v_all[ends - 1]
+        self._last_time[series_ids] = t_all[ends - 1]
+
+        # Pair every point-driven rule of these series with each point of its series
+        rule_ids, segments = [], []
+        for segment, series_id in enumerate(series_ids):
+            for rule_id in self._enabled(self._series_rules[series_id]):
+                if self._kind[rule_id] in (_ABOVE, _BELOW, _RATE, _BITS):
+                    rule_ids.append(rule_id)
+                    segments.append(segment)
+        if not rule_ids:
+            return events
+        rule_ids = np.array(rule_ids)
+        segments = np.array(segments)
+        counts = lengths[segments]
+        offsets = np.cumsum(counts) - counts
+        pair_rule = np.repeat(rule_ids, counts)
+        pair_first = np.repeat(offsets, counts)
+        index = np.arange(counts.sum()) - pair_first + np.repeat(starts[segments], counts)
+        t = t_all[index]
+        kind = self._kind[pair_rule]
+        x = np.where(kind == _RATE, np.abs(rate[index]), v_all[index])
+        level = self._level[pair_rule]
+        clear = self._clear[pair_rule]
+
+        below = kind == _BELOW
+        with np.errstate(invalid='ignore'):
+            on = np.where(below, x < level, x > level)
+            off = np.where(below, x >= clear, x <= clear)
+        signal = on.astype(np.int64)
+        defined = on | off
+        bits = kind == _BITS
+        signal[bits] = x[bits].astype(np.int64) & self._mask[pair_rule[bits]]
+        defined |= bits
+
+        # Inside the hysteresis band the condition keeps its previous state
+        last_defined = np.maximum.accumulate(np.where(defined, np.arange(len(signal)), -1))
+        carried = last_defined >= pair_first
+        raw = np.where(carried, signal[np.maximum(last_defined, 0)], self._raw[pair_rule])
+
+        previous = np.empty_like(raw)
+        previous[1:] = raw[:-1]
+        previous[offsets] = self._raw[rule_ids]
+        flips = np.flatnonzero(raw != previous)
+        flip_rules = np.searchsorted(offsets, flips, side='right') - 1
+
+        # Debounce: walk the few flips of each rule
+        bounds = np.searchsorted(flip_rules, np.arange(len(rule_ids) + 1))
+        for i, rule_id in enumerate(rule_ids):
+            state, since, since_value = self._raw[rule_id], self._since[rule_id], self._since_value[rule_id]
+            active, delay = self._active[rule_id], self._delay[rule_id]
+            for flip in flips[bounds[i]:bounds[i + 1]]:
+                if state != active and t[flip] - since >= delay:
+                    events.extend(self._transition(rule_id, since + delay, since_value, active, state))
+                    active = state
+                state, since, since_value = raw[flip], t[flip], x[flip]
+            newest = t_all[ends[segments[i]] - 1]
+            if state != active and newest - since >= delay:
+                events.extend(self._transition(rule_id, since + delay, since_value, active, state))
+                active = state
+            self._raw[rule_id], self._since[rule_id], self._since_value[rule_id] = state, since, since_value
+            self._active[rule_id] = active
+        return events
+
+    def _evaluate_stuck(self, now):
+        stuck = self._enabled(self._stuck)
+        if not stuck:
+            return []
+        stuck = np.array(stuck)
+        series = self._rule_series[stuck]
+        last_change = self._last_change[series]
+        raw = ((last_change > 0) & (now - last_change >= self._level[stuck] * 10**9)).astype(np.int64)
+        events = []
+        flipped = raw != self._active[stuck]
+        for rule_id, state, series_id in zip(stuck[flipped], raw[flipped], series[flipped]):
+            events.append(self._event(rule_id, now if state else self._last_change[series_id],
+                                      self._last_value[series_id], np.nan, bool(state), 0))
+            self._active[rule_id] = state
+        return events
+
+    def _transition(self, rule_id, at, value, active, state):
+        if self._kind[rule_id] != _BITS:
+            return [self._event(rule_id, at, value, np.nan, bool(state), 0)]
+        events = []
+        raised, cleared = int(state & ~active), int(active & ~state)
+        if raised:
+            events.append(self._event(rule_id, at, value, np.nan, True, raised))
+        if cleared:
+            events.append(self._event(rule_id, at, value, np.nan, False, cleared))
+        return events
+
+    def _event(self, rule_id, at, value, previous, firing, bits):
+        return AlertEvent(int(rule_id), self._rules[rule_id], pd.Timestamp(int(at), tz='UTC'),
+                          float(value), float(previous), firing, bits)
+
+    def stats(self):
+        """
+        Returns the number of rules, subscriptions and evaluated ticks.
+        """
+        with self._lock:
+            return {
+                'rules': len(self._rules),
+                'active_rules': sum(1 for subscribers in self._subscribers if subscribers),
+                'firing': int(np.count_nonzero(self._active)),
+                'series': len(self._series_keys),
+                'chats': len(self._subscriptions),
+                'subscriptions': sum(len(rule_ids) for rule_ids in self._subscriptions.values()),
+                'ticks': self.ticks,
+                'events': self.events,
+            }
+
+def coalesce_key(event):
+    """
+    Returns the notifier coalesce_key of an AlertEvent.
+
+    Only 'change' events coalesce, the newest value replacing one still
+    waiting to be sent. Firing and clearing must each reach the chat, in
+    order, so other events are never merged.
+    """
+    if event.rule.kind == 'change':
+        return ('alert', event.rule_id)
+    return None
+
+def _bit_list(mask):
+    return ', '.join(str(bit) for bit in range(64) if mask >> bit & 1)
+
+def alert_text(event):
+    """
+    Returns the notification text of an AlertEvent.
+    """
+    rule = event.rule
+    metric = rule.metric
+    if rule.kind == 'change':
+        return f"The value of {metric} has changed from {event.previous:g} to {event.value:g}."
+    if rule.kind == 'bits':
+        if event.firing:
+            return f"🚨 {metric}: alarm bits {_bit_list(event.bits)} raised at {event.time}."
+        return f"✅ {metric}: alarm bits {_bit_list(event.bits)} cleared at {event.time}."
+    if rule.kind == 'stuck':
+        if event.firing:
+            return f"🚨 {metric} has not changed for {rule.level:g}s (value {event.value:g})."
+        return f"✅ {metric} is changing again (value {event.value:g})."
+    if rule.kind == 'rate':
+        if event.firing:
+            return f"🚨 {metric} is changing by {event.value:g}/min, over {rule.level:g}/min, since {event.time}."
+        return f"✅ {metric} is changing by {event.value:g}/min again, within {rule.level:g}/min."
+    side = 'above' if rule.kind == 'above' else 'below'
+    if event.firing:
+        return f"🚨 {metric} is {side} {rule.level:g} ({event.value:g}) since {event.time}."
+    return f"✅ {metric} is back to {event.value:g} (limit {rule.level:g})."
+
+# Rules a chat gets with '🔔 Monitor Variable'
+DEFAULT_RULES = [alert_rule(**spec) for spec in ALERT_RULES]
+
+alert_engine = AlertEngine()
+
+def restore_subscriptions(store=session_store, engine=alert_engine):
+    """
+    Subscribes the chats saved in a SessionStore again, after a restart.
+    """
+    for chat_id in store.monitoring_chats():
+        for rule in DEFAULT_RULES:
+            engine.subscribe(chat_id, rule)
+    for chat_id, rules in store.alerts().items():
+        for fields in rules:
+            try:
+                rule = alert_rule(*fields)
+            except ValueError as e:
+                print(f"Skipping a saved alert of {chat_id}: {e}")
+                continue
+            engine.subscribe(chat_id, rule)
@@ -0,0 +1,194 @@
+# async_runtime.py
+#
+# Optional asyncio runtime: updates and Bot API requests share one event loop,
+# so a chat waiting on Telegram does not hold a thread. The handlers are the
+# ones in chat_handlers; what they do between two requests (InfluxDB queries
+# through the pool, graph rendering, session store I/O) runs on a thread pool.
+# Notifications and chat deletion use the same dispatcher and deleter as the
+# threaded runtime, and the background jobs are loop tasks that run one pass
+# of the shared pollers on a thread at a time.
+#
+# Usage: python async_runtime.py
+
+import asyncio
+import functools
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from telebot import apihelper, asyncio_helper
+from config import TOKEN, MONITOR_INTERVAL, HANDLER_WORKERS, HANDLER_QUERY_DEADLINE, TELEGRAM_API_URL
+from data_handler import influx, fetch_since, fetch_metric_names, series_store
+from series_store import SeriesPoller
+from alerts import alert_engine, restore_subscriptions
+from session_store import session_store
+from notifier import MessageDispatcher
+from monitoring import check_alerts
+from metric_registry import registry, fixed_metrics, MetricDiscovery
+from report_scheduler import report_scheduler
+from message_cleanup import TrackingTeleBot, TrackingAsyncTeleBot, MessageDeleter
+from chat_handlers import register, step
+
+if TELEGRAM_API_URL:
+    apihelper.API_URL = asyncio_helper.API_URL = TELEGRAM_API_URL
+
+class AsyncRuntime:
+    """
+    Runs the bot on AsyncTeleBot.
+
+    Chats are handled as concurrent tasks on a single event loop, each running
+    a chat_handlers handler with drive(). The alert monitor, the series store
+    poll, metric discovery and the report snapshots are coroutines on the same
+    loop. Notifications and chat deletions are sent from their own threads
+    through a plain TeleBot, with the rate limits, coalescing and progress
+    reports of the threaded runtime. `run()` returns cleanly on SIGINT/SIGTERM
+    after closing every connection.
+    """
+
+    def __init__(self, token=TOKEN, workers=HANDLER_WORKERS):
+        self.bot = TrackingAsyncTeleBot(token)
+        # Sends from the dispatcher and deleter threads; it never polls
+        self.sender = TrackingTeleBot(token, threaded=False)
+        self.dispatcher = MessageDispatcher(self.sender)
+        self.deleter = MessageDeleter(self.sender)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='async-handler')
+        self.sessions = session_store
+        self.alerts = alert_engine
+        self._stopping = None
+        for category, metrics in fixed_metrics.items():
+            for metric in metrics:
+                series_store.track(category, metric)
+        # Their passes run from the loops below instead of their own threads
+        self.series_poller = SeriesPoller(series_store, fetch_since)
+        self.metric_discovery = MetricDiscovery(registry, fetch_metric_names)
+        register(self.bot, self.handler, self.handler, self.deleter)
+
+    def handler(self, handler):
+        """
+        Turns a chat_handlers handler into an AsyncTeleBot handler.
+        """
+        @functools.wraps(handler)
+        async def wrapper(update):
+            await self.drive(handler(update))
+        return wrapper
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """
+        Runs blocking work on the executor without stalling the loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: fn(*args, **kwargs))
+
+    async def drive(self, steps):
+        """
+        Runs a handler to the end: its own work on the executor, its Bot API requests on the loop.
+
+        All InfluxDB queries of one run share a HANDLER_QUERY_DEADLINE budget,
+        like the slow handlers of the threaded runtime.
+        """
+        expires = time.monotonic() + HANDLER_QUERY_DEADLINE
+        call = await self.run_blocking(self._step, expires, steps)
+        while call is not None:
+            try:
+                result = await getattr(self.bot, call.method)(*call.args, **call.kwargs)
+            except Exception as e:
+                call = await self.run_blocking(self._step, expires, steps, error=e)
+            else:
+                call = await self.run_blocking(self._step, expires, steps, result)
+
+    @staticmethod
+    def _step(expires, steps, result=None, error=None):
+        # The deadline is kept per thread and the steps of one run may land on different ones
+        with influx.deadline(max(0.0, expires - time.monotonic())):
+            return step(steps, result, error)
+
+    # Background jobs
+
+    async def pause(self, seconds):
+        """
+        Sleeps for `seconds`; returns True if the runtime is stopping.
+        """
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+        return self._stopping.is_set()
+
+    async def series_loop(self):
+        poller = self.series_poller
+        while True:
+            try:
+                await asyncio.to_thread(poller.poll)
+            except Exception as e:
+                poller.failures += 1
+                print(f"Error polling the series store: {e}")
+            if await self.pause(poller.interval):
+                return
+
+    async def discovery_loop(self):
+        discovery = self.metric_discovery
+        if not discovery.interval:
+            return
+        while True:
+            try:
+                added = await asyncio.to_thread(discovery.refresh)
+                if added:
+                    print(f"Discovered {added} new metrics ({len(registry)} in total).")
+            except Exception as e:
+                discovery.failures += 1
+                print(f"Error discovering metrics: {e}")
+            if await self.pause(discovery.interval):
+                return
+
+    async def report_loop(self):
+        while True:
+            kind, wait = report_scheduler.due()
+            if kind is None:
+                if await self.pause(wait):
+                    return
+                continue
+            # Failures are counted and logged by the scheduler
+            await asyncio.to_thread(report_scheduler.run_once, kind)
+
+    async def monitor_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(check_alerts, self.dispatcher, self.alerts)
+            except Exception as e:
+                print(f"Error in monitoring task: {str(e)}")
+            if await self.pause(MONITOR_INTERVAL):
+                return
+
+    # Lifecycle
+
+    async def run(self):
+        """
+        Runs polling and monitoring until SIGINT/SIGTERM, then shuts everything down.
+        """
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stopping.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C cancels asyncio.run instead
+
+        # Authenticated chats, monitoring preferences and alerts survive restarts
+        await asyncio.to_thread(self.sessions.load)
+        restore_subscriptions(self.sessions, self.alerts)
+        polling = asyncio.create_task(self.bot.polling(non_stop=True))
+        loops = [asyncio.create_task(loop()) for loop in
+                 (self.monitor_loop, self.series_loop, self.discovery_loop, self.report_loop)]
+        try:
+            await self._stopping.wait()
+        finally:
+            self._stopping.set()
+            polling.cancel()
+            await asyncio.gather(polling, *loops, return_exceptions=True)
+            await self.bot.close_session()
+            self.executor.shutdown(wait=True)
+            await asyncio.to_thread(influx.close)
+            await asyncio.to_thread(series_store.flush)
+            await asyncio.to_thread(self.sessions.close)
+
+if __name__ == "__main__":
+    asyncio.run(AsyncRuntime().run())
@@ -0,0 +1,337 @@
+# benchmarks.py
+#
+# Micro-benchmarks for the hot paths of the bot. Nothing here talks to
+# InfluxDB or Telegram; every benchmark runs on synthetic data.
+#
+# Usage: python benchmarks.py [name ...]
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+def synthetic_series(points, freq='min'):
+    """
+    Returns a '_time'/'_value' DataFrame shaped like a fetch_data result.
+    """
+    times = pd.date_range('2024-01-01', periods=points, freq=freq, tz='UTC')
+    values = 50 + 10 * np.sin(np.arange(points) / 60) + np.random.default_rng(0).normal(0, 1, points)
+    return pd.DataFrame({'_time': times, '_value': values})
+
+def timed(fn, repeat=5):
+    """
+    Runs fn `repeat` times and returns the best wall time in milliseconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def bench_renderers(sizes=(100, 1000, 10000)):
+    """
+    Compares the Plotly/Kaleido and Pillow backends of create_graph_png.
+    """
+    from graph_utils import create_graph_png, png_cache
+
+    print(f"{'points':>8} {'chart':>8} {'plotly ms':>10} {'pillow ms':>10}")
+    for points in sizes:
+        df = synthetic_series(points)
+        for chart_type in ('line', 'bar', 'scatter'):
+            row = []
+            for backend in ('plotly', 'pillow'):
+                def render():
+                    png_cache.clear()
+                    create_graph_png(df, 'Benchmark', 'metric', df['_value'].iloc[-1],
+                                     chart_type=chart_type, show_trendline=True,
+                                     highlight_threshold=55, backend=backend)
+                row.append(timed(render, repeat=3 if backend == 'plotly' else 5))
+            print(f"{points:>8} {chart_type:>8} {row[0]:>10.1f} {row[1]:>10.1f}")
+
+def _legacy_prepare(data_frame, highlight_threshold):
+    # The per-point Python loops create_graph used before chart_data existed
+    data_frame = data_frame.copy()
+    data_frame['_time'] = pd.to_datetime(data_frame['_time'])
+    data_frame['_value'] = pd.to_numeric(data_frame['_value'], errors='coerce').fillna(0)
+    sizes = [10 if highlight_threshold and val > highlight_threshold else 6 for val in data_frame['_value']]
+    colors = ['#FF6347' if highlight_threshold and val > highlight_threshold else '#0048BA' for val in data_frame['_value']]
+    trend = data_frame['_value'].rolling(window=5).mean()
+    custom = np.stack((data_frame['_value'].cumsum(),), axis=-1)
+    has_event = pd.Timestamp('2024-04-15') in data_frame['_time'].values
+    return sizes, colors, trend, custom, has_event
+
+def bench_prepare(sizes=(1000, 10000, 100000)):
+    """
+    Per-render cost of preparing the styling arrays for create_graph.
+    """
+    from chart_data import prepare_series, point_styles, moving_average, event_positions
+
+    def vectorized(data_frame, highlight_threshold):
+        times, values = prepare_series(data_frame)
+        marker_sizes, marker_colors = point_styles(values, highlight_threshold)
+        return marker_sizes, marker_colors, moving_average(values), np.cumsum(values), \
+            event_positions(times, pd.Timestamp('2024-04-15'))
+
+    print(f"{'points':>8} {'legacy ms':>10} {'numpy ms':>10}")
+    for points in sizes:
+        df = synthetic_series(points)
+        legacy = timed(lambda: _legacy_prepare(df, 55))
+        current = timed(lambda: vectorized(df, 55))
+        print(f"{points:>8} {legacy:>10.2f} {current:>10.2f}")
+
+def bench_downsample(sizes=(1440, 10080, 43200), backend='pillow'):
+    """
+    Render time and PNG size for 1 day, 7 days and 30 days of 1-minute data.
+    """
+    from graph_utils import create_graph_png, png_cache
+
+    print(f"{'points':>8} {'method':>8} {'ms':>8} {'png KB':>8}")
+    for points in sizes:
+        df = synthetic_series(points)
+        for method in (None, 'lttb', 'minmax'):
+            result = {}
+
+            def render():
+                png_cache.clear()
+                result['png'] = create_graph_png(df, 'Benchmark', 'metric', df['_value'].iloc[-1],
+                                                 backend=backend, downsample=method)
+            elapsed = timed(render, repeat=3)
+            print(f"{points:>8} {str(method):>8} {elapsed:>8.1f} {len(result['png']) / 1024:>8.1f}")
+
+def recorded_updates(count, chats=50):
+    """
+    Returns `count` Telegram update payloads shaped like the ones the bot receives.
+    """
+    updates = []
+    for i in range(count):
+        chat = {'id': 1000 + i % chats, 'type': 'private', 'first_name': 'Bench'}
+        updates.append({
+            'update_id': i + 1,
+            'message': {
+                'message_id': i + 1, 'date': 1704067200 + i, 'chat': chat,
+                'from': {'id': chat['id'], 'is_bot': False, 'first_name': 'Bench'},
+                'text': '❓ Help',
+            },
+        })
+    return updates
+
+def bench_updates(count=5000, senders=8, rtts=(0.0, 0.05)):
+    """
+    Update ingestion throughput: getUpdates polling vs the webhook server.
+
+    Polling is simulated with a patched getUpdates that returns batches of 100
+    recorded updates after `rtt` seconds, the way TeleBot.polling consumes
+    them one request at a time. The webhook receives the same updates as POSTs
+    from `senders` concurrent local connections, like Telegram pushes them
+    with max_connections > 1, so network latency overlaps and is left out.
+    Handlers only count updates, so this measures ingestion, not handler work.
+    """
+    import http.client
+    import json
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from telebot import TeleBot, apihelper
+    from webhook import WebhookServer, SECRET_HEADER
+
+    payloads = recorded_updates(count)
+
+    def counting_bot():
+        bot = TeleBot('123456:benchmark', threaded=False)
+        done = threading.Event()
+        handled = []
+
+        @bot.message_handler(func=lambda message: True)
+        def count_update(message):
+            handled.append(message.message_id)
+            if len(handled) == count:
+                done.set()
+        return bot, done
+
+    def polling(rtt):
+        bot, done = counting_bot()
+        original = apihelper.get_updates
+
+        def get_updates(token, offset=None, *args, **kwargs):
+            time.sleep(rtt)
+            start = (offset or 1) - 1
+            return payloads[start:start + 100]
+        apihelper.get_updates = get_updates
+        try:
+            started = time.perf_counter()
+            offset = None
+            while not done.is_set():
+                updates = bot.get_updates(offset=offset, limit=100)
+                offset = updates[-1].update_id + 1
+                bot.process_new_updates(updates)
+            return time.perf_counter() - started
+        finally:
+            apihelper.get_updates = original
+
+    def webhook():
+        bot, done = counting_bot()
+        server = WebhookServer(bot, host='127.0.0.1', port=0, secret='benchmark')
+        server.start()
+        host, port = server.address
+        bodies = [json.dumps(update).encode() for update in payloads]
+
+        def send(chunk):
+            connection = http.client.HTTPConnection(host, port)
+            for body in chunk:
+                connection.request('POST', server.path, body, {SECRET_HEADER: 'benchmark', 'Content-Type': 'application/json'})
+                connection.getresponse().read()
+            connection.close()
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(senders) as pool:
+                list(pool.map(send, [bodies[i::senders] for i in range(senders)]))
+            done.wait()
+            return time.perf_counter() - started
+        finally:
+            server.stop()
+
+    print(f"{'path':>16} {'updates/s':>10} {'ms/update':>10}")
+    runs = [(f"polling {rtt * 1000:.0f}ms", lambda rtt=rtt: polling(rtt)) for rtt in rtts]
+    runs.append(('webhook', webhook))
+    for name, run in runs:
+        elapsed = run()
+        print(f"{name:>16} {count / elapsed:>10.0f} {elapsed / count * 1000:>10.3f}")
+
+def flux_csv(points, wide=True):
+    """
+    Returns an annotated Flux CSV response for a single series of `points` rows.
+
+    `wide` mimics a query without keep(): every Flux column comes back, as
+    fetch_data's query returned before it kept only '_time' and '_value'.
+    """
+    df = synthetic_series(points)
+    stamps = df['_time'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+    if wide:
+        start, stop = stamps.iloc[0], stamps.iloc[-1]
+        lines = [
+            '#datatype,string,long,dateTime:RFC3339,dateTime:RFC3339,dateTime:RFC3339,double,string,string',
+            '#group,false,false,true,true,false,false,true,true',
+            '#default,last,,,,,,,',
+            ',result,table,_start,_stop,_time,_value,_field,_measurement',
+        ]
+        lines += [f',,0,{start},{stop},{stamp},{value},rTT102Val,opcua' for stamp, value in zip(stamps, df['_value'])]
+    else:
+        lines = [
+            '#datatype,string,long,dateTime:RFC3339,double',
+            '#group,false,false,false,false',
+            '#default,last,,,',
+            ',result,table,_time,_value',
+        ]
+        lines += [f',,0,{stamp},{value}' for stamp, value in zip(stamps, df['_value'])]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+def bench_decode(sizes=(1000, 10000, 100000)):
+    """
+    Decoding a single-series response: the client's query_data_frame path vs flux_decoder.
+
+    Reports the best wall time and the peak memory traced while decoding.
+    """
+    import tracemalloc
+    import warnings
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.warnings import MissingPivotFunction
+    from data_handler import series_frame
+    from flux_decoder import decode_series_frame
+
+    warnings.simplefilter('ignore', MissingPivotFunction)
+    api = InfluxDBClient(url='http://localhost:8086', token='benchmark', org='benchmark').query_api()
+
+    class Response:
+        # What FluxCsvParser reads when the HTTP response was already consumed
+        closed = True
+
+        def __init__(self, data):
+            self.data = data
+
+        def close(self):
+            pass
+
+        def release_conn(self):
+            pass
+
+    def legacy(body):
+        return series_frame(api._to_data_frames(api._to_data_frame_stream(
+            data_frame_index=None, response=Response(body), query_options=api._get_query_options())))
+
+    def peak_mb(fn):
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak / 2**20
+
+    print(f"{'points':>8} {'path':>22} {'ms':>9} {'peak MB':>9}")
+    for points in sizes:
+        wide, narrow = flux_csv(points), flux_csv(points, wide=False)
+        runs = [
+            ('query_data_frame wide', lambda: legacy(wide)),
+            ('decoder wide', lambda: decode_series_frame(wide)),
+            ('decoder keep()', lambda: decode_series_frame(narrow)),
+        ]
+        for name, run in runs:
+            elapsed = timed(run, repeat=3)
+            print(f"{points:>8} {name:>22} {elapsed:>9.1f} {peak_mb(run):>9.1f}")
+
+def bench_delete(count=1000, rtt=0.05):
+    """
+    Deleting a chat of `count` messages against a local fake Bot API.
+
+    'sequential' is the old handler loop, one deleteMessage per id; 'pool' is
+    the MessageDeleter fallback for servers without deleteMessages; 'batch'
+    uses deleteMessages with 100 ids per call.
+    """
+    import os
+    import tempfile
+    from telebot import TeleBot, apihelper
+    from message_cleanup import MessageDeleter
+    from session_store import SessionStore
+    from tests.fake_bot_api import FakeBotApi
+
+    def run(name, batch):
+        api = FakeBotApi(rtt=0, batch=batch)
+        original = apihelper.API_URL
+        apihelper.API_URL = api.url
+        directory = tempfile.mkdtemp()
+        store = SessionStore(os.path.join(directory, 'sessions.sqlite3'))
+        try:
+            bot = TeleBot('123456:benchmark', threaded=False)
+            ids = [bot.send_message(1, 'x').message_id for _ in range(count)]
+            api.rtt = rtt
+            started = time.perf_counter()
+            if name == 'sequential':
+                for message_id in ids:
+                    bot.delete_message(1, message_id)
+            else:
+                MessageDeleter(bot, store=store, rate=1000, progress_interval=0.5).submit(1, ids).wait()
+            elapsed = time.perf_counter() - started
+            left = len(api.messages.get(1, ()))
+            calls = sum(n for method, n in api.calls.items() if method.startswith('delete'))
+            print(f"{name:>12} {elapsed:>9.2f} {calls:>7} {left:>6}")
+        finally:
+            apihelper.API_URL = original
+            store.close()
+            api.close()
+
+    print(f"{'path':>12} {'seconds':>9} {'calls':>7} {'left':>6}")
+    run('sequential', batch=False)
+    run('pool', batch=False)
+    run('batch', batch=True)
+
+BENCHMARKS = {
+    'renderers': bench_renderers,
+    'prepare': bench_prepare,
+    'downsample': bench_downsample,
+    'updates': bench_updates,
+    'decode': bench_decode,
+    'delete': bench_delete,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or list(BENCHMARKS):
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
@@ -0,0 +1,61 @@
+# chart_data.py
+
+import numpy as np
+import pandas as pd
+
+MARKER_COLOR = '#0048BA'
+HIGHLIGHT_COLOR = '#FF6347'
+MARKER_SIZE = 6
+HIGHLIGHT_SIZE = 10
+
+def prepare_series(data_frame):
+    """
+    Extracts the time axis and numeric values of a '_time'/'_value' DataFrame.
+
+    The DataFrame is never modified; non-numeric values become 0 like in the
+    original graph code.
+
+    Returns:
+    - tuple: (pd.DatetimeIndex of times, np.ndarray of float64 values)
+    """
+    times = pd.DatetimeIndex(pd.to_datetime(data_frame['_time']))
+    values = pd.to_numeric(data_frame['_value'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    values = np.where(np.isnan(values), 0.0, values)
+    return times, values
+
+def highlight_mask(values, highlight_threshold):
+    """
+    Returns a boolean array marking the values above the threshold.
+    """
+    if not highlight_threshold:
+        return np.zeros(len(values), dtype=bool)
+    return values > highlight_threshold
+
+def point_styles(values, highlight_threshold):
+    """
+    Returns per-point marker sizes and colors, highlighting values above the threshold.
+    """
+    mask = highlight_mask(values, highlight_threshold)
+    sizes = np.where(mask, HIGHLIGHT_SIZE, MARKER_SIZE)
+    colors = np.where(mask, HIGHLIGHT_COLOR, MARKER_COLOR)
+    return sizes, colors
+
+def moving_average(values, window=5):
+    """
+    Trailing moving average; the first window - 1 points are NaN, like pandas' rolling().mean().
+    """
+    trend = np.full(len(values), np.nan)
+    if len(values) >= window:
+        trend[window - 1:] = np.convolve(values, np.ones(window) / window, mode='valid')
+    return trend
+
+def event_positions(times, event_time):
+    """
+    Returns the indices of the points recorded exactly at `event_time`.
+    """
+    event = pd.Timestamp(event_time)
+    if times.tz is not None and event.tz is None:
+        event = event.tz_localize('UTC')
+    elif times.tz is None and event.tz is not None:
+        event = event.tz_convert('UTC').tz_localize(None)
+    return np.flatnonzero(times.asi8 == event.value)
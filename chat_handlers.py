@@ -0,0 +1,441 @@
+# chat_handlers.py
+#
+# What the bot does for each update, shared by both runtimes.
+#
+# Every handler is a generator: it does its own work (InfluxDB queries through
+# the pool, graph rendering, session store reads and writes) and yields a Call
+# for each Bot API request, receiving the request's result back. bot_handlers
+# runs them on a TeleBot with run(); async_runtime runs the work between two
+# requests on a thread and awaits the requests on an AsyncTeleBot.
+
+import functools
+from telebot import apihelper, asyncio_helper
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+from config import PASSWORD, INITIAL_IMAGE_PATH, GRAPH_BACKEND, KEYBOARD_PAGE_SIZE
+from data_handler import fetch_data, fetch_latest, fetch_aligned
+from graph_utils import create_graph_png, graph_cache_key, cached_file_id, remember_file_id
+from report_generator import get_daily_report
+from metric_registry import registry
+from keyboards import category_keyboard, search_keyboard, is_page, is_compare, decode_page, decode_metric
+from comparison import comparison_selection, parse_compare_command, comparison_graph, COMPARE_USAGE
+from alerts import alert_engine, parse_alert_command, describe_rule, DEFAULT_RULES
+from session_store import session_store
+from media_cache import media_cache, asset_key, read_file, qr_png, is_stale_file_id
+
+# Raised by TeleBot and AsyncTeleBot respectively for an error answer from Telegram
+API_ERRORS = (apihelper.ApiTelegramException, asyncio_helper.ApiTelegramException)
+
+CATEGORY_MAPPING = {
+    '🔧 Modbus': 'modbus',
+    '📊 OPCUA': 'opcua',
+    '🌐 API Request': 'api_request'
+}
+
+class Call:
+    """
+    A Bot API request yielded by a handler: the bot method `method`, called with `args` and `kwargs`.
+    """
+
+    def __init__(self, method, *args, **kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+
+def step(steps, result=None, error=None):
+    """
+    Resumes a handler with the outcome of its last request and runs it up to the next one.
+
+    Parameters:
+    - steps (generator): The running handler.
+    - result: What the last request returned.
+    - error (Exception): What the last request raised instead; it is raised inside the handler.
+
+    Returns:
+    - Call: The next request, or None once the handler is done.
+    """
+    try:
+        return steps.throw(error) if error is not None else steps.send(result)
+    except StopIteration:
+        return None
+
+def run(bot, steps):
+    """
+    Runs a handler to the end on a TeleBot, making each request it yields.
+    """
+    call = step(steps)
+    while call is not None:
+        try:
+            result = getattr(bot, call.method)(*call.args, **call.kwargs)
+        except Exception as e:
+            call = step(steps, error=e)
+        else:
+            call = step(steps, result)
+
+def register(bot, light, heavy, deleter):
+    """
+    Registers every handler on a TeleBot or an AsyncTeleBot.
+
+    Parameters:
+    - bot: The bot receiving the updates.
+    - light (callable): Turns a cheap handler into a handler function for `bot`.
+    - heavy (callable): The same for handlers that query InfluxDB, render graphs or build reports.
+    - deleter (MessageDeleter): Deletes the chats for handle_delete_chat.
+    """
+    delete_chat = functools.update_wrapper(functools.partial(handle_delete_chat, deleter=deleter),
+                                           handle_delete_chat)
+    bot.message_handler(commands=['start'])(light(handle_start))
+    bot.message_handler(func=lambda message: message.text and not session_store.is_authorized(message.chat.id))(light(handle_password))
+    bot.message_handler(func=lambda message: message.text in CATEGORY_MAPPING)(light(handle_category))
+    bot.callback_query_handler(func=lambda call: is_page(call.data))(light(handle_page))
+    bot.callback_query_handler(func=lambda call: is_compare(call.data))(light(handle_compare_pick))
+    bot.message_handler(commands=['compare'])(heavy(handle_compare))
+    bot.message_handler(commands=['find'])(light(handle_find))
+    bot.callback_query_handler(func=lambda call: True)(heavy(handle_query))
+    bot.message_handler(func=lambda message: message.text == '🔔 Monitor Variable')(light(handle_monitor_toggle))
+    bot.message_handler(commands=['alert'])(light(handle_alert))
+    bot.message_handler(func=lambda message: message.text == '📝 Daily Report')(heavy(handle_daily_report))
+    bot.message_handler(func=lambda message: message.text == '❓ Help')(light(handle_help))
+    bot.message_handler(func=lambda message: message.text == '🗑️ Delete Chat')(heavy(delete_chat))
+    bot.message_handler(func=lambda message: message.text == '🔗 Share Chat')(light(handle_share_chat))
+
+def send_cached_photo(chat_id, key, load, **kwargs):
+    """
+    Sends a photo by file_id if media_cache holds one for `key`, otherwise uploads `load()`.
+
+    A file_id Telegram no longer accepts is dropped and the photo uploaded again.
+
+    Returns:
+    - Message: The sent message.
+    """
+    file_id = media_cache.file_id(key)
+    if file_id is not None:
+        try:
+            return (yield Call('send_photo', chat_id, photo=file_id, **kwargs))
+        except API_ERRORS as e:
+            if not is_stale_file_id(e):
+                raise
+            media_cache.forget(key)
+    sent = yield Call('send_photo', chat_id, photo=load(), **kwargs)
+    media_cache.remember(key, sent)
+    return sent
+
+def send_asset(chat_id, path, **kwargs):
+    """
+    Sends an image file from disk, uploading it only the first time.
+    """
+    return (yield from send_cached_photo(chat_id, asset_key(path), lambda: read_file(path), **kwargs))
+
+def send_graph(chat_id, df, title, metric, current_value, caption, additional_metrics=None):
+    """
+    Sends a graph, reusing the Telegram file_id if the same image was already uploaded.
+    """
+    key = graph_cache_key(df, title, metric, current_value, additional_metrics=additional_metrics,
+                          backend=GRAPH_BACKEND)
+    file_id = cached_file_id(key)
+    if file_id is not None:
+        yield Call('send_photo', chat_id, photo=file_id, caption=caption)
+        return
+    png = create_graph_png(df, title, metric, current_value, additional_metrics=additional_metrics,
+                           backend=GRAPH_BACKEND, cache_key=key)
+    sent = yield Call('send_photo', chat_id, photo=png, caption=caption)
+    if sent.photo:
+        remember_file_id(key, sent.photo[-1].file_id)
+
+def toggle_monitoring_for_user(user_id):
+    """
+    Toggles the monitoring state for a given user ID.
+
+    Enabling it subscribes the user to the default alert rules; disabling it
+    removes every alert of the user.
+    """
+    is_enabled = session_store.toggle_monitoring(user_id)
+    if is_enabled:
+        for rule in DEFAULT_RULES:
+            alert_engine.subscribe(user_id, rule)
+    else:
+        alert_engine.unsubscribe(user_id)
+        session_store.remove_alerts(user_id)
+    return is_enabled
+
+def handle_start(message):
+    """
+    Handles the '/start' command, prompting the user to authenticate with a password.
+    """
+    session_store.revoke(message.chat.id)
+
+    markup = InlineKeyboardMarkup()
+    markup.add(InlineKeyboardButton("Access smact.cc", url="https://smact.cc"))
+
+    yield Call('send_message', message.chat.id, "https://smact.cc", reply_markup=markup)
+
+    yield Call('send_chat_action', message.chat.id, 'upload_photo')
+    yield from send_asset(message.chat.id, INITIAL_IMAGE_PATH,
+                          caption="🎉 Welcome! Please enter the password to access the bot's features:")
+
+def handle_password(message):
+    """
+    Handles user input for password authentication.
+    """
+    if message.text == PASSWORD:
+        session_store.authorize(message.chat.id)
+        yield from send_welcome(message)
+    else:
+        yield Call('send_message', message.chat.id, "🚫 Incorrect password. Please try again.")
+
+def send_welcome(message):
+    """
+    Sends a welcome message along with a keyboard of options if the user is authenticated.
+    """
+    markup = ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
+    markup.add(
+        KeyboardButton('🔧 Modbus'),
+        KeyboardButton('📊 OPCUA'),
+        KeyboardButton('🌐 API Request'),
+        KeyboardButton('📝 Daily Report'),
+        KeyboardButton('🔔 Monitor Variable'),
+        KeyboardButton('❓ Help'),
+        KeyboardButton('🗑️ Delete Chat'),
+        KeyboardButton('🔗 Share Chat')
+    )
+    yield from send_asset(message.chat.id, INITIAL_IMAGE_PATH,
+                          caption="✅ Access granted! Choose a category or option:", reply_markup=markup)
+
+def handle_category(message):
+    """
+    Presents the user with metric options for the selected category.
+    """
+    category = CATEGORY_MAPPING.get(message.text)
+    if category:
+        yield Call('send_message', message.chat.id, "📋 Select a metric to view:",
+                   reply_markup=category_keyboard(category))
+
+def handle_page(call):
+    """
+    Replaces a metric keyboard with another page of the same category.
+    """
+    page = decode_page(call.data)
+    if page is not None:
+        category, number = page
+        yield Call('edit_message_reply_markup', call.message.chat.id, call.message.message_id,
+                   reply_markup=category_keyboard(category, number))
+    yield Call('answer_callback_query', call.id)
+
+def handle_compare_pick(call):
+    """
+    Adds a metric to the chat's comparison, or removes it if it was already picked.
+    """
+    try:
+        selected = decode_metric(call.data)
+        if selected is None:
+            yield Call('answer_callback_query', call.id, "⚠️ Unexpected data format received. Please try again.")
+            return
+        category, metric, _ = selected
+        added, count = comparison_selection.toggle(call.message.chat.id, (category, metric))
+    except ValueError as e:
+        yield Call('answer_callback_query', call.id, str(e), show_alert=True)
+        return
+    if added:
+        text = f"➕ {metric} added to the comparison ({count} selected)."
+    else:
+        text = f"➖ {metric} removed from the comparison ({count} selected)."
+    if count >= 2:
+        text += " Send /compare to draw it."
+    yield Call('answer_callback_query', call.id, text)
+
+def handle_compare(message):
+    """
+    Draws the metrics picked with ➕ (Compare) on one graph: /compare [period], or /compare clear.
+    """
+    chat_id = message.chat.id
+    try:
+        period = parse_compare_command(message.text)
+    except ValueError as e:
+        yield Call('send_message', chat_id, str(e))
+        return
+    if period is None:
+        comparison_selection.clear(chat_id)
+        yield Call('send_message', chat_id, "🧹 Comparison cleared.")
+        return
+    keys = comparison_selection.get(chat_id)
+    if len(keys) < 2:
+        yield Call('send_message', chat_id, COMPARE_USAGE)
+        return
+    try:
+        comparison = comparison_graph(fetch_aligned(keys, period), period)
+        if comparison is None:
+            yield Call('send_message', chat_id, "❌ No data available for the selected metrics.")
+            return
+        graph, caption = comparison
+        yield from send_graph(chat_id, graph['data_frame'], graph['title'], graph['metric_name'],
+                              graph['current_value'], caption=caption,
+                              additional_metrics=graph['additional_metrics'])
+    except Exception as e:
+        yield Call('send_message', chat_id, f"⚠️ An error occurred: {str(e)}")
+
+def handle_find(message):
+    """
+    Lists the metrics whose name starts with the text after '/find'.
+    """
+    prefix = message.text.partition(' ')[2].strip()
+    if not prefix:
+        yield Call('send_message', message.chat.id, "🔎 Usage: /find <start of the metric name>")
+        return
+    matches = registry.search(prefix, limit=KEYBOARD_PAGE_SIZE + 1)
+    if not matches:
+        yield Call('send_message', message.chat.id, f"❌ No metric starts with {prefix}.")
+        return
+    text = "📋 Select a metric to view:"
+    if len(matches) > KEYBOARD_PAGE_SIZE:
+        matches = matches[:KEYBOARD_PAGE_SIZE]
+        text = f"📋 First {KEYBOARD_PAGE_SIZE} matches; type more of the name to narrow them down:"
+    yield Call('send_message', message.chat.id, text, reply_markup=search_keyboard(matches))
+
+def handle_query(call):
+    """
+    Handles inline query selections and presents the user with the most recent data point.
+    """
+    chat_id = call.message.chat.id
+    try:
+        selected = decode_metric(call.data)
+        if selected is None:
+            yield Call('send_message', chat_id, "⚠️ Unexpected data format received. Please try again.")
+            return
+
+        category, metric, view_type = selected
+        # The data view only shows one point; no need to pull the whole hour
+        df = fetch_latest(category, metric) if view_type == 'data' else fetch_data(category, metric)
+        if df.empty:
+            yield Call('send_message', chat_id, f"❌ No data available for {metric}.")
+            return
+
+        # Fetch the most recent data point
+        latest_data = df.iloc[-1]  # The last row, assuming the dataframe is time-sorted
+        timestamp = latest_data['_time']
+        current_value = latest_data['_value']
+        data_text = f"📊 Latest {metric} Data:\nTimestamp: {timestamp}\nValue: {current_value}"
+
+        if view_type == 'graph':
+            yield from send_graph(chat_id, df, f"{metric} Graph", metric, current_value,
+                                  caption=f"📈 {metric} Graph\nCurrent Value: {current_value}\nTimestamp: {timestamp}")
+
+        elif view_type == 'data':
+            # Send only the latest data point
+            yield Call('send_message', chat_id, data_text)
+
+        elif view_type == 'data_graph':
+            yield from send_graph(chat_id, df, f"{metric} Data & Graph", metric, current_value,
+                                  caption=f"📚 {metric} Data & Graph\nCurrent Value: {current_value}\nTimestamp: {timestamp}")
+            yield Call('send_message', chat_id, data_text)
+
+        else:
+            yield Call('send_message', chat_id, f"❓ Unknown view type: {view_type}")
+    except Exception as e:
+        yield Call('send_message', chat_id, f"⚠️ An error occurred: {str(e)}")
+
+def handle_monitor_toggle(message):
+    """
+    Toggles monitoring for the user and sends confirmation.
+    """
+    user_id = message.chat.id
+    is_enabled = toggle_monitoring_for_user(user_id)
+    status_message = "enabled" if is_enabled else "disabled"
+    yield Call('send_message', user_id, f"🔔 Monitoring has been {status_message}.")
+
+def handle_alert(message):
+    """
+    Adds an alert rule for the user: /alert <category> <metric> <kind> [level] [hysteresis] [delay].
+    """
+    try:
+        rule = parse_alert_command(message.text)
+    except ValueError as e:
+        yield Call('send_message', message.chat.id, str(e))
+        return
+    alert_engine.subscribe(message.chat.id, rule)
+    session_store.add_alert(message.chat.id, rule)
+    yield Call('send_message', message.chat.id, f"🔔 Alert added: {describe_rule(rule)}")
+
+def handle_daily_report(message):
+    """
+    Generates and sends the daily report to the user.
+    """
+    try:
+        report, pdf, filename = get_daily_report()
+    except Exception as e:
+        yield Call('send_message', message.chat.id, f"⚠️ An error occurred while generating the daily report: {e}")
+        return
+    yield Call('send_message', message.chat.id, report)
+    yield Call('send_document', message.chat.id, pdf, caption="📊 Ecco il report giornaliero.",
+               visible_file_name=filename)
+
+def handle_help(message):
+    """
+    Displays help information for the user.
+    """
+    help_text = """
+    Available Commands:
+
+    - /start - Start the bot and request the password.
+    - 🔧 Modbus - View available metrics in Modbus.
+    - 📊 OPCUA - View available metrics in OPCUA.
+    - 🌐 API Request - View available metrics in API requests.
+    - /find <name> - Find metrics whose name starts with <name>.
+    - /compare [period] - Draw the metrics picked with ➕ (Compare) on one graph, e.g. /compare 24h.
+    - 📝 Daily Report - Receive a daily report with statistics.
+    - 🔔 Monitor Variable - Toggle alerts for variable updates.
+    - /alert <category> <metric> <kind> [level] - Add an alert (above, below, rate, stuck, bits or change).
+    - 🗑️ Delete Chat - Delete the current chat.
+    - 🔗 Share Chat - Get an invite link to share the chat.
+    - ❓ Help - Show this help message.
+
+    Note: Some features may still be under development.
+    """
+    yield Call('send_message', message.chat.id, help_text, parse_mode='Markdown')
+
+def handle_delete_chat(message, deleter):
+    """
+    Deletes all messages in the current chat.
+
+    The deletion runs in the background on `deleter`; a status message,
+    edited through the deleter's own bot, shows its progress and the result.
+    """
+    chat_id = message.chat.id
+    if deleter.running(chat_id) is not None:
+        yield Call('send_message', chat_id, "🗑️ The chat is already being deleted.")
+        return
+    message_ids = session_store.chat_messages(chat_id)
+    if message.message_id not in message_ids:
+        message_ids.append(message.message_id)
+    status = yield Call('send_message', chat_id, f"🗑️ Deleting {len(message_ids)} messages...")
+
+    def progress(job):
+        deleter.bot.edit_message_text(f"🗑️ Deleting messages... {job.processed}/{job.total}",
+                                      chat_id, status.message_id)
+
+    def done(job):
+        session_store.revoke(chat_id)
+        if job.error is not None:
+            text = f"⚠️ An error occurred while deleting the chat: {job.error}"
+        else:
+            text = f"🗑️ Deletion complete: {job.summary()}. Please restart the bot with /start."
+        deleter.bot.edit_message_text(text, chat_id, status.message_id)
+
+    deleter.submit(chat_id, message_ids, progress, done)
+
+def handle_share_chat(message):
+    """
+    Sends a QR code and link for sharing the bot chat.
+    """
+    link = yield from invite_link()
+    yield from send_cached_photo(message.chat.id, f"qr:{link}", lambda: qr_png(link),
+                                 caption=f"📲 Scan this QR code or share this link to invite others to chat with me: {link}")
+
+_username = None
+
+def invite_link():
+    """
+    Returns the t.me link of the bot; getMe is only called the first time.
+    """
+    global _username
+    if _username is None:
+        _username = (yield Call('get_me')).username
+    return f"https://t.me/{_username}"
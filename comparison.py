@@ -0,0 +1,113 @@
+# comparison.py
+#
+# Comparison graphs: a chat picks metrics with the ➕ (Compare) buttons of the
+# metric keyboards, then /compare draws them on one chart, aligned on a
+# shared time index (see data_handler.fetch_aligned).
+
+import threading
+from config import COMPARE_MAX_SERIES, COMPARE_DEFAULT_PERIOD
+from query_builder import parse_duration
+
+COMPARE_USAGE = ("📉 Usage: tap ➕ (Compare) on two or more metrics, then send /compare [period], "
+                 "e.g. /compare 24h. /compare clear empties the selection.")
+
+class ComparisonSelection:
+    """
+    The metrics each chat picked for a comparison, in the order they were picked.
+
+    Selections are only kept in memory; at most `limit` metrics per chat.
+    """
+
+    def __init__(self, limit=COMPARE_MAX_SERIES):
+        self.limit = limit
+        self._selected = {}
+        self._lock = threading.Lock()
+
+    def toggle(self, chat_id, key):
+        """
+        Adds a (category, metric) to a chat's selection, or removes it if it was there.
+
+        Returns:
+        - tuple: (True if it was added, how many metrics are selected now).
+
+        Raises:
+        - ValueError: If the selection is full.
+        """
+        with self._lock:
+            selected = self._selected.get(chat_id, ())
+            if key in selected:
+                selected = tuple(other for other in selected if other != key)
+                added = False
+            elif len(selected) >= self.limit:
+                raise ValueError(f"⚠️ A comparison holds at most {self.limit} metrics. "
+                                 "Send /compare clear to start over.")
+            else:
+                selected = selected + (key,)
+                added = True
+            if selected:
+                self._selected[chat_id] = selected
+            else:
+                self._selected.pop(chat_id, None)
+            return added, len(selected)
+
+    def get(self, chat_id):
+        with self._lock:
+            return self._selected.get(chat_id, ())
+
+    def clear(self, chat_id):
+        with self._lock:
+            self._selected.pop(chat_id, None)
+
+def parse_compare_command(text):
+    """
+    Returns the Flux range of a '/compare [period]' message, or None for '/compare clear'.
+
+    Raises:
+    - ValueError: With COMPARE_USAGE if the period is not a duration like '24h'.
+    """
+    args = text.split()[1:]
+    if not args:
+        return COMPARE_DEFAULT_PERIOD
+    if len(args) > 1:
+        raise ValueError(COMPARE_USAGE)
+    if args[0].lower() == 'clear':
+        return None
+    try:
+        seconds = parse_duration(args[0])
+    except ValueError:
+        raise ValueError(COMPARE_USAGE) from None
+    if seconds <= 0:
+        raise ValueError(COMPARE_USAGE)
+    return f"-{args[0].lstrip('-')}"
+
+def comparison_graph(aligned, period):
+    """
+    Turns fetch_aligned() frames into create_graph_png arguments and a caption.
+
+    The first series with data is the main one and the others are drawn as
+    additional_metrics.
+
+    Returns:
+    - tuple or None: (kwargs for create_graph_png, caption), or None if no series has data.
+    """
+    series = [(metric, df) for (_, metric), df in aligned.items() if not df.empty]
+    if not series:
+        return None
+    (metric, df), others = series[0], series[1:]
+    current_value = df['_value'].iloc[-1]
+    names = ", ".join(name for name, _ in series)
+    graph = {
+        'data_frame': df,
+        'title': f"{names} ({period.lstrip('-')})",
+        'metric_name': metric,
+        'current_value': current_value,
+        'additional_metrics': [(other, name) for name, other in others],
+    }
+    lines = [f"{name}: {other['_value'].iloc[-1]}" for name, other in series]
+    missing = [metric for (_, metric), df in aligned.items() if df.empty]
+    if missing:
+        lines.append(f"No data: {', '.join(missing)}")
+    caption = f"📉 Comparison over the last {period.lstrip('-')}\n" + "\n".join(lines)
+    return graph, caption
+
+comparison_selection = ComparisonSelection()
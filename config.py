@@ -10,3 +10,136 @@ PASSWORD = 'p'
 INITIAL_IMAGE_PATH = "C:/Users/erikm/Desktop/smactbot/1329e4_b13705b80afb49179f0f40f50575f4df~mv2.png"
 BACKGROUND_IMAGE_PATH = "C:/Users/erikm/Desktop/smactbot/1329e4_b13705b80afb49179f0f40f50575f4df~mv2.png"
 ICON_PATH = "C:/Users/erikm/Desktop/smactbot/1329e4_b13705b80afb49179f0f40f50575f4df~mv2.png"
+
+# Query result cache (see query_cache.py)
+QUERY_CACHE_MAX_ENTRIES = 512
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Change monitor (see monitoring.py)
+MONITORED_VARIABLES = [
+    ('opcua', 'udiRiempitrice1Cnt'),
+]
+MONITOR_INTERVAL = 5
+# Incremental reads never go back further than this, however old a series' cursor is
+SINCE_MAX_LOOKBACK = '-6h'
+
+# Chat sessions and alert subscriptions, kept across restarts (see session_store.py)
+SESSION_DB_PATH = 'sessions.sqlite3'
+# Changes are written in one batch at most this often, in seconds
+SESSION_FLUSH_INTERVAL = 1
+# Message ids are kept this long, in seconds, for 🗑️ Delete Chat; bots cannot delete older messages
+MESSAGE_LOG_MAX_AGE = 48 * 3600
+
+# Chat deletion jobs (see message_cleanup.py)
+DELETE_BATCH_SIZE = 100
+# Fallback when deleteMessages is not available: single deletes on this many threads, at most DELETE_RATE per second
+DELETE_WORKERS = 8
+DELETE_RATE = 30
+# Seconds between progress updates of a running deletion
+DELETE_PROGRESS_INTERVAL = 2
+# Bot API endpoint, e.g. 'http://127.0.0.1:8081/bot{0}/{1}' for a local Bot API server; None for api.telegram.org
+TELEGRAM_API_URL = None
+
+# Alert rules a chat subscribes to with '🔔 Monitor Variable' (see alerts.py).
+# kind: 'above'/'below' (level), 'rate' (level per minute), 'stuck' (level in seconds),
+# 'bits' (alarm word, optional bits mask) or 'change'; hysteresis and delay (seconds) are optional, e.g.
+#   {'category': 'opcua', 'metric': 'rTT102Val', 'kind': 'above', 'level': 90, 'hysteresis': 2, 'delay': 60},
+ALERT_RULES = [
+    {'category': 'opcua', 'metric': 'udiRiempitrice1Cnt', 'kind': 'change'},
+    {'category': 'modbus', 'metric': 'allarmi_ibt_129', 'kind': 'bits'},
+]
+
+# Outbound message dispatcher (see notifier.py)
+NOTIFY_WORKERS = 4
+NOTIFY_QUEUE_SIZE = 1000
+NOTIFY_GLOBAL_RATE = 25
+NOTIFY_CHAT_RATE = 1
+NOTIFY_CHAT_BURST = 3
+NOTIFY_MAX_RETRIES = 5
+# Rate buckets of chats with nothing queued are dropped at most this often (seconds)
+NOTIFY_BUCKET_SWEEP = 60
+
+# Rendered graph cache (see graph_utils.py)
+GRAPH_CACHE_MAX_BYTES = 64 * 1024 * 1024
+GRAPH_CACHE_TTL = 3600
+GRAPH_FILE_ID_CACHE_SIZE = 4096
+# 'plotly' for the full Plotly/Kaleido chart, 'pillow' for the fast static renderer
+GRAPH_BACKEND = 'plotly'
+# Longer series are downsampled ('lttb', 'minmax' or None) to about this many points
+GRAPH_MAX_POINTS = 1000
+GRAPH_DOWNSAMPLE = 'minmax'
+
+# Kaleido renderer pool (see renderer.py)
+RENDER_WORKERS = 2
+RENDER_TIMEOUT = 30
+
+# Handler worker pool (see executor.py)
+HANDLER_WORKERS = 8
+HANDLER_QUEUE_SIZE = 500
+
+# How updates reach the bot: 'polling' (getUpdates) or 'webhook' (see webhook.py)
+UPDATE_MODE = 'polling'
+# Public HTTPS URL Telegram pushes updates to; it must route to WEBHOOK_HOST:WEBHOOK_PORT + WEBHOOK_PATH
+WEBHOOK_URL = ''
+WEBHOOK_HOST = '0.0.0.0'
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = '/telegram/webhook'
+# Required in webhook mode: Telegram sends it with every update and others cannot guess it
+WEBHOOK_SECRET = ''
+WEBHOOK_QUEUE_SIZE = 5000
+WEBHOOK_BATCH_SIZE = 100
+WEBHOOK_BATCH_WAIT = 0.01
+# Larger request bodies are refused with 413; updates are a few KB
+WEBHOOK_MAX_BODY = 1024 * 1024
+
+# Daily report cache (see report_generator.py)
+REPORT_CACHE_TTL = 60
+
+# Precomputed report snapshots (see report_scheduler.py and report_store.py)
+REPORT_DB_PATH = 'reports.sqlite3'
+REPORT_SNAPSHOTS_KEPT = 96
+REPORT_REFRESH_INTERVAL = 900
+# Time of day ("HH:MM", local time) of the end-of-day snapshot
+REPORT_DAILY_CUTOFF = '00:00'
+# Older snapshots are not served; the report is then built on demand
+REPORT_SNAPSHOT_MAX_AGE = 1800
+
+# Local store of recent raw points (see series_store.py)
+SERIES_STORE_CAPACITY = 43200
+# Directory for memory-mapped buffers that survive restarts; None keeps them in memory only
+SERIES_STORE_DIR = None
+SERIES_STORE_BACKFILL = '-6h'
+SERIES_STORE_POLL_INTERVAL = 5
+# The store stops answering if its last poll is older than this, in seconds
+SERIES_STORE_MAX_LAG = 30
+
+# InfluxDB client (see influx_pool.py); timeouts in seconds
+INFLUXDB_POOL_SIZE = 8
+INFLUXDB_CONNECT_TIMEOUT = 3
+INFLUXDB_QUERY_TIMEOUT = 20
+INFLUXDB_MAX_RETRIES = 3
+INFLUXDB_BACKOFF_BASE = 0.2
+INFLUXDB_BACKOFF_MAX = 5
+# Consecutive failures that open the circuit, and how long it stays open
+INFLUXDB_BREAKER_THRESHOLD = 5
+INFLUXDB_BREAKER_RESET = 30
+# Total time the queries of one slow handler may take
+HANDLER_QUERY_DEADLINE = 25
+
+# Metric registry (see metric_registry.py)
+# Optional JSON file {"category": ["metric", ...]} of metrics offered besides the discovered ones
+METRIC_REGISTRY_FILE = None
+# Known metrics and their callback ids, kept across restarts
+METRIC_REGISTRY_CACHE = 'metrics.json'
+# Seconds between discovery runs over METRIC_DISCOVERY_RANGE; 0 disables discovery
+METRIC_DISCOVERY_INTERVAL = 3600
+METRIC_DISCOVERY_RANGE = '-30d'
+# Metrics per page of the inline keyboards
+KEYBOARD_PAGE_SIZE = 8
+
+# Comparison graphs (see comparison.py)
+# Most series one /compare graph overlays, and the range drawn when /compare names none
+COMPARE_MAX_SERIES = 6
+COMPARE_DEFAULT_PERIOD = '-1h'
+# A compared series carries its last value over at most this many missing windows
+COMPARE_FILL_WINDOWS = 2
@@ -1,35 +1,373 @@
-# data_handler.py
-
-import pandas as pd
-from influxdb_client import InfluxDBClient
-from config import INFLUXDB_URL, INFLUXDB_TOKEN, INFLUXDB_ORG, INFLUXDB_BUCKET
-
-client = InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG)
-query_api = client.query_api()
-
-def fetch_data(category, metric, period='-1h'):
-    if category == 'api_request':
-        query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-          |> range(start: {period})
-          |> filter(fn: (r) => r["_measurement"] == "api_request")
-          |> filter(fn: (r) => r["_field"] == "response_body")
-          |> filter(fn: (r) => r["device_id"] == "{metric}")
-          |> aggregateWindow(every: 1m, fn: last, createEmpty: false)
-          |> yield(name: "last")
-        '''
-    else:
-        query = f'''
-        from(bucket: "{INFLUXDB_BUCKET}")
-          |> range(start: {period})
-          |> filter(fn: (r) => r["_measurement"] == "{category}")
-          |> filter(fn: (r) => r["_field"] == "{metric}")
-          |> aggregateWindow(every: 1m, fn: last, createEmpty: false)
-          |> yield(name: "last")
-        '''
-    df = query_api.query_data_frame(query)
-    if df.empty or '_value' not in df.columns:
-        return pd.DataFrame(columns=['_time', '_value'])
-    df['_value'] = pd.to_numeric(df['_value'], errors='coerce')
-    df = df.dropna(subset=['_value'])
-    return df[['_time', '_value']]
+# data_handler.py
+
+import time
+import pandas as pd
+from config import (QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_MAX_BYTES, GRAPH_MAX_POINTS, SINCE_MAX_LOOKBACK,
+                    COMPARE_FILL_WINDOWS)
+from influx_pool import InfluxPool
+from query_builder import parse_duration, series_query, last_query, bulk_query, since_query, stats_query, selection, names_query
+from query_cache import QueryCache
+from series_store import SeriesStore
+
+# Pooled client with timeouts, retries and a circuit breaker (see influx_pool.py)
+influx = InfluxPool()
+
+def _result_size(result):
+    if isinstance(result, dict):
+        return sum(_result_size(value) for value in result.values())
+    return int(result.memory_usage(deep=True).sum())
+
+query_cache = QueryCache(
+    max_entries=QUERY_CACHE_MAX_ENTRIES,
+    max_bytes=QUERY_CACHE_MAX_BYTES,
+    sizeof=_result_size,
+)
+
+# Recent raw points of the series tracked by a SeriesPoller (see main.py)
+series_store = SeriesStore()
+
+# Aggregation windows fetch_data may pick, finest first; 1m is the native resolution
+_WINDOWS = ['1m', '2m', '5m', '10m', '15m', '30m', '1h', '2h', '3h', '6h', '12h', '1d']
+
+def choose_window(period, target_points=2 * GRAPH_MAX_POINTS):
+    """
+    Picks the finest aggregation window that keeps `period` under `target_points` points.
+
+    The default target leaves the graph downsampler twice the points it will
+    draw, so spikes inside a window still have a chance to be kept.
+    """
+    seconds = parse_duration(period)
+    for window in _WINDOWS:
+        if seconds / parse_duration(window) <= target_points:
+            return window
+    return _WINDOWS[-1]
+
+def series_frame(df):
+    """
+    Reduces a series_query result to its '_time' and numeric '_value' columns.
+    """
+    if isinstance(df, list):
+        df = pd.concat(df, ignore_index=True)
+    if df.empty or '_value' not in df.columns:
+        return pd.DataFrame(columns=['_time', '_value'])
+    df['_value'] = pd.to_numeric(df['_value'], errors='coerce')
+    df = df.dropna(subset=['_value'])
+    return df[['_time', '_value']]
+
+def _query_series(category, metric, period, window):
+    # Decoded straight into the two columns, without the client's wide DataFrame
+    query, params = series_query(category, metric, period, window)
+    return influx.query_series(query, params=params)
+
+def split_frames(df, keys=None):
+    """
+    Splits a multi-series result into one '_time'/'_value' frame per (category, metric).
+
+    With `keys`, series that were matched but not asked for are dropped.
+    """
+    if isinstance(df, list):
+        df = pd.concat(df, ignore_index=True)
+    frames = {}
+    if df.empty or '_value' not in df.columns:
+        return frames
+    for (category, metric), group in df.groupby(['_measurement', 'metric'], sort=False):
+        if keys is not None and (category, metric) not in keys:
+            continue
+        values = pd.to_numeric(group['_value'], errors='coerce')
+        frame = pd.DataFrame({'_time': group['_time'], '_value': values}).dropna(subset=['_value'])
+        frames[(category, metric)] = frame.sort_values('_time').reset_index(drop=True)
+    return frames
+
+def _selection_key(metrics_by_category):
+    return tuple(sorted(
+        (category, tuple(metrics) if metrics is not None else None)
+        for category, metrics in metrics_by_category.items()
+    ))
+
+def _query_bulk(metrics_by_category, period, window):
+    query, params = bulk_query(metrics_by_category, period, window)
+    return split_frames(influx.query_data_frame(query, params=params), set(selection(metrics_by_category)))
+
+def fetch_data_bulk(metrics_by_category, period='-1h', window='1m', use_cache=True):
+    """
+    Fetches many metrics with a single Flux query.
+
+    Parameters:
+    - metrics_by_category (dict): Maps a category to the list of metrics to fetch,
+      or to None to fetch every metric of that category.
+    - period (str): Flux range start, e.g. '-24h'.
+    - window (str): Flux aggregation window, e.g. '1m'.
+    - use_cache (bool): Set to False to always query InfluxDB.
+
+    Returns:
+    - dict: Maps (category, metric) to a DataFrame with '_time' and '_value' columns.
+      Requested metrics without data map to an empty DataFrame.
+    """
+    def load():
+        frames = _query_bulk(metrics_by_category, period, window)
+        for category, metrics in metrics_by_category.items():
+            for metric in metrics or []:
+                frames.setdefault((category, metric), pd.DataFrame(columns=['_time', '_value']))
+        return frames
+
+    if use_cache:
+        window_seconds = parse_duration(window)
+        now = time.time()
+        key = ('bulk', _selection_key(metrics_by_category), period, window, int(now // window_seconds))
+        frames = query_cache.get_or_load(key, load, window_seconds - (now % window_seconds))
+    else:
+        frames = load()
+    return {key: df.copy() for key, df in frames.items()}
+
+def fetch_since(cursors, lookback='-1m', max_lookback=SINCE_MAX_LOOKBACK):
+    """
+    Fetches the raw points newer than a per-series cursor with a single Flux query.
+
+    The query range starts at the earliest per-series start (see
+    query_builder.since_starts); points at or before each series' own cursor
+    are dropped locally. Series without a cursor are read from `lookback`.
+
+    Parameters:
+    - cursors (dict): Maps (category, metric) to the time up to which the series
+      was already read, or None.
+    - lookback (str): Flux range start for series without a cursor.
+    - max_lookback (str): Older cursors are read from this far back only; the
+      points before are skipped.
+
+    Returns:
+    - dict: Maps (category, metric) to a time-sorted DataFrame with '_time' and
+      '_value' columns holding only the new points. Series without new points are omitted.
+    """
+    if not cursors:
+        return {}
+    query, params = since_query(cursors, lookback, max_lookback)
+    return since_frames(influx.query_data_frame(query, params=params), cursors)
+
+def since_frames(result, cursors):
+    """
+    Splits a since_query result per series and drops the points already seen.
+    """
+    frames = {}
+    for key, df in split_frames(result, cursors).items():
+        cursor = cursors.get(key)
+        if cursor is not None:
+            df = df[df['_time'] > cursor]
+        if not df.empty:
+            frames[key] = df
+    return frames
+
+STAT_COLUMNS = ['mean', 'max', 'min', 'last']
+
+def stats_frame(df, keys=None):
+    """
+    Turns a stats_query result into a frame indexed by (category, metric).
+
+    With `keys`, series that were matched but not asked for are dropped.
+    """
+    if isinstance(df, list):
+        df = pd.concat(df, ignore_index=True)
+    if df.empty:
+        return pd.DataFrame(columns=STAT_COLUMNS, index=pd.MultiIndex.from_tuples([], names=['category', 'metric']))
+    df = df.rename(columns={'_measurement': 'category'}).set_index(['category', 'metric'])
+    if keys is not None:
+        df = df[df.index.isin(list(keys))]
+    return df.reindex(columns=STAT_COLUMNS).astype(float)
+
+def _query_stats(metrics_by_category, period, window):
+    query, params = stats_query(metrics_by_category, period, window)
+    return stats_frame(influx.query_data_frame(query, params=params), selection(metrics_by_category))
+
+def stats_from_frames(frames):
+    """
+    Computes the fetch_stats columns locally from per-series frames.
+    """
+    rows = {
+        key: [df['_value'].mean(), df['_value'].max(), df['_value'].min(), df['_value'].iloc[-1]]
+        for key, df in frames.items() if not df.empty
+    }
+    index = pd.MultiIndex.from_tuples(list(rows), names=['category', 'metric'])
+    return pd.DataFrame(list(rows.values()), index=index, columns=STAT_COLUMNS, dtype=float)
+
+def fetch_stats(metrics_by_category, period='-24h', window='1m', use_cache=True):
+    """
+    Computes mean, max, min and last of many metrics inside InfluxDB.
+
+    Only one row per metric is transferred, so the cost does not grow with
+    the length of `period`. If the server-side aggregation fails (for instance
+    because a series holds non-numeric strings that cannot be cast to float),
+    the statistics are computed locally from fetch_data_bulk instead.
+
+    Parameters:
+    - metrics_by_category (dict): Maps a category to the list of metrics to summarize,
+      or to None for every metric of that category.
+    - period (str): Flux range start, e.g. '-24h' or '-30d'.
+    - window (str): Aggregation window applied before the statistics, e.g. '1m'.
+    - use_cache (bool): Set to False to always query InfluxDB.
+
+    Returns:
+    - pd.DataFrame: Indexed by (category, metric) with 'mean', 'max', 'min' and 'last'
+      columns. Metrics without data are absent from the index.
+    """
+    def load():
+        try:
+            return _query_stats(metrics_by_category, period, window)
+        except Exception as e:
+            print(f"Server-side statistics failed, computing locally: {e}")
+            return stats_from_frames(fetch_data_bulk(metrics_by_category, period, window, use_cache=False))
+
+    if not use_cache:
+        return load()
+    window_seconds = parse_duration(window)
+    now = time.time()
+    key = ('stats', _selection_key(metrics_by_category), period, window, int(now // window_seconds))
+    return query_cache.get_or_load(key, load, window_seconds - (now % window_seconds)).copy()
+
+def fetch_data(category, metric, period='-1h', window=None, use_cache=True):
+    """
+    Fetches a single metric from InfluxDB, aggregated to the last value per window.
+
+    Ranges fully held by the local series store are served from memory.
+    Otherwise results are cached per aggregation window: a new aggregated
+    point can only appear when a window closes, so an entry lives until the
+    next window boundary. Concurrent identical requests share a single query.
+
+    Parameters:
+    - category (str): Measurement name ('modbus', 'opcua' or 'api_request').
+    - metric (str): Field name, or device id for 'api_request'.
+    - period (str): Flux range start, e.g. '-1h'.
+    - window (str): Flux aggregation window, e.g. '1m'. By default it is picked from
+      `period` with choose_window(), so long ranges stay around a constant point count.
+    - use_cache (bool): Set to False to always query InfluxDB.
+
+    Returns:
+    - pd.DataFrame: DataFrame with '_time' and '_value' columns.
+    """
+    if window is None:
+        window = choose_window(period)
+    if not use_cache:
+        return _query_series(category, metric, period, window)
+
+    window_seconds = parse_duration(window)
+    local = series_store.window(category, metric, parse_duration(period), window_seconds)
+    if local is not None:
+        return local
+    now = time.time()
+    bucket = int(now // window_seconds)
+    ttl = window_seconds - (now % window_seconds)
+    key = (category, metric, period, window, bucket)
+    df = query_cache.get_or_load(key, lambda: _query_series(category, metric, period, window), ttl)
+    # Callers are free to modify the frame they receive; keep the cached one intact.
+    return df.copy()
+
+def local_frames(keys, period, window):
+    """
+    Serves what it can of a (category, metric) list from the local series store.
+
+    Returns:
+    - tuple: ({key: frame} of the series held in memory, [keys] that still need a query).
+    """
+    frames, missing = {}, []
+    for category, metric in keys:
+        local = series_store.window(category, metric, parse_duration(period), parse_duration(window))
+        if local is None:
+            missing.append((category, metric))
+        else:
+            frames[(category, metric)] = local
+    return frames, missing
+
+def align_frames(frames, window, fill=COMPARE_FILL_WINDOWS):
+    """
+    Puts several '_time'/'_value' frames on one shared time index of `window` steps.
+
+    Points are moved to the end of their window, where aggregateWindow stamps
+    them, and the last one per window is kept. The series are joined in one
+    pivot and each carries its last value forward to the instants where only
+    the others have a point, so every line of a comparison graph is sampled
+    at the same times. A value is carried over at most `fill` windows, so a
+    series that stopped reporting ends there instead of running flat to the
+    end of the range.
+
+    Parameters:
+    - frames (dict): Maps a key, e.g. (category, metric), to a time-sorted frame, or to
+      None for a series without data.
+    - window (str): Flux duration of the shared step, e.g. '1m'.
+    - fill (int): How many windows without a point a value may cover.
+
+    Returns:
+    - dict: The same keys, in the same order, mapped to the aligned frames. A series
+      starts at its first point; series without data map to an empty DataFrame.
+    """
+    keys = list(frames)
+    parts = [df[['_time', '_value']].assign(series=i) for i, df in enumerate(frames.values())
+             if df is not None and not df.empty]
+    aligned = {key: pd.DataFrame(columns=['_time', '_value']) for key in keys}
+    if not parts:
+        return aligned
+    long = pd.concat(parts, ignore_index=True)
+    long['_time'] = pd.to_datetime(long['_time'], utc=True).dt.ceil(f"{parse_duration(window)}s")
+    long = long.drop_duplicates(['series', '_time'], keep='last')
+    wide = long.pivot(index='_time', columns='series', values='_value').sort_index()
+    # Filled on the full window grid, so the limit counts windows rather than rows
+    grid = pd.date_range(wide.index[0], wide.index[-1], freq=f"{parse_duration(window)}s")
+    wide = wide.reindex(grid).ffill(limit=fill).reindex(wide.index)
+    for i in wide.columns:
+        column = wide[i].dropna()
+        aligned[keys[i]] = pd.DataFrame({'_time': column.index, '_value': column.to_numpy(dtype=float)})
+    return aligned
+
+def fetch_aligned(keys, period='-1h', window=None, use_cache=True):
+    """
+    Fetches several metrics for one comparison graph, aligned with align_frames().
+
+    Series held by the local series store are read from memory and all the
+    others with a single bulk query, so comparing N metrics costs one round
+    trip to InfluxDB, like a single graph.
+
+    Parameters:
+    - keys (list): (category, metric) pairs to fetch.
+    - period (str): Flux range start, e.g. '-24h'.
+    - window (str): Aggregation window and shared step; picked from `period` by default.
+    - use_cache (bool): Set to False to always query InfluxDB.
+
+    Returns:
+    - dict: Maps each key, in order, to a '_time'/'_value' DataFrame.
+    """
+    if window is None:
+        window = choose_window(period)
+    frames, missing = local_frames(keys, period, window)
+    if missing:
+        by_category = {}
+        for category, metric in missing:
+            by_category.setdefault(category, []).append(metric)
+        frames.update(fetch_data_bulk(by_category, period, window, use_cache))
+    return align_frames({key: frames[key] for key in keys}, window)
+
+def fetch_latest(category, metric, period='-1h'):
+    """
+    Fetches only the newest raw point of a metric within `period`.
+
+    Returns:
+    - pd.DataFrame: '_time'/'_value' frame with at most one row.
+    """
+    query, params = last_query(category, metric, period)
+    return influx.query_series(query, params=params)
+
+def fetch_metric_names(category, period='-30d'):
+    """
+    Lists the metric names of a category present in InfluxDB within `period`.
+
+    Returns:
+    - list: Field keys, or device ids for 'api_request'.
+    """
+    query, params = names_query(category, period)
+    return metric_names(influx.query_data_frame(query, params=params))
+
+def metric_names(result):
+    """
+    Returns the names listed by a names_query result.
+    """
+    if isinstance(result, list):
+        result = pd.concat(result, ignore_index=True)
+    if result.empty or '_value' not in result.columns:
+        return []
+    return [str(name) for name in result['_value'].dropna().unique()]
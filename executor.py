@@ -0,0 +1,120 @@
+# executor.py
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from config import HANDLER_WORKERS, HANDLER_QUEUE_SIZE
+from metrics import LatencyHistogram
+
+class KeyedExecutor:
+    """
+    Worker pool that runs tasks sharing a key one at a time, in submission order.
+
+    Tasks with different keys (e.g. different chats) run in parallel on up to
+    `workers` threads; a key with pending tasks holds at most one worker at a
+    time and goes to the back of the line after each task, so one busy chat
+    cannot starve the others. Run time and queue wait are recorded per label.
+    """
+
+    def __init__(self, workers=HANDLER_WORKERS, max_pending=HANDLER_QUEUE_SIZE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._ready = queue.Queue()
+        self._pending = {}
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._threads = []
+        self._latency = {}
+        self._queue_wait = {}
+        self.rejected = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"handler-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, key, label, fn, *args, **kwargs):
+        """
+        Queues fn(*args, **kwargs) behind the other pending tasks of `key`.
+
+        Returns:
+        - Future: Resolved with the task's result.
+
+        Raises:
+        - queue.Full: If `max_pending` tasks are already waiting.
+        """
+        self.start()
+        future = Future()
+        with self._lock:
+            if self._pending_count >= self.max_pending:
+                self.rejected += 1
+                raise queue.Full(f"{self._pending_count} tasks already pending")
+            tasks = self._pending.get(key)
+            if tasks is None:
+                tasks = self._pending[key] = deque()
+                self._ready.put(key)
+            tasks.append((future, label, time.monotonic(), fn, args, kwargs))
+            self._pending_count += 1
+        return future
+
+    def _histograms(self, label):
+        with self._lock:
+            if label not in self._latency:
+                self._latency[label] = LatencyHistogram()
+                self._queue_wait[label] = LatencyHistogram()
+            return self._latency[label], self._queue_wait[label]
+
+    def record(self, label, seconds, waited=0.0):
+        """
+        Records the run time of a handler executed outside the pool.
+        """
+        latency, queue_wait = self._histograms(label)
+        latency.observe(seconds)
+        queue_wait.observe(waited)
+
+    def _worker(self):
+        while True:
+            key = self._ready.get()
+            with self._lock:
+                future, label, queued_at, fn, args, kwargs = self._pending[key].popleft()
+                self._pending_count -= 1
+            started = time.monotonic()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except Exception as e:
+                    print(f"Error in handler {label}: {e}")
+                    future.set_exception(e)
+            self.record(label, time.monotonic() - started, started - queued_at)
+            with self._lock:
+                if self._pending[key]:
+                    self._ready.put(key)
+                else:
+                    del self._pending[key]
+
+    def stats(self):
+        """
+        Returns pending task counts and per-label latency and queue-wait histograms.
+        """
+        with self._lock:
+            labels = list(self._latency)
+            result = {
+                'workers': len(self._threads),
+                'pending': self._pending_count,
+                'active_keys': len(self._pending),
+                'rejected': self.rejected,
+                'handlers': {},
+            }
+        for label in labels:
+            latency, queue_wait = self._histograms(label)
+            result['handlers'][label] = {
+                'latency': latency.snapshot(),
+                'queue_wait': queue_wait.snapshot(),
+            }
+        return result
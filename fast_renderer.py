@@ -0,0 +1,158 @@
+# fast_renderer.py
+
+import io
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+from chart_data import prepare_series, highlight_mask, moving_average
+
+WIDTH = 800
+HEIGHT = 450
+MARGIN_LEFT = 70
+MARGIN_RIGHT = 20
+MARGIN_TOP = 45
+MARGIN_BOTTOM = 45
+
+MAIN_COLOR = (0, 72, 186)
+TREND_COLOR = (128, 163, 220)
+HIGHLIGHT_COLOR = (255, 99, 71)
+GRID_COLOR = (230, 230, 230)
+TEXT_COLOR = (0, 0, 0)
+EXTRA_COLORS = [(239, 85, 59), (0, 204, 150), (171, 99, 250), (255, 161, 90), (25, 211, 243)]
+
+# Individual markers are only drawn when they stay readable
+MAX_MARKERS = 200
+
+_font = ImageFont.load_default()
+
+def _text(draw, xy, text, fill, anchor='la'):
+    # The default bitmap font ignores Pillow's anchors, so align from the text box
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=_font)
+    width, height = right - left, bottom - top
+    x, y = xy
+    x -= {'l': 0, 'm': width / 2, 'r': width}[anchor[0]]
+    y -= {'a': 0, 't': 0, 'm': height / 2, 'b': height}[anchor[1]]
+    draw.text((x - left, y - top), text, fill=fill, font=_font)
+
+def _series(data_frame):
+    times, values = prepare_series(data_frame)
+    return times.asi8, values
+
+def render_png(data_frame, title, metric_name, current_value,
+               chart_type='line', show_trendline=False,
+               additional_metrics=None, highlight_threshold=None,
+               width=WIDTH, height=HEIGHT):
+    """
+    Draws a static chart straight to a Pillow raster and returns PNG bytes.
+
+    Supports the same chart types and options as graph_utils.create_graph, minus
+    the interactive features (range selector, range slider, hover text) that
+    have no use in a static image.
+
+    Returns:
+    - bytes: PNG image of the graph.
+    """
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    _text(draw, (width / 2, 15), title, TEXT_COLOR, 'mt')
+
+    if data_frame.empty:
+        _text(draw, (width / 2, height / 2), "No data available for this metric.", (255, 0, 0), 'mm')
+        return _to_png(image)
+
+    series = [(_series(data_frame), metric_name, MAIN_COLOR)]
+    for i, (df, name) in enumerate(additional_metrics or []):
+        if not df.empty:
+            series.append((_series(df), name, EXTRA_COLORS[i % len(EXTRA_COLORS)]))
+
+    all_times = np.concatenate([times for (times, _), _, _ in series])
+    all_values = np.concatenate([values for (_, values), _, _ in series])
+    t_min, t_max = all_times.min(), all_times.max()
+    v_min, v_max = all_values.min(), all_values.max()
+    if chart_type == 'bar':
+        v_min = min(v_min, 0.0)
+    if t_max == t_min:
+        t_min, t_max = t_min - 1, t_max + 1
+    padding = (v_max - v_min) * 0.05 or 1.0
+    v_min, v_max = v_min - padding, v_max + padding
+
+    left, top = MARGIN_LEFT, MARGIN_TOP
+    right, bottom = width - MARGIN_RIGHT, height - MARGIN_BOTTOM
+    x_scale = (right - left) / (t_max - t_min)
+    y_scale = (bottom - top) / (v_max - v_min)
+
+    def to_x(times):
+        return left + (times - t_min) * x_scale
+
+    def to_y(values):
+        return bottom - (values - v_min) * y_scale
+
+    # Grid and axis labels
+    for value in np.linspace(v_min, v_max, 6):
+        y = float(to_y(value))
+        draw.line([(left, y), (right, y)], fill=GRID_COLOR)
+        _text(draw, (left - 6, y), f"{value:.2f}", TEXT_COLOR, 'rm')
+    span = t_max - t_min
+    time_format = '%H:%M' if span <= 86_400 * 10**9 else '%b %d'
+    for stamp in np.linspace(t_min, t_max, 6):
+        x = float(to_x(stamp))
+        draw.line([(x, top), (x, bottom)], fill=GRID_COLOR)
+        label = pd.Timestamp(int(stamp)).strftime(time_format)
+        _text(draw, (x, bottom + 6), label, TEXT_COLOR, 'mt')
+    draw.rectangle([left, top, right, bottom], outline=(180, 180, 180))
+
+    (times, values), _, _ = series[0]
+    xs, ys = to_x(times), to_y(values)
+    highlighted = highlight_mask(values, highlight_threshold)
+
+    if chart_type == 'bar':
+        bar_width = max(1.0, (right - left) / max(len(values), 1) * 0.8)
+        base = float(to_y(max(0.0, v_min)))
+        for x, y, hot in zip(xs, ys, highlighted):
+            draw.rectangle([x - bar_width / 2, min(y, base), x + bar_width / 2, max(y, base)],
+                           fill=HIGHLIGHT_COLOR if hot else MAIN_COLOR)
+    else:
+        if chart_type == 'line' and len(xs) > 1:
+            draw.line(list(zip(xs.tolist(), ys.tolist())), fill=MAIN_COLOR, width=2)
+        if chart_type == 'scatter' or len(xs) <= MAX_MARKERS:
+            for x, y, hot in zip(xs, ys, highlighted):
+                r = 5 if hot else 3
+                draw.ellipse([x - r, y - r, x + r, y + r], fill=HIGHLIGHT_COLOR if hot else MAIN_COLOR)
+        else:
+            for x, y in zip(xs[highlighted], ys[highlighted]):
+                draw.ellipse([x - 5, y - 5, x + 5, y + 5], fill=HIGHLIGHT_COLOR)
+
+        if show_trendline and len(values) >= 5:
+            trend = moving_average(values, window=5)[4:]
+            trend_points = zip(xs[4:].tolist(), to_y(trend).tolist())
+            draw.line(list(trend_points), fill=TREND_COLOR, width=2)
+
+    for (extra_times, extra_values), _, color in series[1:]:
+        points = list(zip(to_x(extra_times).tolist(), to_y(extra_values).tolist()))
+        if len(points) > 1:
+            draw.line(points, fill=color, width=2)
+
+    # Legend
+    x = left
+    for _, name, color in series:
+        draw.rectangle([x, 28, x + 10, 36], fill=color)
+        _text(draw, (x + 14, 32), name, TEXT_COLOR, 'lm')
+        x += 24 + draw.textlength(name, font=_font)
+
+    # Current value annotation
+    label = f"Current Value: {current_value:.2f}"
+    anchor_x, anchor_y = float(xs[-1]), float(to_y(current_value))
+    label_y = max(top + 8, anchor_y - 30)
+    draw.line([(anchor_x, anchor_y), (anchor_x, label_y)], fill=MAIN_COLOR)
+    label_width = draw.textlength(label, font=_font)
+    label_x = min(max(anchor_x, left + label_width / 2 + 4), right - label_width / 2 - 4)
+    draw.rectangle([label_x - label_width / 2 - 4, label_y - 8, label_x + label_width / 2 + 4, label_y + 8],
+                   fill='white', outline=MAIN_COLOR)
+    _text(draw, (label_x, label_y), label, MAIN_COLOR, 'mm')
+
+    return _to_png(image)
+
+def _to_png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
@@ -0,0 +1,68 @@
+# flux_decoder.py
+
+import csv
+import io
+import numpy as np
+import pandas as pd
+from influxdb_client.client.flux_csv_parser import FluxQueryException
+
+def decode_series(body):
+    """
+    Decodes the '_time' and '_value' columns of an annotated Flux CSV response.
+
+    Only those two columns are kept while reading; the other columns, the
+    annotation rows and the per-table headers are skipped. Values that are
+    not numeric are dropped, like series_frame does.
+
+    Parameters:
+    - body (bytes or str): The raw query response.
+
+    Returns:
+    - tuple: (np.ndarray of int64 epoch nanoseconds, np.ndarray of float64 values)
+
+    Raises:
+    - FluxQueryException: If InfluxDB reported an error inside the response.
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    times = []
+    values = []
+    time_index = value_index = None
+    header = False
+    error = False
+    for row in csv.reader(io.StringIO(body)):
+        if not row:
+            header = False  # a blank line ends a table; the next one restates its header
+            continue
+        if row[0].startswith('#'):
+            continue
+        if not header:
+            header = True
+            error = len(row) > 2 and row[1] == 'error' and row[2] == 'reference'
+            time_index = row.index('_time') if '_time' in row else None
+            value_index = row.index('_value') if '_value' in row else None
+        elif error:
+            raise FluxQueryException(row[1] if len(row) > 1 else '', row[2] if len(row) > 2 else '')
+        elif time_index is not None and value_index is not None:
+            times.append(row[time_index])
+            values.append(row[value_index])
+
+    numeric = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+    keep = ~np.isnan(numeric)
+    if not keep.all():
+        numeric = numeric[keep]
+        times = [stamp for stamp, kept in zip(times, keep) if kept]
+    return _epoch_ns(times), numeric
+
+def _epoch_ns(stamps):
+    # Flux writes RFC3339 in UTC ('...Z'); NumPy parses that in C far faster than pandas' tz-aware path
+    if all(stamp.endswith('Z') for stamp in stamps):
+        return np.array([stamp[:-1] for stamp in stamps], dtype='datetime64[ns]').view(np.int64)
+    return pd.to_datetime(stamps, format='ISO8601', utc=True).asi8
+
+def decode_series_frame(body):
+    """
+    Same as decode_series, as a '_time'/'_value' DataFrame shaped like series_frame's.
+    """
+    times, values = decode_series(body)
+    return pd.DataFrame({'_time': pd.to_datetime(times, utc=True), '_value': values})
@@ -2,16 +2,203 @@ import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 import io
+import hashlib
+import threading
+from collections import OrderedDict
 from PIL import Image
 import warnings
 from influxdb_client.client.warnings import MissingPivotFunction
+from config import (GRAPH_CACHE_MAX_BYTES, GRAPH_CACHE_TTL, GRAPH_FILE_ID_CACHE_SIZE,
+                    GRAPH_MAX_POINTS, GRAPH_DOWNSAMPLE)
+from query_cache import QueryCache
+from renderer import render_figure
+import fast_renderer
+from chart_data import prepare_series, point_styles, moving_average, event_positions
 
 # Suppress specific warning
 warnings.simplefilter("ignore", MissingPivotFunction)
 
+VALID_BACKENDS = ['plotly', 'pillow']
+VALID_CHART_TYPES = ['line', 'bar', 'scatter']
+VALID_DOWNSAMPLERS = ['lttb', 'minmax', None]
+
+# Points recorded exactly at one of these times get a labelled marker
+IMPORTANT_EVENTS = [(pd.Timestamp('2024-04-15'), 'Important Event')]
+
+# Rendered PNG bytes keyed by graph_cache_key()
+png_cache = QueryCache(max_entries=1024, max_bytes=GRAPH_CACHE_MAX_BYTES, sizeof=len)
+
+# Telegram file_ids of PNGs that were already uploaded, keyed by graph_cache_key()
+_file_ids = OrderedDict()
+_file_ids_lock = threading.Lock()
+
+def _hash_frame(digest, data_frame):
+    digest.update(str(len(data_frame)).encode())
+    if not data_frame.empty:
+        hashed = pd.util.hash_pandas_object(data_frame[['_time', '_value']], index=False)
+        digest.update(hashed.values.tobytes())
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: picks `threshold` points that preserve the visual shape.
+
+    Parameters:
+    - x (np.ndarray): Monotonic x coordinates (e.g. int64 nanoseconds).
+    - y (np.ndarray): Values.
+    - threshold (int): Number of points to keep.
+
+    Returns:
+    - np.ndarray: Sorted indices of the kept points, always including the first and last.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # threshold - 2 buckets between the fixed first and last point
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    selected = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        areas = np.abs((x[selected] - next_x) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (next_y - y[selected]))
+        selected = start + int(np.argmax(areas))
+        indices[i + 1] = selected
+    return indices
+
+def minmax_indices(y, threshold):
+    """
+    Keeps the minimum and maximum of each of threshold // 2 equal-count buckets.
+
+    Every spike survives, which makes it the safer choice for alarm-like signals.
+
+    Returns:
+    - np.ndarray: Sorted indices of the kept points, always including the first and last.
+    """
+    n = len(y)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    valid = ~np.all(np.isnan(padded), axis=1)
+    offsets = np.arange(buckets)[valid] * size
+    lows = offsets + np.nanargmin(padded[valid], axis=1)
+    highs = offsets + np.nanargmax(padded[valid], axis=1)
+    return np.unique(np.concatenate(([0, n - 1], lows, highs)))
+
+def downsample_frame(data_frame, max_points=GRAPH_MAX_POINTS, method=GRAPH_DOWNSAMPLE):
+    """
+    Returns at most about `max_points` rows of a '_time'/'_value' DataFrame.
+
+    The input is not modified; it is returned as is when it is already small
+    enough or when `method` is None.
+    """
+    if method is None or max_points is None or len(data_frame) <= max_points:
+        return data_frame
+    times, values = prepare_series(data_frame)
+    if method == 'lttb':
+        indices = lttb_indices(times.asi8, values, max_points)
+    elif method == 'minmax':
+        indices = minmax_indices(values, max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}'. Please use one of {VALID_DOWNSAMPLERS}.")
+    return data_frame.iloc[indices]
+
+def graph_cache_key(data_frame, title, metric_name, current_value,
+                    chart_type='line', show_trendline=False,
+                    additional_metrics=None, highlight_threshold=None, backend='plotly',
+                    max_points=GRAPH_MAX_POINTS, downsample=GRAPH_DOWNSAMPLE):
+    """
+    Returns a fingerprint of the series contents and render options of a graph.
+
+    Two calls with the same key produce the same image, so the key can be used
+    to look up a rendered PNG or an already uploaded Telegram file_id.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    options = (title, metric_name, repr(current_value), chart_type.lower(), bool(show_trendline),
+               repr(highlight_threshold), len(additional_metrics or []), backend, max_points, downsample)
+    digest.update(repr(options).encode())
+    _hash_frame(digest, data_frame)
+    for df, name in additional_metrics or []:
+        digest.update(name.encode())
+        _hash_frame(digest, df)
+    return digest.hexdigest()
+
+def remember_file_id(key, file_id):
+    """
+    Records the Telegram file_id returned after uploading the graph with the given key.
+    """
+    with _file_ids_lock:
+        _file_ids[key] = file_id
+        _file_ids.move_to_end(key)
+        while len(_file_ids) > GRAPH_FILE_ID_CACHE_SIZE:
+            _file_ids.popitem(last=False)
+
+def cached_file_id(key):
+    """
+    Returns the Telegram file_id of an already uploaded graph, or None.
+    """
+    with _file_ids_lock:
+        file_id = _file_ids.get(key)
+        if file_id is not None:
+            _file_ids.move_to_end(key)
+        return file_id
+
+def create_graph_png(data_frame, title, metric_name, current_value,
+                     chart_type='line', show_trendline=False,
+                     additional_metrics=None, highlight_threshold=None, backend='plotly',
+                     max_points=GRAPH_MAX_POINTS, downsample=GRAPH_DOWNSAMPLE, cache_key=None):
+    """
+    Renders a graph like create_graph but returns the raw PNG bytes.
+
+    Renders are cached by graph_cache_key(), and concurrent requests for the
+    same graph share a single render.
+
+    Parameters:
+    - Same as create_graph.
+    - cache_key (str): Precomputed graph_cache_key() for these arguments, if available.
+
+    Returns:
+    - bytes: PNG image of the graph.
+    """
+    if backend not in VALID_BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Please use one of {VALID_BACKENDS}.")
+    if chart_type.lower() not in VALID_CHART_TYPES:
+        raise ValueError(f"Unknown chart type '{chart_type}'. Please use one of {VALID_CHART_TYPES}.")
+    if downsample not in VALID_DOWNSAMPLERS:
+        raise ValueError(f"Unknown downsampling method '{downsample}'. Please use one of {VALID_DOWNSAMPLERS}.")
+    if cache_key is None:
+        cache_key = graph_cache_key(data_frame, title, metric_name, current_value, chart_type,
+                                    show_trendline, additional_metrics, highlight_threshold, backend,
+                                    max_points, downsample)
+
+    def render():
+        # The image is only so many pixels wide; draw no more points than that
+        data = downsample_frame(data_frame, max_points, downsample)
+        extra = [(downsample_frame(df, max_points, downsample), name) for df, name in additional_metrics or []]
+        if backend == 'pillow':
+            return fast_renderer.render_png(data, title, metric_name, current_value, chart_type.lower(),
+                                            show_trendline, extra, highlight_threshold)
+        fig = _build_figure(data, title, metric_name, current_value, chart_type,
+                            show_trendline, extra, highlight_threshold)
+        return render_figure(fig, format='png')
+
+    return png_cache.get_or_load(cache_key, render, GRAPH_CACHE_TTL)
+
 def create_graph(data_frame, title, metric_name, current_value, 
                  chart_type='line', show_trendline=False, 
-                 additional_metrics=None, highlight_threshold=None):
+                 additional_metrics=None, highlight_threshold=None, backend='plotly',
+                 max_points=GRAPH_MAX_POINTS, downsample=GRAPH_DOWNSAMPLE):
     """
     Creates an enhanced graph from a Pandas DataFrame using Plotly, supporting multiple chart types.
 
@@ -24,17 +211,28 @@ def create_graph(data_frame, title, metric_name, current_value,
     - show_trendline (bool): Option to display a trendline (only applicable for 'line' and 'scatter').
     - additional_metrics (list of tuples): List containing tuples with DataFrame and metric names for additional lines.
     - highlight_threshold (float): Value above which data points will be highlighted.
+    - backend (str): 'plotly' for the full Plotly/Kaleido rendering, or 'pillow' for a
+      lightweight static drawing without the interactive-only features. Default is 'plotly'.
+    - max_points (int): Series longer than this are downsampled before rendering.
+    - downsample (str): 'lttb' (Largest-Triangle-Three-Buckets), 'minmax' (min and max per
+      bucket, keeps every spike) or None to draw every point.
     
     Returns:
     - PIL.Image: An image object of the graph.
     """
+    png = create_graph_png(data_frame, title, metric_name, current_value, chart_type,
+                           show_trendline, additional_metrics, highlight_threshold, backend,
+                           max_points, downsample)
+    return Image.open(io.BytesIO(png))
+
+def _build_figure(data_frame, title, metric_name, current_value,
+                  chart_type, show_trendline, additional_metrics, highlight_threshold):
     # Ensure chart_type is in lowercase
     chart_type = chart_type.lower()
     
     # Validate chart_type
-    valid_chart_types = ['line', 'bar', 'scatter']
-    if chart_type not in valid_chart_types:
-        raise ValueError(f"Unknown chart type '{chart_type}'. Please use one of {valid_chart_types}.")
+    if chart_type not in VALID_CHART_TYPES:
+        raise ValueError(f"Unknown chart type '{chart_type}'. Please use one of {VALID_CHART_TYPES}.")
     
     # Check for empty DataFrame
     if data_frame.empty:
@@ -47,25 +245,20 @@ def create_graph(data_frame, title, metric_name, current_value,
             xref="paper", yref="paper"
         )
     else:
-        # Convert _time to datetime format if it's not already
-        if not pd.api.types.is_datetime64_any_dtype(data_frame['_time']):
-            data_frame['_time'] = pd.to_datetime(data_frame['_time'])
-
-        # Convert _value to float
-        data_frame['_value'] = pd.to_numeric(data_frame['_value'], errors='coerce').fillna(0)
+        # Read the series without touching the caller's DataFrame
+        times, values = prepare_series(data_frame)
 
         # Initialize figure
         fig = go.Figure()
 
         # Define marker size and color based on highlight_threshold
-        marker_sizes = [10 if highlight_threshold and val > highlight_threshold else 6 for val in data_frame['_value']]
-        marker_colors = ['#FF6347' if highlight_threshold and val > highlight_threshold else '#0048BA' for val in data_frame['_value']]
+        marker_sizes, marker_colors = point_styles(values, highlight_threshold)
 
         # Add main trace based on chart type
         if chart_type == 'line':
             fig.add_trace(go.Scatter(
-                x=data_frame['_time'],
-                y=data_frame['_value'],
+                x=times,
+                y=values,
                 mode='lines+markers',
                 name=metric_name,
                 line=dict(color='#0048BA', width=2.5),
@@ -73,15 +266,15 @@ def create_graph(data_frame, title, metric_name, current_value,
             ))
         elif chart_type == 'bar':
             fig.add_trace(go.Bar(
-                x=data_frame['_time'],
-                y=data_frame['_value'],
+                x=times,
+                y=values,
                 name=metric_name,
                 marker=dict(color=marker_colors)
             ))
         elif chart_type == 'scatter':
             fig.add_trace(go.Scatter(
-                x=data_frame['_time'],
-                y=data_frame['_value'],
+                x=times,
+                y=values,
                 mode='markers',
                 name=metric_name,
                 marker=dict(size=marker_sizes, color=marker_colors, symbol='circle')
@@ -89,9 +282,9 @@ def create_graph(data_frame, title, metric_name, current_value,
 
         # Add trendline if option is selected and applicable
         if show_trendline and chart_type in ['line', 'scatter']:
-            trendline = data_frame['_value'].rolling(window=5).mean()  # 5-point moving average
+            trendline = moving_average(values, window=5)  # 5-point moving average
             fig.add_trace(go.Scatter(
-                x=data_frame['_time'],
+                x=times,
                 y=trendline,
                 mode='lines',
                 name=f'{metric_name} Trendline',
@@ -101,33 +294,29 @@ def create_graph(data_frame, title, metric_name, current_value,
         # Add additional metrics if provided
         if additional_metrics:
             for df, name in additional_metrics:
-                # Ensure datetime conversion for additional DataFrame
-                if not pd.api.types.is_datetime64_any_dtype(df['_time']):
-                    df['_time'] = pd.to_datetime(df['_time'])
-                df['_value'] = pd.to_numeric(df['_value'], errors='coerce').fillna(0)
-                
+                extra_times, extra_values = prepare_series(df)
                 fig.add_trace(go.Scatter(
-                    x=df['_time'],
-                    y=df['_value'],
+                    x=extra_times,
+                    y=extra_values,
                     mode='lines+markers',
                     name=name,
                     line=dict(width=2.5),
                     marker=dict(size=8)
                 ))
 
-        # Highlight specific date
-        important_date = pd.Timestamp('2024-04-15')
-        if important_date in data_frame['_time'].values:
-            important_value = data_frame.loc[data_frame['_time'] == important_date, '_value'].values[0]
-            fig.add_trace(go.Scatter(
-                x=[important_date],
-                y=[important_value],
-                mode='markers+text',
-                marker=dict(size=12, color='red'),
-                text=['Important Event'],
-                textposition='bottom center',
-                name='Event Marker'
-            ))
+        # Highlight specific dates
+        for important_date, label in IMPORTANT_EVENTS:
+            positions = event_positions(times, important_date)
+            if len(positions):
+                fig.add_trace(go.Scatter(
+                    x=[times[positions[0]]],
+                    y=[values[positions[0]]],
+                    mode='markers+text',
+                    marker=dict(size=12, color='red'),
+                    text=[label],
+                    textposition='bottom center',
+                    name='Event Marker'
+                ))
 
         # Update layout for enhanced visual appeal
         fig.update_layout(
@@ -170,7 +359,7 @@ def create_graph(data_frame, title, metric_name, current_value,
 
         # Add annotation for current value
         fig.add_annotation(
-            x=data_frame['_time'].iloc[-1], y=current_value,
+            x=times[-1], y=current_value,
             text=f"Current Value: {current_value:.2f}",
             showarrow=True,
             arrowhead=1,
@@ -188,11 +377,7 @@ def create_graph(data_frame, title, metric_name, current_value,
                 "<b>Value:</b> %{y:.2f}<br>"
                 "<b>Additional Info:</b> %{customdata[0]}"
             ),
-            customdata=np.stack((data_frame['_value'].cumsum(),), axis=-1)
+            customdata=np.cumsum(values)[:, np.newaxis]
         )
 
-    # Convert to image and return
-    buffer = io.BytesIO()
-    fig.write_image(buffer, format='PNG')
-    buffer.seek(0)
-    return Image.open(buffer)
+    return fig
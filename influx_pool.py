@@ -0,0 +1,271 @@
+# influx_pool.py
+
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+import urllib3
+from influxdb_client import InfluxDBClient
+from influxdb_client.rest import ApiException
+from config import (INFLUXDB_URL, INFLUXDB_TOKEN, INFLUXDB_ORG,
+                    INFLUXDB_POOL_SIZE, INFLUXDB_CONNECT_TIMEOUT, INFLUXDB_QUERY_TIMEOUT,
+                    INFLUXDB_MAX_RETRIES, INFLUXDB_BACKOFF_BASE, INFLUXDB_BACKOFF_MAX,
+                    INFLUXDB_BREAKER_THRESHOLD, INFLUXDB_BREAKER_RESET)
+from flux_decoder import decode_series_frame
+from metrics import LatencyHistogram
+
+# Statuses worth another attempt; anything else (e.g. a bad query) fails at once
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of querying while InfluxDB is considered unreachable.
+    """
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for `reset_timeout`
+    seconds; then a single trial call decides whether it closes again.
+    """
+
+    def __init__(self, threshold=INFLUXDB_BREAKER_THRESHOLD, reset_timeout=INFLUXDB_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._trial or time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """
+        Raises CircuitOpenError unless a call may go through now.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if not self._trial and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._trial = True
+                return
+            self.rejected += 1
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            raise CircuitOpenError(f"InfluxDB unavailable; retrying in {retry_in:.0f}s")
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+def _retryable(error):
+    if isinstance(error, ApiException):
+        return error.status in RETRY_STATUSES
+    return isinstance(error, (urllib3.exceptions.HTTPError, ConnectionError, TimeoutError))
+
+class InfluxPool:
+    """
+    InfluxDB query client shared by every thread of the bot.
+
+    The pool holds `pool_size` InfluxDBClient instances, one HTTP connection
+    each, and a query borrows one for every attempt; callers beyond that wait
+    for a free client. Queries go through the public QueryApi calls
+    (query_raw, query_data_frame). Every attempt gets a timeout, bounded by the
+    caller's deadline if one is set with `deadline()`; it is set on the
+    borrowed client's configuration, which no other thread uses meanwhile. Transient failures (connection errors, timeouts, 429 and 5xx)
+    are retried with jittered exponential backoff while the deadline allows,
+    and a circuit breaker fails fast after repeated failures instead of letting
+    threads pile up on an unreachable server.
+    """
+
+    def __init__(self, url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG,
+                 pool_size=INFLUXDB_POOL_SIZE, connect_timeout=INFLUXDB_CONNECT_TIMEOUT,
+                 query_timeout=INFLUXDB_QUERY_TIMEOUT, max_retries=INFLUXDB_MAX_RETRIES,
+                 backoff_base=INFLUXDB_BACKOFF_BASE, backoff_max=INFLUXDB_BACKOFF_MAX,
+                 breaker=None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.query_timeout = query_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._clients = queue.LifoQueue()
+        for _ in range(pool_size):
+            client = InfluxDBClient(url=url, token=token, org=org,
+                                    timeout=(connect_timeout * 1000, query_timeout * 1000),
+                                    connection_pool_maxsize=1)
+            self._clients.put((client, client.query_api()))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.latency = LatencyHistogram()
+        self.pool_wait = LatencyHistogram()
+        self.queries = 0
+        self.retries = 0
+        self.failures = 0
+
+    @contextmanager
+    def deadline(self, seconds):
+        """
+        Bounds every query made by this thread inside the block to finish within `seconds`.
+
+        Nested deadlines can only shorten the outer one.
+        """
+        previous = getattr(self._local, 'deadline', None)
+        deadline = time.monotonic() + seconds
+        self._local.deadline = deadline if previous is None else min(previous, deadline)
+        try:
+            yield
+        finally:
+            self._local.deadline = previous
+
+    def _remaining(self, timeout):
+        deadline = getattr(self._local, 'deadline', None)
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Query deadline exceeded")
+        return min(timeout, remaining)
+
+    def query_data_frame(self, query, timeout=None, params=None):
+        """
+        Runs a Flux query and returns what QueryApi.query_data_frame returns.
+
+        See query() for the parameters and errors.
+        """
+        return self._run(lambda api: api.query_data_frame(query, params=params), timeout)
+
+    def query_series(self, query, timeout=None, params=None):
+        """
+        Runs a single-series Flux query and returns only its '_time'/'_value' columns.
+
+        The response is decoded by flux_decoder instead of the client's DataFrame
+        builder; see query() for the parameters and errors.
+        """
+        def parse(response):
+            try:
+                return decode_series_frame(response.data)
+            finally:
+                response.release_conn()
+        return self.query(query, parse, timeout, params)
+
+    def query(self, query, parse, timeout=None, params=None):
+        """
+        Runs a Flux query and returns `parse` applied to the raw HTTP response.
+
+        Parameters:
+        - query (str): Flux query text.
+        - parse (callable): Reads the annotated CSV response (QueryApi.query_raw) into a result.
+        - timeout (float): Limit for each attempt in seconds; defaults to the pool's
+          query_timeout and is shortened to the thread's deadline.
+        - params (dict): Flux query parameters.
+
+        Raises:
+        - CircuitOpenError: If InfluxDB failed repeatedly and is not being tried right now.
+        - TimeoutError: If the deadline ran out before the query could succeed.
+        """
+        return self._run(lambda api: parse(api.query_raw(query, params=params)), timeout)
+
+    def _run(self, call, timeout):
+        # Retries `call(query_api)` on a borrowed client; see query()
+        timeout = timeout or self.query_timeout
+        attempt = 0
+        while True:
+            remaining = self._remaining(timeout)
+            waited = time.monotonic()
+            try:
+                slot = self._clients.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError(f"No InfluxDB connection free within {remaining:.1f}s") from None
+            started = time.monotonic()
+            self.pool_wait.observe(started - waited)
+            try:
+                self.breaker.allow()
+                result = self._attempt(slot, call, max(0.001, remaining - (started - waited)))
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                if not _retryable(e):
+                    # The server answered; the query itself is at fault
+                    self.breaker.success()
+                    raise
+                self.breaker.failure()
+                attempt += 1
+                with self._lock:
+                    self.failures += 1
+                if attempt > self.max_retries:
+                    raise
+            else:
+                self.breaker.success()
+                return result
+            finally:
+                self._clients.put(slot)
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            time.sleep(self._remaining(delay))
+            with self._lock:
+                self.retries += 1
+
+    def _attempt(self, slot, call, timeout):
+        started = time.monotonic()
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        try:
+            client, api = slot
+            # (connect, read) in ms, read by the client for every request. urllib3
+            # applies the read timeout to each socket read, not to the whole
+            # response: a server that keeps sending rows can run past it, and the
+            # deadline is only checked again before the next attempt
+            client.conf.timeout = (min(self.connect_timeout, timeout) * 1000, timeout * 1000)
+            return call(api)
+        finally:
+            self.latency.observe(time.monotonic() - started)
+            with self._lock:
+                self.in_use -= 1
+                self.queries += 1
+
+    def stats(self):
+        """
+        Returns pool utilisation, retry counters, the breaker state and latency histograms.
+        """
+        with self._lock:
+            result = {
+                'pool_size': self.pool_size,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'queries': self.queries,
+                'retries': self.retries,
+                'failures': self.failures,
+            }
+        result['breaker'] = self.breaker.state
+        result['breaker_rejected'] = self.breaker.rejected
+        result['latency'] = self.latency.snapshot()
+        result['pool_wait'] = self.pool_wait.snapshot()
+        return result
+
+    def close(self):
+        while True:
+            try:
+                client, _ = self._clients.get_nowait()
+            except queue.Empty:
+                return
+            client.close()
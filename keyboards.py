@@ -0,0 +1,106 @@
+# keyboards.py
+#
+# Inline keyboards for picking a metric, used by chat_handlers.
+# Callback data stays well under Telegram's 64 bytes whatever the metric name:
+#   m|<metric id>|<view>      a metric view, e.g. 'm|17|g'; 'c' toggles it in the comparison
+#   p|<category index>|<page> a page of a category's metrics
+
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+from config import KEYBOARD_PAGE_SIZE
+from metric_registry import registry, CATEGORIES
+
+# Callback code -> view type, in button order
+VIEWS = {'g': 'graph', 'd': 'data', 'b': 'data_graph', 'c': 'compare'}
+_LABELS = {'g': "📈 (Graph)", 'd': "📊 (Data)", 'b': "📚 (Data & Graph)", 'c': "➕ (Compare)"}
+
+NOOP = 'noop'
+BACK = 'back_to_categories'
+
+_cache = {}
+_cache_version = None
+
+def _metric_buttons(markup, metric_id, metric):
+    markup.add(*(
+        InlineKeyboardButton(f"{metric} {label}", callback_data=f'm|{metric_id}|{code}')
+        for code, label in _LABELS.items()
+    ))
+
+def category_keyboard(category, page=0, size=KEYBOARD_PAGE_SIZE):
+    """
+    Returns the keyboard of one page of a category's metrics, with page navigation.
+
+    Keyboards are built once per page and reused until the registry changes.
+    """
+    global _cache_version
+    if _cache_version != registry.version:
+        _cache.clear()
+        _cache_version = registry.version
+    key = (category, page, size)
+    markup = _cache.get(key)
+    if markup is not None:
+        return markup
+
+    pages = max(1, -(-registry.count(category) // size))
+    page = min(max(page, 0), pages - 1)
+    markup = InlineKeyboardMarkup(row_width=2)
+    for metric_id, metric in registry.page(category, page, size):
+        _metric_buttons(markup, metric_id, metric)
+    if pages > 1:
+        index = CATEGORIES.index(category)
+        markup.row(
+            InlineKeyboardButton("◀️", callback_data=f'p|{index}|{(page - 1) % pages}'),
+            InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=NOOP),
+            InlineKeyboardButton("▶️", callback_data=f'p|{index}|{(page + 1) % pages}'),
+        )
+    markup.add(InlineKeyboardButton("🔙 Back", callback_data=BACK))
+    _cache[key] = markup
+    return markup
+
+def search_keyboard(matches):
+    """
+    Returns a keyboard with the views of every (id, category, metric) match.
+    """
+    markup = InlineKeyboardMarkup(row_width=2)
+    for metric_id, _, metric in matches:
+        _metric_buttons(markup, metric_id, metric)
+    return markup
+
+def is_compare(data):
+    return data.startswith('m|') and data.endswith('|c')
+
+def is_page(data):
+    return data == NOOP or data.startswith('p|')
+
+def decode_page(data):
+    """
+    Returns the (category, page) of a page callback, or None.
+    """
+    parts = data.split('|')
+    if len(parts) != 3 or parts[0] != 'p' or not parts[1].isdigit() or not parts[2].isdigit():
+        return None
+    index = int(parts[1])
+    if index >= len(CATEGORIES):
+        return None
+    return CATEGORIES[index], int(parts[2])
+
+def decode_metric(data):
+    """
+    Returns the (category, metric, view type) of a metric callback, or None.
+
+    Buttons sent before ids were introduced ('category|metric|view') still decode.
+
+    Raises:
+    - UnknownMetricError: If the id is not in the registry.
+    """
+    parts = data.split('|')
+    if len(parts) != 3:
+        return None
+    if parts[0] == 'm':
+        if not parts[1].isdigit() or parts[2] not in VIEWS:
+            return None
+        category, metric = registry.key(int(parts[1]))
+        return category, metric, VIEWS[parts[2]]
+    if parts[0] in CATEGORIES:
+        return parts[0], parts[1], parts[2]
+    return None
+
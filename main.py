@@ -1,66 +1,60 @@
 import logging
-import os
-import signal
-from bot_handlers import bot, monitoring_state, toggle_monitoring_for_user
+from bot_handlers import bot, dispatcher
+from session_store import session_store
+from alerts import restore_subscriptions
 from monitoring import monitor_variable
+from renderer import renderer
+from report_scheduler import report_scheduler
+from metric_registry import registry, fixed_metrics, MetricDiscovery
+from data_handler import series_store, fetch_since, fetch_metric_names
+from series_store import SeriesPoller
+from webhook import WebhookServer
+from config import UPDATE_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET
 import threading
 
-# Definizione della funzione per cancellare i PDF
-def delete_pdfs():
-    """
-    Cancella tutti i file PDF nella cartella corrente.
-    """
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    for filename in os.listdir(current_dir):
-        if filename.endswith(".pdf"):
-            file_path = os.path.join(current_dir, filename)
-            try:
-                os.remove(file_path)
-                logging.info(f"Cancellato: {file_path}")
-            except Exception as e:
-                logging.error(f"Errore durante la cancellazione di {file_path}: {e}")
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
 
-# Gestore del segnale SIGINT
-def signal_handler(sig, frame):
-    """
-    Gestisce il segnale di interruzione (Ctrl+C) per cancellare i PDF e uscire.
-    """
-    logging.info("Interruzione rilevata. Cancellazione dei PDF...")
-    delete_pdfs()
-    logging.info("Cancellazione completata. Uscita...")
-    exit(0)
+    # Sessioni autenticate, preferenze di monitoraggio e allarmi sopravvivono ai riavvii
+    session_store.load()
+    restore_subscriptions()
 
-def monitoring_with_notification():
-    """
-    Monitors the variable and notifies users if they have enabled notifications.
-    """
-    while True:
-        variable_value = monitor_variable()  # This function should return the current state of the variable
-        logging.info(f"Monitored Variable: {variable_value}")
+    # Avvio dei renderer Kaleido prima di accettare richieste
+    renderer.start()
 
-        # Notify users if they have enabled monitoring
-        for user_id, is_monitoring_enabled in monitoring_state.items():
-            if is_monitoring_enabled:
-                bot.send_message(user_id, f"🔔 Variable Update: {variable_value}")
+    # Precalcolo periodico del report giornaliero
+    report_scheduler.start()
 
-        time.sleep(5)  # Adjust the monitoring interval as needed
+    # Buffer locale delle serie mostrate nei grafici, aggiornato in modo incrementale
+    for category, metrics in fixed_metrics.items():
+        for metric in metrics:
+            series_store.track(category, metric)
+    series_poller = SeriesPoller(series_store, fetch_since)
+    series_poller.start()
 
-if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)
-    
-    # Registrazione del gestore del segnale
-    signal.signal(signal.SIGINT, signal_handler)
+    # Scoperta in background delle metriche presenti in InfluxDB
+    metric_discovery = MetricDiscovery(registry, fetch_metric_names)
+    metric_discovery.start()
     
-    # Avvio del thread di monitoraggio
-    monitoring_thread = threading.Thread(target=monitoring_with_notification, daemon=True)
+    # Avvio del thread di monitoraggio: valuta le regole di allarme e notifica gli iscritti
+    monitoring_thread = threading.Thread(target=monitor_variable, args=(dispatcher,), daemon=True)
     monitoring_thread.start()
     
     # Esecuzione del bot
     try:
         logging.info("Avvio del bot...")
-        bot.polling(none_stop=True)
+        if UPDATE_MODE == 'webhook':
+            # Gli aggiornamenti arrivano via HTTP; un solo processo, perché sessioni e monitoraggio sono locali
+            server = WebhookServer(bot)
+            bot.remove_webhook()
+            bot.set_webhook(url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+            logging.info(f"Webhook in ascolto su {server.address}")
+            server.serve_forever()
+        else:
+            bot.remove_webhook()
+            bot.polling(none_stop=True)
     except Exception as e:
         logging.error(f"Errore durante l'esecuzione del bot: {e}")
     finally:
-        # Pulizia finale nel caso il bot si fermi per altri motivi
-        delete_pdfs()
+        # Scrive le ultime modifiche alle sessioni ancora in coda
+        session_store.close()
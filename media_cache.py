@@ -0,0 +1,83 @@
+# media_cache.py
+
+import functools
+import os
+import threading
+from io import BytesIO
+import qrcode
+from session_store import session_store
+
+def asset_key(path):
+    """
+    Returns the cache key of a file on disk; it changes when the file is replaced or edited.
+    """
+    stat = os.stat(path)
+    return f"file:{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+@functools.lru_cache(maxsize=16)
+def qr_png(data):
+    """
+    Returns the PNG bytes of a QR code encoding `data`, built once per value.
+    """
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def is_stale_file_id(error):
+    """
+    Tells whether Telegram refused a photo because its file_id is no longer valid.
+    """
+    return error.error_code == 400 and 'file' in error.description.lower()
+
+class MediaCache:
+    """
+    Telegram file_ids of static media that was already uploaded, kept in a SessionStore.
+
+    The first send of an asset uploads its bytes; later sends only pass the
+    file_id Telegram returned, which costs one small API call and no file
+    read. The ids survive restarts. A file_id Telegram no longer accepts is
+    dropped and the asset is uploaded again (see chat_handlers.send_cached_photo).
+    """
+
+    def __init__(self, store=session_store):
+        self.store = store
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.uploads = 0
+
+    def file_id(self, key):
+        file_id = self.store.media_file_id(key)
+        if file_id is not None:
+            with self._lock:
+                self.hits += 1
+        return file_id
+
+    def remember(self, key, sent):
+        """
+        Records the file_id of a message that uploaded the media with the given key.
+        """
+        with self._lock:
+            self.uploads += 1
+        if sent is not None and sent.photo:
+            self.store.set_media_file_id(key, sent.photo[-1].file_id)
+
+    def forget(self, key):
+        self.store.set_media_file_id(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'uploads': self.uploads,
+                'entries': len(self.store.media()),
+            }
+
+media_cache = MediaCache()
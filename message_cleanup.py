@@ -0,0 +1,310 @@
+# message_cleanup.py
+
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from telebot import TeleBot
+from telebot.async_telebot import AsyncTeleBot
+from telebot.apihelper import ApiTelegramException
+from config import DELETE_BATCH_SIZE, DELETE_WORKERS, DELETE_RATE, DELETE_PROGRESS_INTERVAL
+from notifier import TokenBucket
+from session_store import session_store
+
+# Answers meaning the message is already gone or too old; retrying cannot help
+_GONE = ("message to delete not found", "message can't be deleted")
+_MAX_ATTEMPTS = 5
+
+def is_gone(error):
+    """
+    Tells whether a delete failed because the message is already gone or too old.
+    """
+    return any(reason in error.description for reason in _GONE)
+
+def is_batch_unsupported(error):
+    """
+    Tells whether the Bot API server refused deleteMessages because it does not know it.
+    """
+    return error.error_code == 404 or 'method not found' in error.description.lower()
+
+class TrackingTeleBot(TeleBot):
+    """
+    TeleBot that records in a SessionStore the id of every message it sends or receives.
+
+    Deleting a chat then targets the messages that really exist instead of
+    guessing a range of ids below the last one.
+    """
+
+    def __init__(self, token, store=session_store, **kwargs):
+        super().__init__(token, **kwargs)
+        self.store = store
+        self.set_update_listener(self._record_received)
+
+    def _record_received(self, messages):
+        for message in messages:
+            self.store.record_message(message.chat.id, message.message_id)
+
+    def _record_sent(self, message):
+        if message is not None:
+            self.store.record_message(message.chat.id, message.message_id)
+        return message
+
+    def send_message(self, *args, **kwargs):
+        return self._record_sent(super().send_message(*args, **kwargs))
+
+    def send_photo(self, *args, **kwargs):
+        return self._record_sent(super().send_photo(*args, **kwargs))
+
+    def send_document(self, *args, **kwargs):
+        return self._record_sent(super().send_document(*args, **kwargs))
+
+class TrackingAsyncTeleBot(AsyncTeleBot):
+    """
+    AsyncTeleBot counterpart of TrackingTeleBot, for the async runtime.
+
+    The ids are written to the store on a thread, off the event loop.
+    """
+
+    def __init__(self, token, store=session_store, **kwargs):
+        super().__init__(token, **kwargs)
+        self.store = store
+        self.set_update_listener(self._record_received)
+
+    def _record(self, messages):
+        for message in messages:
+            self.store.record_message(message.chat.id, message.message_id)
+
+    async def _record_received(self, messages):
+        await asyncio.to_thread(self._record, messages)
+
+    async def _record_sent(self, message):
+        if message is not None:
+            await asyncio.to_thread(self._record, [message])
+        return message
+
+    async def send_message(self, *args, **kwargs):
+        return await self._record_sent(await super().send_message(*args, **kwargs))
+
+    async def send_photo(self, *args, **kwargs):
+        return await self._record_sent(await super().send_photo(*args, **kwargs))
+
+    async def send_document(self, *args, **kwargs):
+        return await self._record_sent(await super().send_document(*args, **kwargs))
+
+class BatchDeleteUnsupported(Exception):
+    """
+    Raised when the Bot API server does not know deleteMessages.
+    """
+
+class DeletionJob:
+    """
+    Progress of the deletion of one chat's messages.
+
+    The counters are updated by the deleting threads and can be read at any time.
+    `deleted` only counts messages Telegram confirmed one by one. deleteMessages
+    answers a whole batch with a single True and skips the ids it cannot
+    delete without saying which, so the ids of accepted batches are counted
+    in `requested` instead.
+    """
+
+    def __init__(self, chat_id, message_ids):
+        self.chat_id = chat_id
+        self.message_ids = list(message_ids)
+        self.total = len(self.message_ids)
+        self.processed = 0
+        self.deleted = 0
+        self.requested = 0
+        self.failed = 0
+        self.method = None
+        self.error = None
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        # Before deleting the same ids again another way
+        with self._lock:
+            self.deleted = self.requested = self.failed = self.processed = 0
+
+    def _count(self, deleted, failed, requested=0):
+        with self._lock:
+            self.deleted += deleted
+            self.requested += requested
+            self.failed += failed
+            self.processed += deleted + requested + failed
+
+    def summary(self):
+        """
+        Describes the outcome for the chat, e.g. '12 messages deleted, 3 already gone'.
+        """
+        parts = []
+        if self.deleted or not self.requested:
+            parts.append(f"{self.deleted} messages deleted")
+        if self.requested:
+            parts.append(f"deletion requested for {self.requested} messages")
+        if self.failed:
+            parts.append(f"{self.failed} already gone or too old")
+        return ", ".join(parts)
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+class MessageDeleter:
+    """
+    Deletes the messages of a chat in the background and reports progress.
+
+    Messages are deleted with deleteMessages, up to `batch_size` ids per call,
+    and the batches of a job run in parallel on the worker pool. If the Bot
+    API server does not offer deleteMessages, every id is deleted on its own
+    with deleteMessage instead, on the same pool, at most `rate` calls per
+    second across all jobs. 429 answers are retried after the delay Telegram
+    asks for and other transient errors with backoff.
+
+    `progress(job)` is called about every `progress_interval` seconds while a
+    job runs and `done(job)` once at the end, both on the job's own thread.
+    A chat has at most one job at a time.
+    """
+
+    def __init__(self, bot, store=session_store, batch_size=DELETE_BATCH_SIZE, workers=DELETE_WORKERS,
+                 rate=DELETE_RATE, progress_interval=DELETE_PROGRESS_INTERVAL):
+        self.bot = bot
+        self.store = store
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='delete')
+        self._bucket = TokenBucket(rate, rate)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        # None until the server answered a deleteMessages call either way
+        self.batch_supported = None
+        self.jobs_done = 0
+
+    def submit(self, chat_id, message_ids, progress=None, done=None):
+        """
+        Starts deleting `message_ids` in a chat.
+
+        Returns:
+        - DeletionJob: The new job, or the one already running for this chat.
+        """
+        with self._lock:
+            job = self._jobs.get(chat_id)
+            if job is not None:
+                return job
+            job = self._jobs[chat_id] = DeletionJob(chat_id, message_ids)
+        threading.Thread(target=self._run, args=(job, progress, done),
+                         name=f"delete-chat-{chat_id}", daemon=True).start()
+        return job
+
+    def running(self, chat_id):
+        with self._lock:
+            return self._jobs.get(chat_id)
+
+    def _run(self, job, progress, done):
+        try:
+            if self.batch_supported is not False:
+                try:
+                    job.method = 'batch'
+                    self._drive(job, self._delete_batch, self._chunks(job.message_ids), progress)
+                except BatchDeleteUnsupported:
+                    self.batch_supported = False
+            if self.batch_supported is False:
+                job._reset()
+                job.method = 'single'
+                self._drive(job, self._delete_one, job.message_ids, progress)
+            self.store.forget_messages(job.chat_id, job.message_ids)
+        except Exception as e:
+            job.error = e
+            print(f"Error deleting the messages of {job.chat_id}: {e}")
+        finally:
+            job.finished_at = time.monotonic()
+            with self._lock:
+                self._jobs.pop(job.chat_id, None)
+                self.jobs_done += 1
+            job.finished.set()
+            self._notify(done, job)
+
+    def _chunks(self, message_ids):
+        return [message_ids[i:i + self.batch_size] for i in range(0, len(message_ids), self.batch_size)]
+
+    def _drive(self, job, delete, units, progress):
+        futures = {self._pool.submit(delete, job, unit) for unit in units}
+        while futures:
+            finished, futures = wait(futures, timeout=self.progress_interval, return_when=FIRST_EXCEPTION)
+            for future in finished:
+                error = future.exception()
+                if error is not None:
+                    for pending in futures:
+                        pending.cancel()
+                    # Let the running ones finish, so nothing counts into the job afterwards
+                    wait(futures)
+                    raise error
+            if futures:
+                self._notify(progress, job)
+
+    @staticmethod
+    def _notify(callback, job):
+        if callback is None:
+            return
+        try:
+            callback(job)
+        except Exception as e:
+            print(f"Error reporting the deletion of {job.chat_id}: {e}")
+
+    def _call(self, request):
+        # Rate limit, retry 429 and transient failures; returns False if the messages are gone
+        for attempt in range(1, _MAX_ATTEMPTS + 1):
+            delay = self._bucket.reserve()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                return request() is not False
+            except ApiTelegramException as e:
+                if is_gone(e):
+                    return False
+                if e.error_code == 429:
+                    time.sleep((e.result_json or {}).get('parameters', {}).get('retry_after', attempt))
+                    continue
+                if e.error_code < 500 or attempt == _MAX_ATTEMPTS:
+                    raise
+            except BatchDeleteUnsupported:
+                raise
+            except Exception:
+                if attempt == _MAX_ATTEMPTS:
+                    raise
+            time.sleep(min(30.0, 0.5 * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+        return False
+
+    def _delete_batch(self, job, message_ids):
+        def request():
+            try:
+                result = self.bot.delete_messages(job.chat_id, message_ids)
+            except ApiTelegramException as e:
+                if is_batch_unsupported(e):
+                    raise BatchDeleteUnsupported(e.description) from e
+                raise
+            self.batch_supported = True
+            return result
+        if self._call(request):
+            job._count(0, 0, requested=len(message_ids))
+        else:
+            job._count(0, len(message_ids))
+
+    def _delete_one(self, job, message_id):
+        if self._call(lambda: self.bot.delete_message(job.chat_id, message_id)):
+            job._count(1, 0)
+        else:
+            job._count(0, 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': len(self._jobs),
+                'jobs_done': self.jobs_done,
+                'batch_supported': self.batch_supported,
+            }
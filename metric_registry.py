@@ -0,0 +1,257 @@
+# metric_registry.py
+
+import bisect
+import json
+import os
+import threading
+import time
+from config import (MONITORED_VARIABLES, METRIC_REGISTRY_FILE, METRIC_REGISTRY_CACHE,
+                    METRIC_DISCOVERY_INTERVAL, METRIC_DISCOVERY_RANGE)
+
+CATEGORIES = ('modbus', 'opcua', 'api_request')
+
+# Metrics covered by the daily report and the local series store
+fixed_metrics = {
+    'modbus': [
+        "allarmi_ibt_129",
+        "stato_macchina",
+        "numero_ricetta_attuale",
+    ],
+    'opcua': [
+        "xAcquaCaldaSt",
+        "rTT102Set",
+        "rTT102Val",
+    ],
+    'api_request': [
+        "9CGX505109-----10:21220004",
+        "9VTX110547-----04:22120002",
+    ]
+}
+
+class UnknownMetricError(ValueError):
+    """
+    Raised for a category or metric that is not in the registry.
+    """
+
+class MetricRegistry:
+    """
+    The set of (category, metric) series the bot is allowed to query.
+
+    Every identifier that ends up in a Flux query is checked against it first,
+    so callback data or other user input can only select known series.
+
+    Each metric gets a small integer id, in the order metrics were added, that
+    keyboards put in their callback data instead of the full names. Ids are
+    never reused or removed, and save()/load() keep them across restarts so
+    buttons of older messages still decode. Per category, the metrics are also
+    kept sorted case-insensitively for paging and prefix search.
+    """
+
+    def __init__(self, metrics_by_category=None):
+        self._metrics = {category: [] for category in CATEGORIES}
+        self._sorted = {category: [] for category in CATEGORIES}
+        self._ids = {}
+        self._keys = []
+        self._lock = threading.Lock()
+        self.version = 0
+        for category, metrics in (metrics_by_category or {}).items():
+            for metric in metrics:
+                self.add(category, metric)
+
+    def add(self, category, metric):
+        """
+        Registers a metric if it is new and returns its id.
+        """
+        if category not in self._metrics:
+            raise UnknownMetricError(f"Unknown category '{category}'.")
+        key = (category, metric)
+        with self._lock:
+            metric_id = self._ids.get(key)
+            if metric_id is None:
+                metric_id = len(self._keys)
+                self._keys.append(key)
+                self._ids[key] = metric_id
+                self._metrics[category].append(metric)
+                bisect.insort(self._sorted[category], (metric.casefold(), metric))
+                self.version += 1
+            return metric_id
+
+    def update(self, metrics_by_category):
+        """
+        Registers every metric of a {category: [metrics]} mapping; returns how many were new.
+        """
+        version = self.version
+        for category, metrics in metrics_by_category.items():
+            for metric in metrics:
+                self.add(category, metric)
+        return self.version - version
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def __len__(self):
+        return len(self._keys)
+
+    def validate(self, category, metric):
+        """
+        Raises UnknownMetricError unless (category, metric) is registered.
+        """
+        if category not in self._metrics:
+            raise UnknownMetricError(f"Unknown category '{category}'.")
+        if (category, metric) not in self._ids:
+            raise UnknownMetricError(f"Unknown metric '{metric}' in {category}.")
+
+    def metrics(self, category):
+        if category not in self._metrics:
+            raise UnknownMetricError(f"Unknown category '{category}'.")
+        with self._lock:
+            return list(self._metrics[category])
+
+    def id_of(self, category, metric):
+        """
+        Returns the id of a registered metric.
+        """
+        try:
+            return self._ids[(category, metric)]
+        except KeyError:
+            raise UnknownMetricError(f"Unknown metric '{metric}' in {category}.") from None
+
+    def key(self, metric_id):
+        """
+        Returns the (category, metric) of an id.
+        """
+        if 0 <= metric_id < len(self._keys):
+            return self._keys[metric_id]
+        raise UnknownMetricError(f"Unknown metric id {metric_id}.")
+
+    def count(self, category):
+        return len(self._sorted[category])
+
+    def page(self, category, page, size):
+        """
+        Returns the (id, metric) pairs of one page of a category, in sorted order.
+        """
+        with self._lock:
+            entries = self._sorted[category][page * size:(page + 1) * size]
+        return [(self._ids[(category, metric)], metric) for _, metric in entries]
+
+    def search(self, prefix, category=None, limit=None):
+        """
+        Returns the (id, category, metric) of metrics starting with `prefix`, ignoring case.
+
+        Parameters:
+        - prefix (str): Start of the metric names to find.
+        - category (str): Only search this category; every category by default.
+        - limit (int): Stop after this many matches.
+        """
+        prefix = prefix.casefold()
+        found = []
+        with self._lock:
+            for name in ([category] if category else CATEGORIES):
+                entries = self._sorted[name]
+                start = bisect.bisect_left(entries, (prefix, ''))
+                for folded, metric in entries[start:]:
+                    if not folded.startswith(prefix) or (limit is not None and len(found) >= limit):
+                        break
+                    found.append((self._ids[(name, metric)], name, metric))
+        return found
+
+    def load(self, path):
+        """
+        Adds the metrics of a saved registry, or of a {category: [metrics]} JSON file.
+
+        Returns how many metrics were new; a missing file adds nothing.
+        """
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            return self.update(data)
+        version = self.version
+        # A saved registry lists [category, metric] pairs in id order
+        for category, metric in data:
+            self.add(category, metric)
+        return self.version - version
+
+    def save(self, path):
+        """
+        Writes every metric in id order, replacing `path` atomically.
+        """
+        with self._lock:
+            keys = list(self._keys)
+        temp = f"{path}.tmp"
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(keys, f, ensure_ascii=False)
+        os.replace(temp, path)
+
+class MetricDiscovery:
+    """
+    Adds the metrics found in InfluxDB to a registry, in the background.
+
+    `fetch(category, period)` is data_handler.fetch_metric_names. Every
+    `interval` seconds each category is listed over `period`; new metrics are
+    added and the registry is saved to `cache` so their ids survive restarts.
+    """
+
+    def __init__(self, registry, fetch, interval=METRIC_DISCOVERY_INTERVAL,
+                 period=METRIC_DISCOVERY_RANGE, cache=METRIC_REGISTRY_CACHE):
+        self.registry = registry
+        self.fetch = fetch
+        self.interval = interval
+        self.period = period
+        self.cache = cache
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+        self.failures = 0
+        self.refreshed_at = None
+
+    def refresh(self):
+        """
+        Lists every category once; returns how many metrics were new.
+        """
+        return self.record({category: self.fetch(category, self.period) for category in CATEGORIES})
+
+    def record(self, found):
+        """
+        Adds the metrics of a {category: [metrics]} listing; returns how many were new.
+        """
+        added = self.registry.update(found)
+        if added and self.cache:
+            self.registry.save(self.cache)
+        self.refreshes += 1
+        self.refreshed_at = time.time()
+        return added
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                added = self.refresh()
+                if added:
+                    print(f"Discovered {added} new metrics ({len(self.registry)} in total).")
+            except Exception as e:
+                self.failures += 1
+                print(f"Error discovering metrics: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is not None or not self.interval:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metric-discovery", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+# Ids from the previous run first, so they stay the same
+registry = MetricRegistry()
+registry.load(METRIC_REGISTRY_CACHE)
+registry.update(fixed_metrics)
+for _category, _metric in MONITORED_VARIABLES:
+    registry.add(_category, _metric)
+registry.load(METRIC_REGISTRY_FILE)
@@ -0,0 +1,59 @@
+# metrics.py
+
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class LatencyHistogram:
+    """
+    Thread-safe cumulative histogram of durations in seconds.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self._count += 1
+            self._sum += seconds
+            self._max = max(self._max, seconds)
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket containing the q-quantile.
+        """
+        with self._lock:
+            if not self._count:
+                return 0.0
+            target = q * self._count
+            seen = 0
+            for bound, count in zip(self.buckets + (self._max,), self._counts):
+                seen += count
+                if seen >= target:
+                    return min(bound, self._max)
+            return self._max
+
+    def snapshot(self):
+        """
+        Returns the count, sum, mean, max, p50/p95 and per-bucket counts.
+        """
+        p50 = self.quantile(0.5)
+        p95 = self.quantile(0.95)
+        with self._lock:
+            labels = [f"le_{bound}" for bound in self.buckets] + ['le_inf']
+            return {
+                'count': self._count,
+                'sum': self._sum,
+                'mean': self._sum / self._count if self._count else 0.0,
+                'max': self._max,
+                'p50': p50,
+                'p95': p95,
+                'buckets': dict(zip(labels, self._counts)),
+            }
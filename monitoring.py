@@ -1,21 +1,29 @@
-# monitoring.py
-
-import time
-from data_handler import fetch_data
-from bot_handlers import bot, user_access
-
-def monitor_variable():
-    last_value = None
-    while True:
-        try:
-            df = fetch_data("opcua", "udiRiempitrice1Cnt", period='-1m')
-            if not df.empty:
-                current_value = df['_value'].iloc[-1]
-                if last_value is not None and current_value != last_value:
-                    notification_message = f"The value of udiRiempitrice1Cnt has changed from {last_value} to {current_value}."
-                    for chat_id in user_access.keys():
-                        bot.send_message(chat_id, notification_message)
-                last_value = current_value
-        except Exception as e:
-            print(f"Error in monitoring thread: {str(e)}")
-        time.sleep(60)
+# monitoring.py
+
+import time
+from alerts import alert_engine, alert_text, coalesce_key
+from config import MONITOR_INTERVAL
+
+def check_alerts(dispatcher, engine=alert_engine):
+    """
+    Evaluates the alert rules once and queues a notification for every subscriber of each event.
+
+    Notifications of the same alert still waiting in a chat's queue are merged.
+    """
+    for event in engine.poll():
+        notification_message = alert_text(event)
+        for chat_id in engine.subscribers(event.rule_id):
+            dispatcher.enqueue(chat_id, notification_message, coalesce_key=coalesce_key(event))
+
+def monitor_variable(dispatcher):
+    """
+    Evaluates the alert rules every MONITOR_INTERVAL seconds and notifies their subscribers.
+
+    Runs until the process exits.
+    """
+    while True:
+        try:
+            check_alerts(dispatcher)
+        except Exception as e:
+            print(f"Error in monitoring thread: {str(e)}")
+        time.sleep(MONITOR_INTERVAL)
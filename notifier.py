@@ -0,0 +1,293 @@
+# notifier.py
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from telebot.apihelper import ApiTelegramException
+from config import (NOTIFY_WORKERS, NOTIFY_QUEUE_SIZE, NOTIFY_GLOBAL_RATE,
+                    NOTIFY_CHAT_RATE, NOTIFY_CHAT_BURST, NOTIFY_MAX_RETRIES, NOTIFY_BUCKET_SWEEP)
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations instead of refusing requests.
+
+    `reserve()` always takes a token and returns how long the caller has to
+    wait before using it, which lets several threads queue up fairly.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def wait_time(self):
+        """
+        Returns how long until a token is available, without taking one.
+        """
+        with self._lock:
+            self._refill()
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def try_take(self):
+        """
+        Takes a token if one is available now.
+
+        Returns:
+        - float: 0 if a token was taken, otherwise how long until one is available.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def is_full(self):
+        with self._lock:
+            self._refill()
+            return self._tokens >= self.capacity
+
+class _OutboundMessage:
+    __slots__ = ('chat_id', 'text', 'kwargs', 'coalesce_key', 'attempts')
+
+    def __init__(self, chat_id, text, kwargs, coalesce_key):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.coalesce_key = coalesce_key
+        self.attempts = 0
+
+class MessageDispatcher:
+    """
+    Sends Telegram messages from per-chat queues with a pool of worker threads.
+
+    Each chat has its own FIFO queue and is handled by at most one worker at a
+    time, so its messages are sent in the order they were queued, retries
+    included. A chat whose next message is not due yet (per-chat rate, global
+    rate, or the delay before a retry) is scheduled for later and the worker
+    moves on to other chats instead of sleeping; the global token is only
+    taken at the moment a message is sent. 429 responses are retried after
+    the delay Telegram asks for and other transient failures with jittered
+    exponential backoff. Messages enqueued with the same `coalesce_key` for a
+    chat while an earlier one is still waiting replace its text instead of
+    adding another message. Rate buckets of idle chats are dropped.
+    """
+
+    def __init__(self, bot, workers=NOTIFY_WORKERS, queue_size=NOTIFY_QUEUE_SIZE,
+                 global_rate=NOTIFY_GLOBAL_RATE, chat_rate=NOTIFY_CHAT_RATE,
+                 chat_burst=NOTIFY_CHAT_BURST, max_retries=NOTIFY_MAX_RETRIES,
+                 sweep_interval=NOTIFY_BUCKET_SWEEP):
+        self.bot = bot
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.sweep_interval = sweep_interval
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        self._chats = {}            # chat_id -> deque of messages, while it has any
+        self._due = []              # heap of (due at, seq, chat_id) for chats not held by a worker
+        self._held = set()          # chats a worker is sending to right now
+        self._seq = itertools.count()
+        self._queued = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._threads = []
+        self._swept_at = time.monotonic()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+        self.coalesced = 0
+        self.deferred = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"notifier-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, chat_id, text, coalesce_key=None, **kwargs):
+        """
+        Queues a message without blocking.
+
+        Parameters:
+        - chat_id (int): Destination chat.
+        - text (str): Message text.
+        - coalesce_key (hashable): Messages for the same chat and key that are
+          still waiting are merged, keeping the latest text.
+        - kwargs: Extra arguments for `bot.send_message`.
+
+        Returns:
+        - bool: False if the queue was full and the message was dropped.
+        """
+        self.start()
+        with self._lock:
+            if coalesce_key is not None:
+                waiting = self._pending.get((chat_id, coalesce_key))
+                if waiting is not None:
+                    waiting.text = text
+                    waiting.kwargs = kwargs
+                    self.coalesced += 1
+                    return True
+            if self._queued >= self.queue_size:
+                self.dropped += 1
+                return False
+            message = _OutboundMessage(chat_id, text, kwargs, coalesce_key)
+            messages = self._chats.get(chat_id)
+            if messages is None:
+                messages = self._chats[chat_id] = deque()
+                if chat_id not in self._held:
+                    self._schedule(chat_id, 0)
+            messages.append(message)
+            self._queued += 1
+            if coalesce_key is not None:
+                self._pending[(chat_id, coalesce_key)] = message
+            self._sweep()
+        return True
+
+    def _schedule(self, chat_id, delay):
+        # Called with the lock held; the chat must not be held by a worker
+        heapq.heappush(self._due, (time.monotonic() + delay, next(self._seq), chat_id))
+        self._ready.notify()
+
+    def _sweep(self):
+        # Called with the lock held; a full bucket carries no state worth keeping
+        now = time.monotonic()
+        if now - self._swept_at < self.sweep_interval:
+            return
+        self._swept_at = now
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items()
+                        if chat_id not in self._chats and bucket.is_full()]:
+            del self._chat_buckets[chat_id]
+
+    def _chat_bucket(self, chat_id):
+        with self._lock:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            return bucket
+
+    def _next_chat(self):
+        with self._lock:
+            while True:
+                if self._due:
+                    wait = self._due[0][0] - time.monotonic()
+                    if wait <= 0:
+                        chat_id = heapq.heappop(self._due)[2]
+                        self._held.add(chat_id)
+                        return chat_id
+                else:
+                    wait = None
+                self._ready.wait(wait)
+
+    def _worker(self):
+        while True:
+            chat_id = self._next_chat()
+            try:
+                delay = self._deliver(chat_id)
+            except Exception as e:
+                print(f"Error in notifier worker: {e}")
+                delay = self._finish(chat_id)
+            with self._lock:
+                self._held.discard(chat_id)
+                if chat_id in self._chats:
+                    self._schedule(chat_id, delay)
+
+    def _finish(self, chat_id):
+        # Removes the chat's first message; returns 0 so the next one is tried at once
+        with self._lock:
+            messages = self._chats[chat_id]
+            messages.popleft()
+            self._queued -= 1
+            if not messages:
+                del self._chats[chat_id]
+        return 0
+
+    def _deliver(self, chat_id):
+        """
+        Tries to send the first message of a chat held by this worker.
+
+        Returns:
+        - float: Seconds until the chat should be tried again.
+        """
+        with self._lock:
+            message = self._chats[chat_id][0]
+        bucket = self._chat_bucket(chat_id)
+        delay = bucket.wait_time() or self._global_bucket.try_take()
+        if delay > 0:
+            with self._lock:
+                self.deferred += 1
+            return delay
+        bucket.reserve()
+        if message.attempts == 0 and message.coalesce_key is not None:
+            with self._lock:
+                self._pending.pop((message.chat_id, message.coalesce_key), None)
+        message.attempts += 1
+        try:
+            self.bot.send_message(message.chat_id, message.text, **message.kwargs)
+            with self._lock:
+                self.sent += 1
+            return self._finish(chat_id)
+        except ApiTelegramException as e:
+            if e.error_code != 429 and e.error_code < 500:
+                print(f"Dropping message to {message.chat_id}: {e}")
+                with self._lock:
+                    self.failed += 1
+                return self._finish(chat_id)
+            retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after')
+            wait = retry_after if retry_after else self._backoff(message.attempts)
+        except Exception as e:
+            print(f"Error sending message to {message.chat_id}: {e}")
+            wait = self._backoff(message.attempts)
+
+        if message.attempts > self.max_retries:
+            with self._lock:
+                self.failed += 1
+            return self._finish(chat_id)
+        with self._lock:
+            self.retried += 1
+        # Stays first in its chat's queue, so later messages cannot overtake it
+        return wait
+
+    @staticmethod
+    def _backoff(attempt):
+        return min(30.0, 0.5 * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
+    def stats(self):
+        """
+        Returns a snapshot of the dispatcher counters.
+        """
+        with self._lock:
+            return {
+                'queued': self._queued,
+                'chats': len(self._chats),
+                'chat_buckets': len(self._chat_buckets),
+                'sent': self.sent,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'retried': self.retried,
+                'coalesced': self.coalesced,
+                'deferred': self.deferred,
+            }
@@ -0,0 +1,238 @@
+# query_builder.py
+#
+# Flux query templates. The query text of each shape is a constant; every
+# value that changes between calls (bucket, range, window, measurement,
+# metric names) is bound through influxdb-client's `params=`, which declares
+# each one as a typed `option _name = ...` literal instead of interpolating
+# it into the text. Identifiers are checked against the metric registry
+# before a query is built.
+
+import re
+from datetime import timedelta
+import pandas as pd
+from config import INFLUXDB_BUCKET, SINCE_MAX_LOOKBACK
+from metric_registry import registry, CATEGORIES, UnknownMetricError
+
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+def parse_duration(text):
+    """
+    Converts a Flux duration literal such as '1m', '-24h' or '7d' to seconds.
+    """
+    match = re.fullmatch(r'-?(\d+)([smhdw])', text.strip())
+    if not match:
+        raise ValueError(f"Unsupported duration '{text}'.")
+    return int(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+def _range_start(period):
+    # '-1h' and '1h' both mean "the last hour"
+    return -timedelta(seconds=parse_duration(period))
+
+def _window(window):
+    seconds = parse_duration(window)
+    if seconds <= 0:
+        raise ValueError(f"Unsupported window '{window}'.")
+    return timedelta(seconds=seconds)
+
+# Filters selecting one series; api_request series are keyed by device_id
+_ONE_FIELD = 'r["_measurement"] == _category and r["_field"] == _field'
+_ONE_DEVICE = 'r["_measurement"] == "api_request" and r["_field"] == "response_body" and r["device_id"] == _device'
+
+# Filter selecting several series at once. The measurement x field product may
+# match series that were not asked for; callers drop them by (category, metric).
+_MANY = (
+    '(contains(value: r["_measurement"], set: _categories) and contains(value: r["_field"], set: _fields))'
+    ' or (r["_measurement"] == "api_request" and r["_field"] == "response_body"'
+    ' and contains(value: r["device_id"], set: _devices))'
+)
+_METRIC_COLUMN = '|> map(fn: (r) => ({r with metric: if r["_measurement"] == "api_request" then r["device_id"] else r["_field"]}))'
+
+_SERIES = '''
+from(bucket: _bucket)
+  |> range(start: _start)
+  |> filter(fn: (r) => {filter})
+  |> aggregateWindow(every: _every, fn: last, createEmpty: false)
+  |> keep(columns: ["_time", "_value"])
+  |> yield(name: "last")
+'''
+
+_LAST = '''
+from(bucket: _bucket)
+  |> range(start: _start)
+  |> filter(fn: (r) => {filter})
+  |> last()
+  |> keep(columns: ["_time", "_value"])
+'''
+
+_BULK = '''
+from(bucket: _bucket)
+  |> range(start: _start)
+  |> filter(fn: (r) => {filter})
+  |> aggregateWindow(every: _every, fn: last, createEmpty: false)
+  {metric}
+  |> keep(columns: ["_time", "_value", "_measurement", "metric"])
+  |> yield(name: "last")
+'''
+
+_SINCE = '''
+from(bucket: _bucket)
+  |> range(start: _start)
+  |> filter(fn: (r) => {filter})
+  {metric}
+  |> keep(columns: ["_time", "_value", "_measurement", "metric"])
+'''
+
+_STATS = '''
+data = from(bucket: _bucket)
+  |> range(start: _start)
+  |> filter(fn: (r) => {filter})
+  |> aggregateWindow(every: _every, fn: last, createEmpty: false)
+  {metric}
+  |> keep(columns: ["_time", "_value", "_measurement", "metric"])
+  |> toFloat()
+  |> group(columns: ["_measurement", "metric"])
+
+union(tables: [
+    data |> mean() |> set(key: "stat", value: "mean"),
+    data |> max() |> set(key: "stat", value: "max"),
+    data |> min() |> set(key: "stat", value: "min"),
+    data |> last() |> set(key: "stat", value: "last"),
+])
+  |> keep(columns: ["_measurement", "metric", "stat", "_value"])
+  |> pivot(rowKey: ["_measurement", "metric"], columnKey: ["stat"], valueColumn: "_value")
+  |> yield(name: "stats")
+'''
+
+# Metric discovery: field keys of a measurement, or the device ids of api_request
+_FIELD_KEYS = '''
+import "influxdata/influxdb/schema"
+
+schema.measurementFieldKeys(bucket: _bucket, measurement: _category, start: _start)
+'''
+
+_DEVICE_IDS = '''
+import "influxdata/influxdb/schema"
+
+schema.measurementTagValues(bucket: _bucket, measurement: "api_request", tag: "device_id", start: _start)
+'''
+
+TEMPLATES = {
+    'series_field': _SERIES.format(filter=_ONE_FIELD),
+    'series_device': _SERIES.format(filter=_ONE_DEVICE),
+    'last_field': _LAST.format(filter=_ONE_FIELD),
+    'last_device': _LAST.format(filter=_ONE_DEVICE),
+    'bulk': _BULK.format(filter=_MANY, metric=_METRIC_COLUMN),
+    'since': _SINCE.format(filter=_MANY, metric=_METRIC_COLUMN),
+    'stats': _STATS.format(filter=_MANY, metric=_METRIC_COLUMN),
+    'field_keys': _FIELD_KEYS,
+    'device_ids': _DEVICE_IDS,
+}
+
+def _one(shape, category, metric, params):
+    registry.validate(category, metric)
+    params['_bucket'] = INFLUXDB_BUCKET
+    if category == 'api_request':
+        params['_device'] = metric
+        return TEMPLATES[f'{shape}_device'], params
+    params['_category'] = category
+    params['_field'] = metric
+    return TEMPLATES[f'{shape}_field'], params
+
+def series_query(category, metric, period, window):
+    """
+    Query for one series aggregated to the last value per window.
+
+    Returns:
+    - tuple: (query text, params) for query_data_frame(query, params=params).
+    """
+    return _one('series', category, metric, {'_start': _range_start(period), '_every': _window(window)})
+
+def last_query(category, metric, period='-1d'):
+    """
+    Query for the newest raw point of one series within `period`.
+    """
+    return _one('last', category, metric, {'_start': _range_start(period)})
+
+def selection(metrics_by_category):
+    """
+    Validates a {category: [metrics] or None} selection and returns its (category, metric) keys.
+
+    None selects every registered metric of the category.
+    """
+    keys = []
+    for category, metrics in metrics_by_category.items():
+        if metrics is None:
+            metrics = registry.metrics(category)
+        for metric in metrics:
+            registry.validate(category, metric)
+            keys.append((category, metric))
+    return keys
+
+def _many(keys, params):
+    measurements = sorted({category for category, _ in keys if category != 'api_request'})
+    fields = sorted({metric for category, metric in keys if category != 'api_request'})
+    devices = sorted({metric for category, metric in keys if category == 'api_request'})
+    params.update({
+        '_bucket': INFLUXDB_BUCKET,
+        # An empty array literal has no element type for Flux; "" never matches a real name
+        '_categories': measurements or [''],
+        '_fields': fields or [''],
+        '_devices': devices or [''],
+    })
+    return params
+
+def bulk_query(metrics_by_category, period, window):
+    """
+    Query for many series aggregated to the last value per window; parse with split_frames.
+    """
+    keys = selection(metrics_by_category)
+    return TEMPLATES['bulk'], _many(keys, {'_start': _range_start(period), '_every': _window(window)})
+
+def since_starts(cursors, lookback='-1m', max_lookback=SINCE_MAX_LOOKBACK, now=None):
+    """
+    Returns where the read of each series starts: {(category, metric): UTC Timestamp}.
+
+    A series with a cursor starts there, but never more than `max_lookback`
+    ago; a series without one starts `lookback` ago. Cursors are watermarks,
+    so they keep moving while a series sends nothing.
+    """
+    now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now).tz_convert('UTC')
+    floor = now + _range_start(max_lookback)
+    fresh = now + _range_start(lookback)
+    return {
+        key: fresh if cursor is None else max(pd.Timestamp(cursor).tz_convert('UTC'), floor)
+        for key, cursor in cursors.items()
+    }
+
+def since_query(cursors, lookback='-1m', max_lookback=SINCE_MAX_LOOKBACK, now=None):
+    """
+    Query for the raw points of many series from their own since_starts(); parse with since_frames.
+
+    The range starts at the earliest of those starts, so it is never longer
+    than the largest of `lookback` and `max_lookback`, and a series without a
+    cursor never moves the start of the others past their cursors.
+    """
+    for category, metric in cursors:
+        registry.validate(category, metric)
+    starts = since_starts(cursors, lookback, max_lookback, now)
+    start = min(starts.values()) if starts else pd.Timestamp.now(tz='UTC') + _range_start(lookback)
+    return TEMPLATES['since'], _many(list(cursors), {'_start': start.to_pydatetime()})
+
+def stats_query(metrics_by_category, period, window):
+    """
+    Query for mean, max, min and last of many series; parse with stats_frame.
+    """
+    keys = selection(metrics_by_category)
+    return TEMPLATES['stats'], _many(keys, {'_start': _range_start(period), '_every': _window(window)})
+
+def names_query(category, period):
+    """
+    Query listing the metric names of a category seen within `period`; one name per '_value'.
+    """
+    if category not in CATEGORIES:
+        raise UnknownMetricError(f"Unknown category '{category}'.")
+    params = {'_bucket': INFLUXDB_BUCKET, '_start': _range_start(period)}
+    if category == 'api_request':
+        return TEMPLATES['device_ids'], params
+    params['_category'] = category
+    return TEMPLATES['field_keys'], params
@@ -0,0 +1,138 @@
+# query_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class _PendingLoad:
+    """
+    A query that is currently being executed; concurrent callers asking for
+    the same key wait on it instead of issuing their own query.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache for query results.
+
+    Entries expire after a per-entry TTL and the cache is bounded both by the
+    number of entries and by an approximate size in bytes; the least recently
+    used entries are evicted first. Concurrent misses for the same key are
+    coalesced so that only one loader runs.
+    """
+
+    def __init__(self, max_entries=512, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader, ttl):
+        """
+        Returns the cached value for `key`, calling `loader()` on a miss.
+
+        Parameters:
+        - key (hashable): Cache key.
+        - loader (callable): Function producing the value on a miss.
+        - ttl (float): Lifetime of a freshly loaded entry, in seconds.
+
+        Returns:
+        - The cached or freshly loaded value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self._remove(key)
+
+            pending = self._in_flight.get(key)
+            owner = pending is None
+            if owner:
+                pending = _PendingLoad()
+                self._in_flight[key] = pending
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            return pending.wait()
+
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                del self._in_flight[key]
+            pending.error = e
+            pending.event.set()
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            if ttl > 0:
+                self._store(key, value, ttl)
+        pending.value = value
+        pending.event.set()
+        return value
+
+    def _store(self, key, value, ttl):
+        if key in self._entries:
+            self._remove(key)
+        size = self._sizeof(value)
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self._bytes += size
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        """
+        Drops every cached entry. In-flight loads are left untouched.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Returns a snapshot of the cache counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
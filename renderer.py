@@ -0,0 +1,170 @@
+# renderer.py
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from config import RENDER_WORKERS, RENDER_TIMEOUT
+from metrics import LatencyHistogram
+
+try:
+    import plotly
+    import plotly.io
+    from kaleido.scopes.plotly import PlotlyScope
+except ImportError:  # Kaleido is optional; graphs then render through fig.to_image
+    PlotlyScope = None
+
+_WARM_UP_FIGURE = {'data': [{'type': 'scatter', 'y': [0, 1]}], 'layout': {}}
+
+class RendererPool:
+    """
+    Pool of warm Kaleido renderers.
+
+    Every worker thread owns its own Kaleido scope, and with it its own
+    Chromium subprocess, so renders run in parallel across processes instead
+    of serializing on Plotly's shared scope. Workers render a small figure at
+    start-up so the first real request does not pay the Chromium boot cost.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, timeout=RENDER_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self.render_latency = LatencyHistogram()
+        self.queue_wait = LatencyHistogram()
+        self._jobs = queue.Queue()
+        self._threads = []
+        self._busy = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+
+    @property
+    def running(self):
+        return bool(self._threads)
+
+    def start(self):
+        """
+        Starts the worker threads and warms up their renderers.
+
+        Returns:
+        - bool: False if Kaleido is not installed and the pool cannot run.
+        """
+        if PlotlyScope is None:
+            print("Kaleido is not installed; rendering graphs without the renderer pool.")
+            return False
+        with self._lock:
+            if self._threads:
+                return True
+            # Plotly imports its JSON engine lazily; do it here rather than racing in every worker
+            plotly.io.to_json(_WARM_UP_FIGURE)
+            ready = []
+            for i in range(self.workers):
+                started = threading.Event()
+                thread = threading.Thread(target=self._worker, args=(started,), name=f"renderer-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+                ready.append(started)
+        for started in ready:
+            started.wait(self.timeout)
+        return True
+
+    def stop(self):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._jobs.put(None)
+        for thread in threads:
+            thread.join(self.timeout)
+
+    def render(self, fig, format='png', width=None, height=None, scale=None, timeout=None):
+        """
+        Renders a Plotly figure on one of the workers.
+
+        Parameters:
+        - fig (go.Figure or dict): Figure to render.
+        - format (str): Image format understood by Kaleido.
+        - width, height, scale: Passed to Kaleido.
+        - timeout (float): Seconds to wait for the result; defaults to the pool timeout.
+
+        Returns:
+        - bytes: The rendered image.
+
+        Raises:
+        - TimeoutError: If the job is not finished in time. A job still waiting
+          in the queue is cancelled; one already rendering is left to finish.
+        """
+        if not self.running:
+            raise RuntimeError("Renderer pool is not running.")
+        figure = fig.to_dict() if hasattr(fig, 'to_dict') else fig
+        future = Future()
+        self._jobs.put((future, time.monotonic(), (figure, format, width, height, scale)))
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise
+
+    def _worker(self, started):
+        scope = PlotlyScope(plotlyjs=os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js'))
+        try:
+            scope.transform(_WARM_UP_FIGURE, format='png')
+        except Exception as e:
+            print(f"Error warming up renderer: {e}")
+        started.set()
+
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            future, queued_at, (figure, format, width, height, scale) = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.queue_wait.observe(time.monotonic() - queued_at)
+            with self._lock:
+                self._busy += 1
+            began = time.monotonic()
+            try:
+                image = scope.transform(figure, format=format, width=width, height=height, scale=scale)
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                future.set_exception(e)
+            else:
+                with self._lock:
+                    self.completed += 1
+                future.set_result(image)
+            finally:
+                self.render_latency.observe(time.monotonic() - began)
+                with self._lock:
+                    self._busy -= 1
+
+    def stats(self):
+        """
+        Returns queue depth, worker utilisation and latency histograms.
+        """
+        with self._lock:
+            counters = {
+                'workers': len(self._threads),
+                'busy': self._busy,
+                'queue_depth': self._jobs.qsize(),
+                'completed': self.completed,
+                'failed': self.failed,
+                'timeouts': self.timeouts,
+            }
+        counters['render_latency'] = self.render_latency.snapshot()
+        counters['queue_wait'] = self.queue_wait.snapshot()
+        return counters
+
+renderer = RendererPool()
+
+def render_figure(fig, format='png'):
+    """
+    Renders a figure through the pool when it is running, otherwise through Plotly directly.
+    """
+    if renderer.running:
+        return renderer.render(fig, format=format)
+    return fig.to_image(format=format)
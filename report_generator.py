@@ -1,98 +1,126 @@
-from datetime import datetime
-from data_handler import fetch_data
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-import os
-
-fixed_metrics = {
-    'modbus': [
-        "allarmi_ibt_129",
-        "stato_macchina",
-        "numero_ricetta_attuale",
-    ],
-    'opcua': [
-        "xAcquaCaldaSt",
-        "rTT102Set",
-        "rTT102Val",
-    ],
-    'api_request': [
-        "9CGX505109-----10:21220004",
-        "9VTX110547-----04:22120002",
-    ]
-}
-
-def generate_daily_report():
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    report_lines = [
-        f"📊 Daily Report Summary\nGenerated on: {timestamp}\n",
-        "----------------------------------------\n"
-    ]
-    pdf_data = [["Category", "Metric", "Mean", "Max", "Min", "Last"]]
-
-    for category, metrics_list in fixed_metrics.items():
-        report_lines.append(f"Category: {category}\n")
-        report_lines.append("| Metric | Mean | Max | Min | Last |")
-        report_lines.append("|------------|-----------|---------|--------|---------|")
-        
-        for metric in metrics_list:
-            try:
-                df = fetch_data(category, metric, period='-24h')
-                if not df.empty:
-                    mean_value = df['_value'].mean()
-                    max_value = df['_value'].max()
-                    min_value = df['_value'].min()
-                    last_value = df['_value'].iloc[-1]
-                    report_lines.append(
-                        f"| {metric} | {mean_value:.2f} | {max_value:.2f} | {min_value:.2f} | {last_value:.2f} |"
-                    )
-                    pdf_data.append([category, metric, f"{mean_value:.2f}", f"{max_value:.2f}", f"{min_value:.2f}", f"{last_value:.2f}"])
-                else:
-                    report_lines.append(f"| {metric} | No data available | No data available | No data available | No data available |")
-                    pdf_data.append([category, metric, "No data", "No data", "No data", "No data"])
-            except Exception as e:
-                report_lines.append(f"| {metric} | Error: {str(e)} | Error | Error | Error |")
-                pdf_data.append([category, metric, f"Error: {str(e)}", "Error", "Error", "Error"])
-        report_lines.append("\n")
-    
-    text_report = "\n".join(report_lines)
-    
-    
-    return text_report, generate_pdf_report(pdf_data, timestamp)
-
-def generate_pdf_report(data, timestamp):
-    filename = f"daily_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    doc = SimpleDocTemplate(filename, pagesize=letter)
-    elements = []
-
-    styles = getSampleStyleSheet()
-    title = Paragraph(f"Daily Report Summary - Generated on: {timestamp}", styles['Title'])
-    elements.append(title)
-    
-    table = Table(data)
-    style = TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 12),
-        ('TOPPADDING', (0, 1), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ])
-    table.setStyle(style)
-    elements.append(table)
-
-    doc.build(elements)
-    print(f"PDF report saved as '{filename}'")
-    return filename
-# Example usage
-text_report = generate_daily_report()
-print(text_report)
+import time
+from datetime import datetime
+from io import BytesIO
+from config import REPORT_CACHE_TTL, REPORT_SNAPSHOT_MAX_AGE
+from data_handler import fetch_stats, STAT_COLUMNS
+from metric_registry import fixed_metrics
+from query_cache import QueryCache
+from report_store import ReportStore
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+from reportlab.lib.styles import getSampleStyleSheet
+
+# Built reports, shared by everyone asking within REPORT_CACHE_TTL seconds
+report_cache = QueryCache(max_entries=4)
+# Snapshots precomputed by report_scheduler
+report_store = ReportStore()
+
+def generate_daily_report(stats=None):
+    """
+    Builds the daily report text and PDF.
+
+    `stats` can carry a fetch_stats result that was already fetched; otherwise
+    the statistics are fetched here.
+
+    Returns:
+    - tuple: (report text, PDF bytes, PDF file name)
+
+    Raises:
+    - Exception: Whatever fetch_stats raised. A report made only of errors is
+      not built, so it can neither replace a good snapshot nor be cached.
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    report_lines = [
+        f"📊 Daily Report Summary\nGenerated on: {timestamp}\n",
+        "----------------------------------------\n"
+    ]
+    pdf_data = [["Category", "Metric", "Mean", "Max", "Min", "Last"]]
+
+    # One round trip for every metric in the report; InfluxDB returns one row per metric
+    if stats is None:
+        stats = fetch_stats(fixed_metrics, period='-24h')
+
+    for category, metrics_list in fixed_metrics.items():
+        report_lines.append(f"Category: {category}\n")
+        report_lines.append("| Metric | Mean | Max | Min | Last |")
+        report_lines.append("|------------|-----------|---------|--------|---------|")
+        
+        for metric in metrics_list:
+            try:
+                if (category, metric) in stats.index:
+                    mean_value, max_value, min_value, last_value = stats.loc[(category, metric), STAT_COLUMNS]
+                    report_lines.append(
+                        f"| {metric} | {mean_value:.2f} | {max_value:.2f} | {min_value:.2f} | {last_value:.2f} |"
+                    )
+                    pdf_data.append([category, metric, f"{mean_value:.2f}", f"{max_value:.2f}", f"{min_value:.2f}", f"{last_value:.2f}"])
+                else:
+                    report_lines.append(f"| {metric} | No data available | No data available | No data available | No data available |")
+                    pdf_data.append([category, metric, "No data", "No data", "No data", "No data"])
+            except Exception as e:
+                report_lines.append(f"| {metric} | Error: {str(e)} | Error | Error | Error |")
+                pdf_data.append([category, metric, f"Error: {str(e)}", "Error", "Error", "Error"])
+        report_lines.append("\n")
+    
+    text_report = "\n".join(report_lines)
+    filename = f"daily_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    return text_report, generate_pdf_report(pdf_data, timestamp), filename
+
+def get_daily_report(build=generate_daily_report, max_age=REPORT_CACHE_TTL):
+    """
+    Returns the daily report, preferring the latest precomputed snapshot.
+
+    Snapshots older than REPORT_SNAPSHOT_MAX_AGE (e.g. when the scheduler is
+    not running) are ignored and the report is built on demand instead, shared
+    with every caller within `max_age` seconds; concurrent callers on a miss
+    wait for a single build. `build` defaults to generate_daily_report and must
+    return the same tuple; a build that raises is not cached.
+    """
+    report = latest_report()
+    if report is not None:
+        return report
+    return report_cache.get_or_load('daily', build, ttl=max_age)
+
+def latest_report():
+    """
+    Returns the (text, PDF, file name) of the latest snapshot, or None if there is none this recent.
+    """
+    snapshot = report_store.latest()
+    if snapshot is not None and time.time() - snapshot.created_at <= REPORT_SNAPSHOT_MAX_AGE:
+        return snapshot.text, snapshot.pdf, snapshot.filename
+    return None
+
+def generate_pdf_report(data, timestamp):
+    """
+    Renders the report table into an in-memory PDF and returns its bytes.
+    """
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+
+    styles = getSampleStyleSheet()
+    title = Paragraph(f"Daily Report Summary - Generated on: {timestamp}", styles['Title'])
+    elements.append(title)
+    
+    table = Table(data)
+    style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 12),
+        ('TOPPADDING', (0, 1), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+    table.setStyle(style)
+    elements.append(table)
+
+    doc.build(elements)
+    return buffer.getvalue()
@@ -0,0 +1,107 @@
+# report_scheduler.py
+
+import threading
+import time
+from datetime import datetime, timedelta
+from config import REPORT_REFRESH_INTERVAL, REPORT_DAILY_CUTOFF
+from report_generator import generate_daily_report, report_store
+
+class ReportScheduler:
+    """
+    Precomputes the daily report in the background.
+
+    A 'rolling' snapshot is built at start-up and then every `interval`
+    seconds, and a 'daily' snapshot at the `cutoff` time of day ("HH:MM",
+    local time). Each build is saved to the report store, where the handlers
+    pick up the latest one.
+    """
+
+    def __init__(self, build=generate_daily_report, store=report_store,
+                 interval=REPORT_REFRESH_INTERVAL, cutoff=REPORT_DAILY_CUTOFF):
+        self.build = build
+        self.store = store
+        self.interval = interval
+        hour, minute = map(int, cutoff.split(':'))
+        self.cutoff = (hour, minute)
+        self._stop = threading.Event()
+        self._thread = None
+        self._next_refresh = None
+        self._next_daily = None
+        self.builds = 0
+        self.failures = 0
+        self.last_build_seconds = None
+
+    def next_cutoff(self, now=None):
+        """
+        Returns the next datetime at which the daily snapshot is due.
+        """
+        now = now or datetime.now()
+        due = now.replace(hour=self.cutoff[0], minute=self.cutoff[1], second=0, microsecond=0)
+        return due if due > now else due + timedelta(days=1)
+
+    def due(self):
+        """
+        Tells which snapshot to build now, if any, and moves the schedule past it.
+
+        The first call makes a 'rolling' snapshot due at once.
+
+        Returns:
+        - tuple: (kind, 0) if a snapshot is due, else (None, seconds until the next one).
+        """
+        if self._next_refresh is None:
+            self._next_refresh = time.monotonic()
+            self._next_daily = self.next_cutoff()
+        if datetime.now() >= self._next_daily:
+            self._next_daily = self.next_cutoff()
+            self._next_refresh = time.monotonic() + self.interval
+            return 'daily', 0
+        if time.monotonic() >= self._next_refresh:
+            self._next_refresh = time.monotonic() + self.interval
+            return 'rolling', 0
+        wait = min(self._next_refresh - time.monotonic(), (self._next_daily - datetime.now()).total_seconds())
+        return None, max(wait, 0)
+
+    def run_once(self, kind='rolling', build=None):
+        """
+        Builds a report and stores it as a snapshot of the given kind.
+
+        `build` replaces the scheduler's build function for this run.
+
+        Returns:
+        - ReportSnapshot or None: The stored snapshot, or None if the build failed;
+          the previous snapshot then stays the latest one.
+        """
+        started = time.monotonic()
+        try:
+            text, pdf, filename = (build or self.build)()
+            snapshot = self.store.save(kind, text, pdf, filename)
+        except Exception as e:
+            self.failures += 1
+            print(f"Error building the {kind} report: {e}")
+            return None
+        self.builds += 1
+        self.last_build_seconds = time.monotonic() - started
+        return snapshot
+
+    def _run(self):
+        while not self._stop.is_set():
+            kind, wait = self.due()
+            if kind is not None:
+                self.run_once(kind)
+            else:
+                self._stop.wait(wait)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="report-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+report_scheduler = ReportScheduler()
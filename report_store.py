@@ -0,0 +1,106 @@
+# report_store.py
+
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from config import REPORT_DB_PATH, REPORT_SNAPSHOTS_KEPT
+
+ReportSnapshot = namedtuple('ReportSnapshot', ['version', 'kind', 'created_at', 'text', 'pdf', 'filename'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_snapshots (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    text TEXT NOT NULL,
+    pdf BLOB NOT NULL,
+    filename TEXT NOT NULL
+)
+"""
+
+class ReportStore:
+    """
+    Versioned report snapshots in a local SQLite file.
+
+    Every saved report gets an increasing version number; only the newest
+    `keep` snapshots of each kind are kept. The latest snapshot is also held in
+    memory, so serving it never touches the database. The file is opened on
+    first use, not at construction.
+    """
+
+    def __init__(self, path=REPORT_DB_PATH, keep=REPORT_SNAPSHOTS_KEPT):
+        self.path = path
+        self.keep = keep
+        self._connection = None
+        self._latest = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(_SCHEMA)
+            row = self._connection.execute(
+                "SELECT version, kind, created_at, text, pdf, filename FROM report_snapshots "
+                "ORDER BY version DESC LIMIT 1").fetchone()
+            self._latest = ReportSnapshot(*row) if row else None
+        return self._connection
+
+    def save(self, kind, text, pdf, filename):
+        """
+        Stores a report and makes it the latest snapshot.
+
+        Returns:
+        - ReportSnapshot: The stored snapshot, with its version number.
+        """
+        created_at = time.time()
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                cursor = connection.execute(
+                    "INSERT INTO report_snapshots (kind, created_at, text, pdf, filename) VALUES (?, ?, ?, ?, ?)",
+                    (kind, created_at, text, pdf, filename))
+                connection.execute(
+                    "DELETE FROM report_snapshots WHERE kind = ? AND version NOT IN "
+                    "(SELECT version FROM report_snapshots WHERE kind = ? ORDER BY version DESC LIMIT ?)",
+                    (kind, kind, self.keep))
+            self._latest = ReportSnapshot(cursor.lastrowid, kind, created_at, text, pdf, filename)
+            return self._latest
+
+    def latest(self):
+        """
+        Returns the newest snapshot of any kind, or None if nothing was stored yet.
+        """
+        if self._latest is not None:
+            return self._latest
+        with self._lock:
+            self._connect()
+            return self._latest
+
+    def get(self, version):
+        """
+        Returns the snapshot with the given version, or None.
+        """
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT version, kind, created_at, text, pdf, filename FROM report_snapshots WHERE version = ?",
+                (version,)).fetchone()
+        return ReportSnapshot(*row) if row else None
+
+    def versions(self, kind=None):
+        """
+        Lists (version, kind, created_at) of the stored snapshots, newest first.
+        """
+        query = "SELECT version, kind, created_at FROM report_snapshots"
+        params = ()
+        if kind is not None:
+            query += " WHERE kind = ?"
+            params = (kind,)
+        with self._lock:
+            return self._connect().execute(query + " ORDER BY version DESC", params).fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
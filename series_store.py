@@ -0,0 +1,311 @@
+# series_store.py
+
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from config import (SERIES_STORE_CAPACITY, SERIES_STORE_DIR, SERIES_STORE_BACKFILL,
+                    SERIES_STORE_POLL_INTERVAL, SERIES_STORE_MAX_LAG)
+
+POINT_DTYPE = np.dtype([('time', '<i8'), ('value', '<f8')])
+
+class RingBuffer:
+    """
+    Fixed-capacity buffer of (time in ns, value) points kept in time order.
+
+    Points are stored in one structured NumPy array, in memory or memory-mapped
+    to `path`; once full, the oldest points are overwritten. Points that are
+    not newer than the newest stored one are ignored, so re-reading an
+    overlapping range is harmless.
+    """
+
+    def __init__(self, capacity, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.covered_since = None  # ns from which no point is missing
+        self.watermark = None      # ns up to which the source has been read
+        if path is None:
+            self.data = np.zeros(capacity, dtype=POINT_DTYPE)
+        else:
+            self.data = self._open(path, capacity)
+        times = self.data['time']
+        self.count = int(np.count_nonzero(times))
+        self.head = (int(np.argmax(times)) + 1) % capacity if self.count else 0
+        if self.count:
+            self.covered_since = self.oldest()
+
+    @staticmethod
+    def _open(path, capacity):
+        if os.path.exists(path):
+            data = np.lib.format.open_memmap(path, mode='r+')
+            if data.dtype == POINT_DTYPE and data.shape == (capacity,):
+                return data
+            del data
+        return np.lib.format.open_memmap(path, mode='w+', dtype=POINT_DTYPE, shape=(capacity,))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def newest(self):
+        return int(self.data['time'][self.head - 1]) if self.count else None
+
+    def oldest(self):
+        if not self.count:
+            return None
+        return int(self.data['time'][self.head if self.count == self.capacity else 0])
+
+    def append(self, times, values):
+        """
+        Appends time-sorted points; returns how many were stored.
+        """
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        newest = self.newest()
+        if newest is not None:
+            keep = times > newest
+            times, values = times[keep], values[keep]
+        lost = max(0, self.count + len(times) - self.capacity)
+        if len(times) > self.capacity:
+            times, values = times[-self.capacity:], values[-self.capacity:]
+        added = len(times)
+        first = min(added, self.capacity - self.head)
+        self.data['time'][self.head:self.head + first] = times[:first]
+        self.data['value'][self.head:self.head + first] = values[:first]
+        self.data['time'][:added - first] = times[first:]
+        self.data['value'][:added - first] = values[first:]
+        self.head = (self.head + added) % self.capacity
+        self.count = min(self.capacity, self.count + added)
+        if lost and self.covered_since is not None:
+            # Whatever was before the oldest retained point is gone
+            self.covered_since = max(self.covered_since, self.oldest())
+        return added
+
+    def since(self, start):
+        """
+        Returns copies of the times and values at or after `start` (ns), oldest first.
+        """
+        if self.count < self.capacity:
+            segments = [self.data[:self.count]]
+        else:
+            segments = [self.data[self.head:], self.data[:self.head]]
+        parts = []
+        for segment in segments:
+            times = segment['time']
+            parts.append(segment[np.searchsorted(times, start):])
+        points = np.concatenate(parts) if parts else np.zeros(0, dtype=POINT_DTYPE)
+        return points['time'].copy(), points['value'].copy()
+
+    def flush(self):
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+
+def aggregate_last(times, values, window_ns, stop_ns):
+    """
+    Keeps the last point of every window, like aggregateWindow(fn: last, createEmpty: false).
+
+    Windows are aligned to the epoch and each point is stamped with the end of
+    its window, clipped to `stop_ns`, as InfluxDB does.
+    """
+    if not len(times):
+        return times, values
+    buckets = times // window_ns
+    last = np.flatnonzero(np.append(buckets[1:] != buckets[:-1], True))
+    return np.minimum((buckets[last] + 1) * window_ns, stop_ns), values[last]
+
+class SeriesStore:
+    """
+    Local ring buffers holding the recent raw points of tracked series.
+
+    A series can answer a query only for the range it fully covers: from the
+    start of its backfill (or its oldest retained point, once the ring wraps)
+    up to the last poll, which must be at most `max_lag` seconds old. Anything
+    else returns None and the caller goes to InfluxDB.
+    """
+
+    def __init__(self, capacity=SERIES_STORE_CAPACITY, directory=SERIES_STORE_DIR,
+                 max_lag=SERIES_STORE_MAX_LAG):
+        self.capacity = capacity
+        self.directory = directory
+        self.max_lag = max_lag
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self.synced_at = None
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        if self.directory is None:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.blake2b('|'.join(key).encode(), digest_size=8).hexdigest()
+        return os.path.join(self.directory, f"{digest}.npy")
+
+    def track(self, category, metric):
+        key = (category, metric)
+        with self._lock:
+            if key not in self._buffers:
+                self._buffers[key] = RingBuffer(self.capacity, self._path(key))
+
+    def tracked(self):
+        with self._lock:
+            return list(self._buffers)
+
+    @staticmethod
+    def _cursor(buffer):
+        marks = [mark for mark in (buffer.newest(), buffer.watermark) if mark is not None]
+        return max(marks) if marks else None
+
+    def cursors(self):
+        """
+        Returns the fetch_since cursor of every tracked series, None if it needs a backfill.
+        """
+        with self._lock:
+            return {
+                key: pd.Timestamp(cursor, tz='UTC') if cursor is not None else None
+                for key, cursor in ((key, self._cursor(buffer)) for key, buffer in self._buffers.items())
+            }
+
+    def sync(self, cursors, frames, polled_at, watermark, read_from=None):
+        """
+        Stores the points of a fetch_since result.
+
+        Parameters:
+        - cursors (dict): The cursors() the read was made with.
+        - frames (dict): The fetch_since result.
+        - polled_at (int): When the read started, in ns.
+        - watermark (int): Time (ns) up to which every series is now complete.
+        - read_from (int): Where the read started (ns) if it was a backfill, i.e. if some
+          series had no cursor; series with an older cursor then have a gap before it.
+        """
+        with self._lock:
+            for key, buffer in self._buffers.items():
+                if key not in cursors:
+                    continue  # tracked after the read started
+                cursor = self._cursor(buffer)
+                if read_from is not None and (buffer.covered_since is None or cursor is None or cursor < read_from):
+                    buffer.covered_since = max(buffer.covered_since or read_from, read_from)
+                df = frames.get(key)
+                if df is not None and not df.empty:
+                    times = pd.DatetimeIndex(df['_time']).asi8
+                    values = pd.to_numeric(df['_value'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+                    numeric = ~np.isnan(values)
+                    buffer.append(times[numeric], values[numeric])
+                buffer.watermark = watermark
+            self.synced_at = polled_at
+
+    def window(self, category, metric, period_seconds, window_seconds):
+        """
+        Serves a fetch_data request from memory.
+
+        Returns:
+        - pd.DataFrame or None: '_time'/'_value' frame aggregated to the last value per
+          window, or None if the store does not fully cover the requested range.
+        """
+        now = time.time_ns()
+        start = now - period_seconds * 10**9
+        with self._lock:
+            buffer = self._buffers.get((category, metric))
+            fresh = self.synced_at is not None and now - self.synced_at <= self.max_lag * 10**9
+            if buffer is None or not fresh or buffer.covered_since is None or buffer.covered_since > start:
+                self.misses += 1
+                return None
+            times, values = buffer.since(start)
+            self.hits += 1
+        times, values = aggregate_last(times, values, window_seconds * 10**9, now)
+        return pd.DataFrame({'_time': pd.to_datetime(times, utc=True), '_value': values})
+
+    def flush(self):
+        with self._lock:
+            for buffer in self._buffers.values():
+                buffer.flush()
+
+    def stats(self):
+        """
+        Returns per-series point counts and memory, and the totals.
+        """
+        with self._lock:
+            series = {
+                f"{category}/{metric}": {
+                    'points': len(buffer),
+                    'capacity': buffer.capacity,
+                    'bytes': buffer.nbytes,
+                    'covered_since': pd.Timestamp(buffer.covered_since, tz='UTC') if buffer.covered_since else None,
+                }
+                for (category, metric), buffer in self._buffers.items()
+            }
+            return {
+                'series': series,
+                'total_bytes': sum(buffer.nbytes for buffer in self._buffers.values()),
+                'synced_at': pd.Timestamp(self.synced_at, tz='UTC') if self.synced_at else None,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+class SeriesPoller:
+    """
+    Keeps a SeriesStore filled by reading only the new points of every series.
+
+    `fetch` is data_handler.fetch_since; all tracked series are read with one
+    query per poll, and series seen for the first time, or not read for
+    longer than `backfill`, are backfilled from `backfill`.
+    """
+
+    def __init__(self, store, fetch, interval=SERIES_STORE_POLL_INTERVAL, backfill=SERIES_STORE_BACKFILL):
+        self.store = store
+        self.fetch = fetch
+        self.interval = interval
+        self.backfill = backfill
+        self._backfill_seconds = int(pd.Timedelta(backfill.lstrip('-')).total_seconds())
+        self._stop = threading.Event()
+        self._thread = None
+        self.polls = 0
+        self.failures = 0
+
+    def poll(self):
+        started = time.time_ns()
+        cursors = self.store.cursors()
+        # Cursors older than the backfill (after a long outage) are read from the backfill too
+        frames = self.fetch(cursors, lookback=self.backfill, max_lookback=self.backfill)
+        self.record(cursors, frames, started)
+
+    def record(self, cursors, frames, started):
+        """
+        Stores the result of a read of `cursors` that started at `started` (ns).
+
+        poll() calls it with the result of its own read.
+        """
+        floor = pd.Timestamp(started - self._backfill_seconds * 10**9, tz='UTC')
+        behind = any(cursor is None or cursor < floor for cursor in cursors.values())
+        read_from = floor.value if behind else None
+        # Points written late by the collectors can still arrive one interval behind the poll
+        self.store.sync(cursors, frames, started, started - int(self.interval * 10**9), read_from)
+        self.polls += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.failures += 1
+                print(f"Error polling the series store: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="series-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.store.flush()
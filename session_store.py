@@ -0,0 +1,376 @@
+# session_store.py
+
+import sqlite3
+import threading
+import time
+from config import SESSION_DB_PATH, SESSION_FLUSH_INTERVAL, MESSAGE_LOG_MAX_AGE
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    chat_id INTEGER PRIMARY KEY,
+    authorized INTEGER NOT NULL,
+    monitoring INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS alert_subscriptions (
+    chat_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    level REAL,
+    hysteresis REAL NOT NULL,
+    delay REAL NOT NULL,
+    bits INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, category, metric, kind, level, hysteresis, delay, bits)
+);
+CREATE INDEX IF NOT EXISTS alert_subscriptions_series ON alert_subscriptions (category, metric);
+-- The primary key cannot stop duplicates of rules without a level (NULLs are distinct);
+-- this index can. Rows duplicated before it existed are dropped first.
+DELETE FROM alert_subscriptions WHERE rowid NOT IN (
+    SELECT min(rowid) FROM alert_subscriptions
+    GROUP BY chat_id, category, metric, kind, ifnull(level, ''), hysteresis, delay, bits
+);
+CREATE UNIQUE INDEX IF NOT EXISTS alert_subscriptions_rule
+    ON alert_subscriptions (chat_id, category, metric, kind, ifnull(level, ''), hysteresis, delay, bits);
+CREATE TABLE IF NOT EXISTS chat_messages (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chat_messages_sent_at ON chat_messages (sent_at);
+CREATE TABLE IF NOT EXISTS media_files (
+    key TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+class SessionStore:
+    """
+    Which chats are authenticated, have monitoring on and which alerts they added,
+    plus the ids of the recent messages of each chat and the Telegram file_ids
+    of uploaded static media.
+
+    Reads never take a lock: the sets are immutable and writers replace them,
+    so a reader iterating `authorized()` or `monitoring_chats()` sees a
+    consistent snapshot however many writers run. Changes are written to a
+    SQLite file in WAL mode by a background thread, batched into one
+    transaction (and one fsync) every `flush_interval` seconds; later changes
+    to the same row replace earlier ones that were not written yet. The file
+    is read once, on first use.
+
+    Message ids are only kept in the file, for `max_age` seconds: Telegram
+    does not let bots delete older messages.
+    """
+
+    def __init__(self, path=SESSION_DB_PATH, flush_interval=SESSION_FLUSH_INTERVAL, max_age=MESSAGE_LOG_MAX_AGE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        self._connection = None
+        self._authorized = frozenset()
+        self._monitoring = frozenset()
+        self._alerts = {}           # chat id -> frozenset of alert rule tuples
+        self._media = {}            # media key -> Telegram file_id
+        self._sessions = {}         # pending: chat id -> (authorized, monitoring, updated_at)
+        self._alert_writes = {}     # pending: (chat id, rule) -> True to insert, False to delete
+        self._message_writes = {}   # pending: (chat id, message id) -> time to insert, None to delete
+        self._media_writes = {}     # pending: media key -> file_id to insert, None to delete
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            authorized, monitoring, alerts = set(), set(), {}
+            for chat_id, is_authorized, is_monitoring in connection.execute(
+                    "SELECT chat_id, authorized, monitoring FROM sessions"):
+                if is_authorized:
+                    authorized.add(chat_id)
+                if is_monitoring:
+                    monitoring.add(chat_id)
+            for chat_id, *rule in connection.execute(
+                    "SELECT chat_id, category, metric, kind, level, hysteresis, delay, bits FROM alert_subscriptions"):
+                alerts.setdefault(chat_id, set()).add(tuple(rule))
+            self._authorized = frozenset(authorized)
+            self._monitoring = frozenset(monitoring)
+            self._alerts = {chat_id: frozenset(rules) for chat_id, rules in alerts.items()}
+            self._media = dict(connection.execute("SELECT key, file_id FROM media_files"))
+            self._connection = connection
+        return self._connection
+
+    def load(self):
+        """
+        Reads the file now instead of on first use.
+        """
+        with self._lock:
+            self._connect()
+
+    # Reads
+
+    def is_authorized(self, chat_id):
+        if self._connection is None:
+            self.load()
+        return chat_id in self._authorized
+
+    def authorized(self):
+        """
+        Returns a snapshot of the authenticated chats.
+        """
+        if self._connection is None:
+            self.load()
+        return self._authorized
+
+    def is_monitoring(self, chat_id):
+        if self._connection is None:
+            self.load()
+        return chat_id in self._monitoring
+
+    def monitoring_chats(self):
+        """
+        Returns a snapshot of the chats with monitoring on.
+        """
+        if self._connection is None:
+            self.load()
+        return self._monitoring
+
+    def alerts(self):
+        """
+        Returns a snapshot of the added alerts as {chat id: frozenset of rule tuples}.
+        """
+        if self._connection is None:
+            self.load()
+        return self._alerts
+
+    def media_file_id(self, key):
+        """
+        Returns the file_id recorded for a media key, or None.
+        """
+        if self._connection is None:
+            self.load()
+        return self._media.get(key)
+
+    def media(self):
+        """
+        Returns a snapshot of the recorded media as {key: file_id}.
+        """
+        if self._connection is None:
+            self.load()
+        return self._media
+
+    # Writes
+
+    def _session_changed(self, chat_id):
+        self._sessions[chat_id] = (chat_id in self._authorized, chat_id in self._monitoring, time.time())
+        self._schedule()
+
+    def _schedule(self):
+        if self._thread is None:
+            self.start()
+        self._wake.set()
+
+    def authorize(self, chat_id):
+        with self._lock:
+            self._connect()
+            if chat_id not in self._authorized:
+                self._authorized = self._authorized | {chat_id}
+                self._session_changed(chat_id)
+
+    def revoke(self, chat_id):
+        with self._lock:
+            self._connect()
+            if chat_id in self._authorized:
+                self._authorized = self._authorized - {chat_id}
+                self._session_changed(chat_id)
+
+    def set_monitoring(self, chat_id, enabled):
+        with self._lock:
+            self._connect()
+            if (chat_id in self._monitoring) != enabled:
+                self._monitoring = self._monitoring | {chat_id} if enabled else self._monitoring - {chat_id}
+                self._session_changed(chat_id)
+
+    def toggle_monitoring(self, chat_id):
+        """
+        Flips monitoring for a chat and returns the new state.
+        """
+        with self._lock:
+            self._connect()
+            enabled = chat_id not in self._monitoring
+            self._monitoring = self._monitoring | {chat_id} if enabled else self._monitoring - {chat_id}
+            self._session_changed(chat_id)
+            return enabled
+
+    def add_alert(self, chat_id, rule):
+        """
+        Records an alert rule (a tuple like alerts.AlertRule) added by a chat.
+        """
+        rule = tuple(rule)
+        with self._lock:
+            self._connect()
+            rules = self._alerts.get(chat_id, frozenset())
+            if rule not in rules:
+                self._alerts = {**self._alerts, chat_id: rules | {rule}}
+                self._alert_writes[(chat_id, rule)] = True
+                self._schedule()
+
+    def remove_alerts(self, chat_id):
+        with self._lock:
+            self._connect()
+            rules = self._alerts.get(chat_id)
+            if rules:
+                self._alerts = {other: value for other, value in self._alerts.items() if other != chat_id}
+                for rule in rules:
+                    self._alert_writes[(chat_id, rule)] = False
+                self._schedule()
+
+    def set_media_file_id(self, key, file_id):
+        """
+        Records the file_id of an uploaded media key; None forgets it.
+        """
+        with self._lock:
+            self._connect()
+            if self._media.get(key) != file_id:
+                if file_id is None:
+                    self._media = {other: value for other, value in self._media.items() if other != key}
+                else:
+                    self._media = {**self._media, key: file_id}
+                self._media_writes[key] = file_id
+                self._schedule()
+
+    def record_message(self, chat_id, message_id):
+        """
+        Remembers the id of a message sent to or received from a chat.
+        """
+        with self._lock:
+            self._message_writes[(chat_id, message_id)] = time.time()
+            self._schedule()
+
+    def forget_messages(self, chat_id, message_ids):
+        with self._lock:
+            for message_id in message_ids:
+                self._message_writes[(chat_id, message_id)] = None
+            self._schedule()
+
+    def chat_messages(self, chat_id):
+        """
+        Returns the ids of the messages of a chat from the last `max_age` seconds, oldest first.
+        """
+        oldest = time.time() - self.max_age
+        with self._db_lock:
+            with self._lock:
+                connection = self._connect()
+            ids = {message_id for (message_id,) in connection.execute(
+                "SELECT message_id FROM chat_messages WHERE chat_id = ? AND sent_at >= ?", (chat_id, oldest))}
+            # Not written yet
+            with self._lock:
+                for (chat, message_id), sent_at in self._message_writes.items():
+                    if chat != chat_id:
+                        continue
+                    if sent_at is None:
+                        ids.discard(message_id)
+                    elif sent_at >= oldest:
+                        ids.add(message_id)
+        return sorted(ids)
+
+    # Persistence
+
+    def flush(self):
+        """
+        Writes every pending change in one transaction; returns how many rows changed.
+        """
+        with self._db_lock:
+            with self._lock:
+                if not self._sessions and not self._alert_writes and not self._message_writes and not self._media_writes:
+                    return 0
+                connection = self._connect()
+                sessions, self._sessions = self._sessions, {}
+                alert_writes, self._alert_writes = self._alert_writes, {}
+                message_writes, self._message_writes = self._message_writes, {}
+                media_writes, self._media_writes = self._media_writes, {}
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO sessions (chat_id, authorized, monitoring, updated_at) VALUES (?, ?, ?, ?)",
+                    [(chat_id, *state) for chat_id, state in sessions.items()])
+                connection.executemany(
+                    "DELETE FROM alert_subscriptions WHERE chat_id = ? AND category = ? AND metric = ? AND kind = ? "
+                    "AND level IS ? AND hysteresis = ? AND delay = ? AND bits = ?",
+                    [(chat_id, *rule) for (chat_id, rule), insert in alert_writes.items() if not insert])
+                connection.executemany(
+                    "INSERT OR IGNORE INTO alert_subscriptions "
+                    "(chat_id, category, metric, kind, level, hysteresis, delay, bits) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(chat_id, *rule) for (chat_id, rule), insert in alert_writes.items() if insert])
+                connection.executemany(
+                    "DELETE FROM chat_messages WHERE chat_id = ? AND message_id = ?",
+                    [key for key, sent_at in message_writes.items() if sent_at is None])
+                connection.executemany(
+                    "INSERT OR REPLACE INTO chat_messages (chat_id, message_id, sent_at) VALUES (?, ?, ?)",
+                    [(*key, sent_at) for key, sent_at in message_writes.items() if sent_at is not None])
+                connection.execute("DELETE FROM chat_messages WHERE sent_at < ?", (time.time() - self.max_age,))
+                connection.executemany(
+                    "DELETE FROM media_files WHERE key = ?",
+                    [(key,) for key, file_id in media_writes.items() if file_id is None])
+                connection.executemany(
+                    "INSERT OR REPLACE INTO media_files (key, file_id, updated_at) VALUES (?, ?, ?)",
+                    [(key, file_id, time.time()) for key, file_id in media_writes.items() if file_id is not None])
+            rows = len(sessions) + len(alert_writes) + len(message_writes) + len(media_writes)
+            self.flushes += 1
+            self.rows_written += rows
+            return rows
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error saving sessions: {e}")
+            # Changes made meanwhile wait for the next batch
+            self._stop.wait(self.flush_interval)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="session-store", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """
+        Stops the writer and saves what is still pending.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._db_lock, self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'authorized': len(self._authorized),
+                'monitoring': len(self._monitoring),
+                'alerts': sum(len(rules) for rules in self._alerts.values()),
+                'media': len(self._media),
+                'pending': (len(self._sessions) + len(self._alert_writes) + len(self._message_writes)
+                            + len(self._media_writes)),
+                'flushes': self.flushes,
+                'rows_written': self.rows_written,
+            }
+
+session_store = SessionStore()
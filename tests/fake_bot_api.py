@@ -0,0 +1,87 @@
+# fake_bot_api.py
+#
+# Shared by the tests and by `python benchmarks.py delete`.
+
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+class FakeBotApi:
+    """
+    Local stand-in for the Telegram Bot API, for exercising the bot's own calls.
+
+    Every request waits `rtt` seconds before answering, like a round trip to
+    Telegram. Messages are created by sendMessage and removed by deleteMessage
+    and deleteMessages, which is left out when `batch` is False, like an
+    older Bot API server. Point telebot at it with `apihelper.API_URL = api.url`
+    (and `asyncio_helper.API_URL` for AsyncTeleBot).
+    """
+
+    def __init__(self, rtt=0.0, batch=True):
+        self.rtt = rtt
+        self.batch = batch
+        self.messages = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._next_id = 1
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self._answer()
+
+            def do_POST(self):
+                self._answer()
+
+            def _answer(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                params = dict(parse_qsl(url.query))
+                params.update(parse_qsl(self.rfile.read(length).decode()))
+                time.sleep(api.rtt)
+                status, body = api.handle(url.path.rsplit('/', 1)[-1], params)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/bot{{0}}/{{1}}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def handle(self, method, params):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            chat_id = int(params.get('chat_id', 0))
+            if method == 'sendMessage':
+                message_id, self._next_id = self._next_id, self._next_id + 1
+                self.messages.setdefault(chat_id, set()).add(message_id)
+                return 200, {'ok': True, 'result': {
+                    'message_id': message_id, 'date': int(time.time()), 'text': params.get('text', ''),
+                    'chat': {'id': chat_id, 'type': 'private'}}}
+            if method == 'deleteMessage':
+                chat = self.messages.get(chat_id, set())
+                if int(params['message_id']) not in chat:
+                    return 400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: message to delete not found'}
+                chat.discard(int(params['message_id']))
+                return 200, {'ok': True, 'result': True}
+            if method == 'deleteMessages' and self.batch:
+                self.messages.get(chat_id, set()).difference_update(json.loads(params['message_ids']))
+                return 200, {'ok': True, 'result': True}
+            if method == 'editMessageText':
+                return 200, {'ok': True, 'result': True}
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,79 @@
+# test_alerts.py
+
+import pandas as pd
+from alerts import AlertEngine, alert_rule, parse_alert_command, coalesce_key
+import pytest
+
+KEY = ('opcua', 'rTT102Val')
+START = pd.Timestamp('2026-10-17 12:00', tz='UTC')
+
+def frame(values, step='1s', start=START):
+    times = [start + i * pd.Timedelta(step) for i in range(len(values))]
+    return pd.DataFrame({'_time': times, '_value': [float(v) for v in values]})
+
+def engine_with(rule):
+    engine = AlertEngine(lookback='-1m', lateness=5)
+    rule_id = engine.subscribe(1, rule)
+    return engine, rule_id
+
+def test_threshold_fires_and_clears_with_hysteresis():
+    engine, _ = engine_with(alert_rule(*KEY, 'above', level=10, hysteresis=2))
+    events = engine.apply({KEY: frame([5, 11, 9, 11, 7])}, now=0)
+    # 9 is inside the band (8, 10]: the alert stays on until 7
+    assert [(e.firing, e.value) for e in events] == [(True, 11.0), (False, 7.0)]
+
+def test_delay_ignores_short_excursions():
+    engine, _ = engine_with(alert_rule(*KEY, 'above', level=10, delay=3))
+    assert engine.apply({KEY: frame([5, 11, 5])}, now=0) == []
+    events = engine.apply({KEY: frame([11, 11, 11, 11], start=START + pd.Timedelta('10s'))}, now=0)
+    assert [e.firing for e in events] == [True]
+    assert events[0].time == START + pd.Timedelta('13s')
+
+def test_bits_report_raised_and_cleared_bits():
+    engine, _ = engine_with(alert_rule('modbus', 'allarmi_ibt_129', 'bits'))
+    events = engine.apply({('modbus', 'allarmi_ibt_129'): frame([0, 0b101, 0b100, 0])}, now=0)
+    assert [(e.firing, e.bits) for e in events] == [(True, 0b101), (False, 0b001), (False, 0b100)]
+
+def test_change_and_stuck():
+    engine = AlertEngine()
+    engine.subscribe(1, alert_rule(*KEY, 'change'))
+    stuck_id = engine.subscribe(1, alert_rule(*KEY, 'stuck', level=60))
+    events = engine.apply({KEY: frame([1, 1, 2])}, now=START.value)
+    assert [(e.previous, e.value) for e in events] == [(1.0, 2.0)]
+    events = engine.apply({}, now=(START + pd.Timedelta('2min')).value)
+    assert [(e.rule_id, e.firing) for e in events] == [(stuck_id, True)]
+
+def test_cursors_follow_the_watermark_of_quiet_series():
+    engine, _ = engine_with(alert_rule(*KEY, 'above', level=10))
+    cursors = engine.cursors()
+    assert cursors == {KEY: None}
+    engine.apply({KEY: frame([1])}, cursors=cursors, watermark=(START + pd.Timedelta('1min')).value)
+    assert engine.cursors()[KEY] == START + pd.Timedelta('1min')
+    # A later point still moves it further
+    engine.apply({KEY: frame([1], start=START + pd.Timedelta('2min'))}, cursors=engine.cursors(),
+                 watermark=START.value)
+    assert engine.cursors()[KEY] == START + pd.Timedelta('2min')
+
+def test_unsubscribed_series_restart_from_the_lookback():
+    engine, _ = engine_with(alert_rule(*KEY, 'above', level=10))
+    engine.apply({KEY: frame([1])}, cursors=engine.cursors(), watermark=START.value)
+    engine.unsubscribe(1)
+    assert engine.cursors() == {}
+    engine.subscribe(2, alert_rule(*KEY, 'above', level=10))
+    assert engine.cursors() == {KEY: None}
+
+def test_only_change_events_coalesce():
+    engine, _ = engine_with(alert_rule(*KEY, 'above', level=10))
+    fired, cleared = engine.apply({KEY: frame([11, 5])}, now=0)
+    assert coalesce_key(fired) is None and coalesce_key(cleared) is None
+    engine, rule_id = engine_with(alert_rule(*KEY, 'change'))
+    first, second = engine.apply({KEY: frame([1, 2, 3])}, now=0)
+    assert coalesce_key(first) == coalesce_key(second) == ('alert', rule_id)
+
+def test_parse_alert_command():
+    rule = parse_alert_command('/alert opcua rTT102Val above 90 2 60')
+    assert (rule.kind, rule.level, rule.hysteresis, rule.delay) == ('above', 90.0, 2.0, 60.0)
+    with pytest.raises(ValueError):
+        parse_alert_command('/alert opcua rTT102Val above')
+    with pytest.raises(ValueError):
+        parse_alert_command('/alert opcua rTT102Val above x')
@@ -0,0 +1,88 @@
+# test_async_runtime.py
+
+import asyncio
+import threading
+from types import SimpleNamespace
+import pandas as pd
+import pytest
+from telebot import asyncio_helper
+import async_runtime
+import chat_handlers
+from chat_handlers import Call
+from data_handler import influx
+from series_store import SeriesStore
+
+KEY = ('opcua', 'rTT102Val')
+
+@pytest.fixture
+def runtime(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runtime = async_runtime.AsyncRuntime(token='123:test')
+    yield runtime
+    runtime.executor.shutdown(wait=True)
+
+class FakeAsyncBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def answer_callback_query(self, *args, **kwargs):
+        raise asyncio_helper.ApiTelegramException('answerCallbackQuery', None,
+                                                  {'error_code': 400, 'description': 'Bad Request: query is too old'})
+
+def test_series_loop_polls_through_the_pool(runtime):
+    store = SeriesStore(capacity=100, directory=None)
+    store.track(*KEY)
+    runtime.series_poller.store = store
+    now = pd.Timestamp.now(tz='UTC')
+    threads = []
+
+    def fetch(cursors, lookback, max_lookback):
+        threads.append(threading.current_thread())
+        return {KEY: pd.DataFrame({'_time': [now - pd.Timedelta('2s'), now - pd.Timedelta('1s')], '_value': [1.0, 2.0]})}
+
+    async def run():
+        runtime._stopping = asyncio.Event()
+        runtime._stopping.set()  # one pass, then stop
+        runtime.series_poller.fetch = fetch
+        await runtime.series_loop()
+
+    asyncio.run(run())
+    assert threads and threads[0] is not threading.main_thread()
+    assert len(store._buffers[KEY]) == 2
+    assert runtime.series_poller.polls == 1
+
+def test_handlers_query_off_the_loop_within_the_deadline(runtime, monkeypatch):
+    seen = []
+
+    def fetch_latest(category, metric):
+        seen.append((threading.current_thread(), influx._local.deadline))
+        return pd.DataFrame({'_time': [pd.Timestamp('2026-10-17 09:00', tz='UTC')], '_value': [4.5]})
+
+    monkeypatch.setattr(chat_handlers, 'fetch_latest', fetch_latest)
+    runtime.bot = FakeAsyncBot()
+    call = SimpleNamespace(id='1', data='opcua|rTT102Val|data', message=SimpleNamespace(chat=SimpleNamespace(id=3)))
+    asyncio.run(runtime.drive(chat_handlers.handle_query(call)))
+    (thread, deadline), = seen
+    assert thread is not threading.main_thread() and deadline is not None
+    assert runtime.bot.sent == ["📊 Latest rTT102Val Data:\nTimestamp: 2026-10-17 09:00:00+00:00\nValue: 4.5"]
+
+def test_request_results_and_errors_reach_the_handler(runtime):
+    outcomes = []
+
+    def handler():
+        sent = yield Call('send_message', 3, "first")
+        outcomes.append(sent.message_id)
+        try:
+            yield Call('answer_callback_query', '1')
+        except chat_handlers.API_ERRORS as e:
+            outcomes.append(e.description)
+        yield Call('send_message', 3, "second")
+
+    runtime.bot = FakeAsyncBot()
+    asyncio.run(runtime.drive(handler()))
+    assert outcomes == [1, 'Bad Request: query is too old']
+    assert runtime.bot.sent == ["first", "second"]
@@ -0,0 +1,76 @@
+# test_chat_handlers.py
+
+from types import SimpleNamespace
+import pandas as pd
+import pytest
+from telebot import apihelper, asyncio_helper
+import chat_handlers
+from media_cache import MediaCache
+from session_store import SessionStore
+
+CHAT = 3
+
+class FakeBot:
+    """
+    Records the requests of a handler; the first send_photo raises `fail` if given.
+    """
+
+    def __init__(self, fail=None):
+        self.calls = []
+        self.fail = fail
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(('send_message', text))
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        self.calls.append(('send_photo', photo))
+        if self.fail is not None:
+            error, self.fail = self.fail, None
+            raise error
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=f"id-{len(self.calls)}")])
+
+def data_call(view):
+    return SimpleNamespace(id='1', data=f'opcua|rTT102Val|{view}', message=SimpleNamespace(chat=SimpleNamespace(id=CHAT)))
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    store = SessionStore(str(tmp_path / 'sessions.sqlite3'))
+    cache = MediaCache(store)
+    monkeypatch.setattr(chat_handlers, 'media_cache', cache)
+    yield cache
+    store.close()
+
+@pytest.mark.parametrize('error_class', [apihelper.ApiTelegramException, asyncio_helper.ApiTelegramException])
+def test_stale_file_id_is_uploaded_again(media, error_class):
+    media.store.set_media_file_id('qr:x', 'old')
+    stale = error_class('sendPhoto', None, {'error_code': 400, 'description': 'Bad Request: wrong file identifier'})
+    bot = FakeBot(fail=stale)
+    chat_handlers.run(bot, chat_handlers.send_cached_photo(CHAT, 'qr:x', lambda: b'png'))
+    assert bot.calls == [('send_photo', 'old'), ('send_photo', b'png')]
+    assert media.file_id('qr:x') == 'id-2'
+
+def test_other_errors_reach_the_caller(media):
+    media.store.set_media_file_id('qr:x', 'old')
+    bot = FakeBot(fail=apihelper.ApiTelegramException('sendPhoto', None, {'error_code': 403, 'description': 'Forbidden'}))
+    with pytest.raises(apihelper.ApiTelegramException):
+        chat_handlers.run(bot, chat_handlers.send_cached_photo(CHAT, 'qr:x', lambda: b'png'))
+
+def test_graph_is_uploaded_once(monkeypatch):
+    renders = []
+    monkeypatch.setattr(chat_handlers, 'create_graph_png', lambda *args, **kwargs: renders.append(args) or b'png')
+    df = pd.DataFrame({'_time': pd.date_range('2026-10-17 09:00', periods=3, freq='1min', tz='UTC'),
+                       '_value': [1.0, 2.0, 3.5]})
+    monkeypatch.setattr(chat_handlers, 'fetch_data', lambda category, metric: df.copy())
+    bot = FakeBot()
+    chat_handlers.run(bot, chat_handlers.handle_query(data_call('graph')))
+    chat_handlers.run(bot, chat_handlers.handle_query(data_call('graph')))
+    assert len(renders) == 1
+    assert [photo for _, photo in bot.calls] == [b'png', 'id-1']
+
+def test_data_view_reads_only_the_latest_point(monkeypatch):
+    latest = pd.DataFrame({'_time': [pd.Timestamp('2026-10-17 09:00', tz='UTC')], '_value': [4.5]})
+    monkeypatch.setattr(chat_handlers, 'fetch_latest', lambda category, metric: latest)
+    monkeypatch.setattr(chat_handlers, 'fetch_data', lambda *args, **kwargs: pytest.fail("fetched the whole range"))
+    bot = FakeBot()
+    chat_handlers.run(bot, chat_handlers.handle_query(data_call('data')))
+    assert bot.calls == [('send_message', "📊 Latest rTT102Val Data:\nTimestamp: 2026-10-17 09:00:00+00:00\nValue: 4.5")]
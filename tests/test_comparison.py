@@ -0,0 +1,81 @@
+# test_comparison.py
+
+from types import SimpleNamespace
+import pandas as pd
+import pytest
+import chat_handlers
+from comparison import ComparisonSelection, comparison_graph, parse_compare_command
+from data_handler import align_frames
+from metric_registry import registry
+
+T0 = pd.Timestamp('2026-10-17 10:00', tz='UTC')
+
+def frame(seconds, values):
+    return pd.DataFrame({'_time': [T0 + pd.Timedelta(seconds=s) for s in seconds], '_value': values})
+
+def test_align_frames_shares_one_time_index():
+    a = frame([0, 60, 120, 180], [1.0, 2.0, 3.0, 4.0])
+    b = frame([13, 130], [10.0, 20.0])
+    aligned = align_frames({'a': a, 'b': b, 'c': None}, '1m')
+    assert list(aligned) == ['a', 'b', 'c']
+    # b starts at the end of its first window and carries its value forward
+    assert aligned['b']['_time'].tolist() == [T0 + pd.Timedelta(minutes=m) for m in (1, 2, 3)]
+    assert aligned['b']['_value'].tolist() == [10.0, 10.0, 20.0]
+    assert aligned['a']['_time'].tolist()[-3:] == aligned['b']['_time'].tolist()
+    assert aligned['c'].empty
+
+def test_align_frames_does_not_fill_past_the_limit():
+    a = frame([60 * m for m in range(10)], [float(m) for m in range(10)])
+    stopped = frame([0, 60], [5.0, 6.0])
+    aligned = align_frames({'a': a, 'stopped': stopped}, '1m', fill=2)
+    # Carried over two windows, then the line ends
+    assert aligned['stopped']['_time'].tolist() == [T0 + pd.Timedelta(minutes=m) for m in range(4)]
+    assert aligned['stopped']['_value'].tolist() == [5.0, 6.0, 6.0, 6.0]
+    assert len(aligned['a']) == 10
+
+def test_align_frames_keeps_the_last_point_of_each_window():
+    aligned = align_frames({'a': frame([1, 20, 59], [1.0, 2.0, 3.0])}, '1m')
+    assert aligned['a']['_value'].tolist() == [3.0]
+
+def test_comparison_graph():
+    aligned = {('opcua', 'A'): frame([60], [1.0]), ('opcua', 'B'): frame([60], [2.0]),
+               ('opcua', 'C'): pd.DataFrame(columns=['_time', '_value'])}
+    graph, caption = comparison_graph(aligned, '-24h')
+    assert graph['metric_name'] == 'A'
+    assert [name for _, name in graph['additional_metrics']] == ['B']
+    assert 'No data: C' in caption
+    assert comparison_graph({('opcua', 'C'): pd.DataFrame(columns=['_time', '_value'])}, '-1h') is None
+
+def test_parse_compare_command():
+    assert parse_compare_command('/compare') == '-1h'
+    assert parse_compare_command('/compare 24h') == '-24h'
+    assert parse_compare_command('/compare clear') is None
+    for text in ('/compare soon', '/compare 0h', '/compare 1h 2h'):
+        with pytest.raises(ValueError):
+            parse_compare_command(text)
+
+def test_selection_toggles_and_is_bounded():
+    selection = ComparisonSelection(limit=2)
+    assert selection.toggle(1, 'a') == (True, 1)
+    assert selection.toggle(1, 'b') == (True, 2)
+    with pytest.raises(ValueError):
+        selection.toggle(1, 'c')
+    assert selection.toggle(1, 'a') == (False, 1)
+    assert selection.get(1) == ('b',)
+
+@pytest.mark.parametrize('data', ['m|x|y|c', 'm|x|c'])
+def test_malformed_compare_callbacks_are_answered(data):
+    answers = []
+    bot = SimpleNamespace(answer_callback_query=lambda *args, **kwargs: answers.append(args))
+    call = SimpleNamespace(id='1', data=data, message=SimpleNamespace(chat=SimpleNamespace(id=5)))
+    chat_handlers.run(bot, chat_handlers.handle_compare_pick(call))
+    assert len(answers) == 1
+
+def test_compare_callback_adds_the_metric():
+    answers = []
+    bot = SimpleNamespace(answer_callback_query=lambda *args, **kwargs: answers.append(args))
+    metric_id = registry.id_of('opcua', 'rTT102Val')
+    call = SimpleNamespace(id='1', data=f'm|{metric_id}|c', message=SimpleNamespace(chat=SimpleNamespace(id=6)))
+    chat_handlers.run(bot, chat_handlers.handle_compare_pick(call))
+    assert 'rTT102Val added' in answers[0][1]
+    assert chat_handlers.comparison_selection.get(6) == (('opcua', 'rTT102Val'),)
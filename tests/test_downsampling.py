@@ -0,0 +1,64 @@
+# test_downsampling.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from graph_utils import lttb_indices, minmax_indices, downsample_frame
+from data_handler import choose_window
+
+def series(n, spike_at=None):
+    x = np.arange(n, dtype=np.int64) * 10**9
+    y = np.sin(np.linspace(0, 20, n))
+    if spike_at is not None:
+        y[spike_at] = 50.0
+    return x, y
+
+def test_lttb_keeps_threshold_points_and_the_ends():
+    x, y = series(1000)
+    indices = lttb_indices(x, y, 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+
+def test_lttb_keeps_a_spike():
+    x, y = series(1000, spike_at=437)
+    assert 437 in lttb_indices(x, y, 50)
+
+def test_small_inputs_are_kept_whole():
+    x, y = series(10)
+    assert list(lttb_indices(x, y, 10)) == list(range(10))
+    assert list(lttb_indices(x, y, 2)) == list(range(10))
+    assert list(minmax_indices(y, 20)) == list(range(10))
+
+def test_minmax_keeps_every_bucket_extreme():
+    _, y = series(1001, spike_at=500)
+    y[700] = -50.0
+    indices = minmax_indices(y, 40)
+    assert {0, 500, 700, 1000} <= set(indices)
+    assert len(indices) <= 40 + 2
+    assert np.all(np.diff(indices) > 0)
+
+def frame(n):
+    return pd.DataFrame({'_time': pd.date_range('2024-01-01', periods=n, freq='s', tz='UTC'),
+                         '_value': np.arange(n, dtype=float)})
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_downsample_frame(method):
+    df = frame(5000)
+    small = downsample_frame(df, max_points=200, method=method)
+    assert len(small) <= 202
+    assert small['_time'].is_monotonic_increasing
+    assert small['_value'].iloc[0] == 0.0 and small['_value'].iloc[-1] == 4999.0
+    assert len(df) == 5000
+
+def test_downsample_frame_passthrough_and_errors():
+    df = frame(100)
+    assert downsample_frame(df, max_points=200, method='lttb') is df
+    assert downsample_frame(frame(500), max_points=200, method=None).shape[0] == 500
+    with pytest.raises(ValueError):
+        downsample_frame(frame(500), max_points=200, method='mean')
+
+def test_choose_window():
+    assert choose_window('-1h', target_points=100) == '1m'
+    assert choose_window('-24h', target_points=100) == '15m'
+    assert choose_window('-30d', target_points=10) == '1d'
@@ -0,0 +1,187 @@
+# test_influx_pool.py
+
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+from influxdb_client.rest import ApiException
+from influx_pool import InfluxPool, CircuitBreaker, CircuitOpenError
+
+# query_data_frame warns about every query without pivot()
+pytestmark = pytest.mark.filterwarnings('ignore::influxdb_client.client.warnings.MissingPivotFunction')
+
+CSV = (
+    "#datatype,string,long,dateTime:RFC3339,double,string,string\r\n"
+    "#group,false,false,false,false,true,true\r\n"
+    "#default,_result,,,,,\r\n"
+    ",result,table,_time,_value,_measurement,metric\r\n"
+    ",,0,2024-01-01T00:00:00Z,1.5,opcua,rTT102Val\r\n"
+    ",,0,2024-01-01T00:00:01Z,2.5,opcua,rTT102Val\r\n"
+    "\r\n"
+)
+
+class FakeInflux:
+    """
+    Answers /api/v2/query with the next status of `statuses`, then 200 with CSV.
+    """
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.delay = 0
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                fake.requests.append((self.path, self.rfile.read(int(self.headers.get('Content-Length') or 0))))
+                status = fake.statuses.pop(0) if fake.statuses else 200
+                time.sleep(fake.delay)
+                body = (CSV if status == 200 else '{"code":"unavailable","message":"busy"}').encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/csv' if status == 200 else 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def influx():
+    fake = FakeInflux()
+    yield fake
+    fake.close()
+
+def make_pool(influx, **kwargs):
+    kwargs.setdefault('backoff_base', 0.001)
+    kwargs.setdefault('backoff_max', 0.001)
+    return InfluxPool(url=influx.url, token='token', org='org', pool_size=2, **kwargs)
+
+def test_attempt_timeout_is_applied(influx):
+    influx.delay = 1.0
+    pool = make_pool(influx, max_retries=0)
+    try:
+        started = time.monotonic()
+        with pytest.raises(Exception) as error:
+            pool.query_series('q', timeout=0.2)
+        assert time.monotonic() - started < 0.9
+        assert 'timed out' in str(error.value).lower()
+    finally:
+        pool.close()
+
+def test_each_slot_has_its_own_client(influx):
+    pool = make_pool(influx)
+    clients = [pool._clients.get() for _ in range(pool.pool_size)]
+    try:
+        assert len({id(client) for client, _ in clients}) == pool.pool_size
+        with pytest.raises(TimeoutError):
+            pool.query_series('q', timeout=0.05)  # every client is borrowed
+    finally:
+        for slot in clients:
+            pool._clients.put(slot)
+        pool.close()
+
+def test_query_data_frame_and_series(influx):
+    pool = make_pool(influx)
+    try:
+        frame = pool.query_data_frame('from(bucket: "b") |> range(start: -1h)')
+        assert list(frame['_value']) == [1.5, 2.5]
+        assert set(frame['metric']) == {'rTT102Val'}
+        series = pool.query_series('from(bucket: "b") |> range(start: -1h)', params={'m': 'x'})
+        assert list(series['_value']) == [1.5, 2.5]
+        assert all(path.startswith('/api/v2/query?org=org') for path, _ in influx.requests)
+        # Flux parameters are sent as an 'extern' option statement
+        body = json.loads(influx.requests[1][1])
+        assignment = body['extern']['body'][0]['assignment']
+        assert (assignment['id']['name'], assignment['init']['value']) == ('m', 'x')
+        assert pool.stats()['queries'] == 2
+    finally:
+        pool.close()
+
+def test_transient_errors_are_retried(influx):
+    influx.statuses = [503, 502]
+    pool = make_pool(influx, max_retries=3)
+    try:
+        assert len(pool.query_series('q')) == 2
+        stats = pool.stats()
+        assert (stats['retries'], stats['failures'], stats['breaker']) == (2, 2, 'closed')
+    finally:
+        pool.close()
+
+def test_bad_query_is_not_retried(influx):
+    influx.statuses = [400]
+    pool = make_pool(influx, max_retries=3)
+    try:
+        with pytest.raises(ApiException):
+            pool.query_series('q')
+        assert len(influx.requests) == 1
+        assert pool.stats()['retries'] == 0
+    finally:
+        pool.close()
+
+def test_retries_give_up(influx):
+    influx.statuses = [503] * 3
+    pool = make_pool(influx, max_retries=2)
+    try:
+        with pytest.raises(ApiException):
+            pool.query_series('q')
+        assert len(influx.requests) == 3
+    finally:
+        pool.close()
+
+def test_breaker_opens_and_fails_fast(influx):
+    influx.statuses = [503] * 2
+    pool = make_pool(influx, max_retries=0, breaker=CircuitBreaker(threshold=2, reset_timeout=60))
+    try:
+        for _ in range(2):
+            with pytest.raises(ApiException):
+                pool.query_series('q')
+        with pytest.raises(CircuitOpenError):
+            pool.query_series('q')
+        assert len(influx.requests) == 2
+        assert pool.stats()['breaker'] == 'open'
+        assert pool.stats()['breaker_rejected'] == 1
+    finally:
+        pool.close()
+
+def test_breaker_half_open_trial(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('influx_pool.time.monotonic', lambda: now[0])
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+    breaker.failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    now[0] += 10
+    breaker.allow()  # the trial call
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # only one at a time
+    breaker.failure()
+    assert breaker.state == 'open'
+    now[0] += 10
+    breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed'
+    breaker.allow()
+
+def test_deadline_bounds_the_query(influx):
+    pool = make_pool(influx)
+    try:
+        with pool.deadline(0):
+            with pytest.raises(TimeoutError):
+                pool.query_series('q')
+        assert influx.requests == []
+    finally:
+        pool.close()
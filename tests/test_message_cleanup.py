@@ -0,0 +1,141 @@
+# test_message_cleanup.py
+
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from telebot import TeleBot, apihelper, asyncio_helper
+import async_runtime
+import chat_handlers
+from fake_bot_api import FakeBotApi
+from message_cleanup import MessageDeleter, DeletionJob
+from session_store import SessionStore
+
+CHAT = 1
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(str(tmp_path / 'sessions.sqlite3'))
+    yield store
+    store.close()
+
+def fake_api(monkeypatch, batch):
+    api = FakeBotApi(batch=batch)
+    monkeypatch.setattr(apihelper, 'API_URL', api.url)
+    monkeypatch.setattr(asyncio_helper, 'API_URL', api.url)
+    return api
+
+def send(api, store, count):
+    # Seeded on the fake server directly; sending them one by one is slow
+    ids = list(range(1, count + 1))
+    api.messages[CHAT] = set(ids)
+    for message_id in ids:
+        store.record_message(CHAT, message_id)
+    return TeleBot('123456:test', threaded=False), ids
+
+def delete(bot, store, ids, batch_size=100):
+    deleter = MessageDeleter(bot, store=store, batch_size=batch_size, workers=4, rate=1000, progress_interval=0.1)
+    job = deleter.submit(CHAT, ids)
+    assert job.wait(10)
+    return deleter, job
+
+def test_batches_are_counted_as_requested(monkeypatch, store):
+    api = fake_api(monkeypatch, batch=True)
+    try:
+        bot, ids = send(api, store, 250)
+        deleter, job = delete(bot, store, ids)
+        assert api.calls['deleteMessages'] == 3
+        assert 'deleteMessage' not in api.calls
+        assert api.messages[CHAT] == set()
+        assert (job.deleted, job.requested, job.failed, job.processed) == (0, 250, 0, 250)
+        assert job.summary() == "deletion requested for 250 messages"
+        assert deleter.batch_supported is True
+    finally:
+        api.close()
+
+def test_falls_back_to_single_deletes(monkeypatch, store):
+    api = fake_api(monkeypatch, batch=False)
+    try:
+        bot, ids = send(api, store, 30)
+        bot.delete_message(CHAT, ids[0])
+        deleter, job = delete(bot, store, ids, batch_size=10)
+        assert deleter.batch_supported is False
+        assert job.method == 'single'
+        assert api.calls['deleteMessage'] == 31
+        assert api.messages[CHAT] == set()
+        assert (job.deleted, job.requested, job.failed) == (29, 0, 1)
+        assert job.summary() == "29 messages deleted, 1 already gone or too old"
+    finally:
+        api.close()
+
+def test_fallback_partway_does_not_count_twice(monkeypatch, store):
+    api = fake_api(monkeypatch, batch=True)
+    try:
+        bot, ids = send(api, store, 30)
+        batch_delete = bot.delete_messages
+
+        def delete_messages(chat_id, message_ids):
+            # The server stops offering deleteMessages after the first batch
+            result = batch_delete(chat_id, message_ids)
+            api.batch = False
+            return result
+
+        bot.delete_messages = delete_messages
+        deleter = MessageDeleter(bot, store=store, batch_size=10, workers=1, rate=1000, progress_interval=0.1)
+        job = deleter.submit(CHAT, ids)
+        assert job.wait(10)
+        assert deleter.batch_supported is False
+        assert job.processed == job.total == 30
+        # The first batch is gone already; its ids are found missing one by one
+        assert (job.deleted, job.requested, job.failed) == (20, 0, 10)
+        assert api.messages[CHAT] == set()
+    finally:
+        api.close()
+
+def test_tracked_ids_are_pruned(monkeypatch, store):
+    api = fake_api(monkeypatch, batch=True)
+    try:
+        bot, ids = send(api, store, 5)
+        store.record_message(2, 99)
+        assert store.chat_messages(CHAT) == ids
+        delete(bot, store, ids)
+        assert store.chat_messages(CHAT) == []
+        assert store.chat_messages(2) == [99]
+    finally:
+        api.close()
+
+def test_empty_job_summary():
+    assert DeletionJob(CHAT, []).summary() == "0 messages deleted"
+
+@pytest.mark.parametrize('batch', [True, False])
+def test_async_delete_chat_uses_the_deleter(monkeypatch, tmp_path, store, batch):
+    monkeypatch.chdir(tmp_path)
+    api = fake_api(monkeypatch, batch=batch)
+    runtime = async_runtime.AsyncRuntime(token='123456:test')
+    monkeypatch.setattr(chat_handlers, 'session_store', store)
+    runtime.bot.store = runtime.deleter.store = store
+    try:
+        _, ids = send(api, store, 150)
+        api._next_id = 1000
+        message = SimpleNamespace(chat=SimpleNamespace(id=CHAT), message_id=ids[-1])
+
+        async def run():
+            try:
+                await runtime.drive(chat_handlers.handle_delete_chat(message, runtime.deleter))
+            finally:
+                await asyncio_helper.session_manager.session.close()
+
+        asyncio.run(run())
+        job = runtime.deleter.running(CHAT)
+        assert job is None or job.wait(10)
+        # The result replaces the status message once the job is over
+        deadline = time.monotonic() + 10
+        while 'editMessageText' not in api.calls and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert api.calls['editMessageText'] >= 1
+        assert api.messages[CHAT] == {1000}
+        assert store.chat_messages(CHAT) == [1000]
+        assert runtime.deleter.batch_supported is batch
+    finally:
+        runtime.executor.shutdown(wait=True)
+        api.close()
@@ -0,0 +1,97 @@
+# test_notifier.py
+
+import threading
+import time
+import pytest
+from telebot.apihelper import ApiTelegramException
+from notifier import MessageDispatcher, TokenBucket
+
+class FakeBot:
+    def __init__(self, failures=None):
+        self.sent = []
+        self.failures = dict(failures or {})  # text -> error codes to raise first
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self._lock:
+            codes = self.failures.get(text)
+            if codes:
+                code = codes.pop(0)
+                raise ApiTelegramException('sendMessage', None, {'error_code': code, 'description': 'Bad Gateway'})
+            self.sent.append((chat_id, text))
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(MessageDispatcher, '_backoff', staticmethod(lambda attempt: 0.05))
+
+def test_busy_chat_does_not_hold_the_workers():
+    bot = FakeBot()
+    dispatcher = MessageDispatcher(bot, workers=1, global_rate=100, chat_rate=1, chat_burst=1)
+    for i in range(5):
+        dispatcher.enqueue(1, f"a{i}")
+    dispatcher.enqueue(2, "b")
+    wait_for(lambda: (2, "b") in bot.sent, timeout=0.5)
+    # Chat 1 gets one message per second; the rest wait without a worker
+    assert [text for chat, text in bot.sent if chat == 1] == ["a0"]
+    assert dispatcher.stats()['deferred'] >= 1
+
+def test_retry_keeps_the_chat_order():
+    bot = FakeBot(failures={"first": [502, 502]})
+    dispatcher = MessageDispatcher(bot, workers=4, global_rate=100, chat_rate=100, chat_burst=100)
+    dispatcher.enqueue(1, "first")
+    dispatcher.enqueue(1, "second")
+    dispatcher.enqueue(2, "other")
+    wait_for(lambda: len(bot.sent) == 3)
+    assert [text for chat, text in bot.sent if chat == 1] == ["first", "second"]
+    stats = dispatcher.stats()
+    assert (stats['retried'], stats['failed'], stats['queued']) == (2, 0, 0)
+
+def test_permanent_error_moves_on():
+    bot = FakeBot(failures={"bad": [400]})
+    dispatcher = MessageDispatcher(bot, workers=2, global_rate=100, chat_rate=100, chat_burst=100)
+    dispatcher.enqueue(1, "bad")
+    dispatcher.enqueue(1, "good")
+    wait_for(lambda: bot.sent == [(1, "good")])
+    assert dispatcher.stats()['failed'] == 1
+
+def test_waiting_messages_are_coalesced():
+    bot = FakeBot()
+    dispatcher = MessageDispatcher(bot, workers=1, global_rate=100, chat_rate=1, chat_burst=1)
+    dispatcher.enqueue(1, "first")
+    wait_for(lambda: bot.sent == [(1, "first")])
+    dispatcher.enqueue(1, "alert on", coalesce_key=('alert', 7))
+    dispatcher.enqueue(1, "alert still on", coalesce_key=('alert', 7))
+    assert dispatcher.stats()['coalesced'] == 1
+    wait_for(lambda: len(bot.sent) == 2, timeout=3)
+    assert bot.sent[1] == (1, "alert still on")
+
+def test_full_queue_drops():
+    dispatcher = MessageDispatcher(FakeBot(), workers=1, queue_size=2, global_rate=100, chat_rate=0.001, chat_burst=1)
+    results = [dispatcher.enqueue(1, str(i)) for i in range(4)]
+    # The first one may already be sent, which frees its slot
+    assert results.count(False) >= 1
+    assert dispatcher.stats()['dropped'] == results.count(False)
+
+def test_idle_chat_buckets_are_dropped():
+    bot = FakeBot()
+    dispatcher = MessageDispatcher(bot, workers=2, global_rate=100, chat_rate=100, chat_burst=1, sweep_interval=0)
+    for chat_id in range(10):
+        dispatcher.enqueue(chat_id, "hello")
+    wait_for(lambda: len(bot.sent) == 10)
+    time.sleep(0.05)  # the buckets refill
+    dispatcher.enqueue(99, "sweep")
+    wait_for(lambda: len(bot.sent) == 11)
+    assert dispatcher.stats()['chat_buckets'] <= 1
+
+def test_token_bucket_try_take_does_not_reserve():
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.try_take() == 0
+    assert bucket.try_take() > 0.9
+    assert bucket.wait_time() > 0.9  # a refused try_take takes nothing
+    assert not bucket.is_full()
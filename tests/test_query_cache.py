@@ -0,0 +1,112 @@
+# test_query_cache.py
+
+import threading
+import time
+import pytest
+from query_cache import QueryCache
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('query_cache.time.monotonic', lambda: now[0])
+    return now
+
+def test_hit_until_the_ttl_runs_out(clock):
+    cache = QueryCache()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return len(loads)
+
+    assert cache.get_or_load('k', loader, ttl=10) == 1
+    clock[0] += 9.9
+    assert cache.get_or_load('k', loader, ttl=10) == 1
+    clock[0] += 0.1
+    assert cache.get_or_load('k', loader, ttl=10) == 2
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 1)
+
+def test_zero_ttl_is_not_stored(clock):
+    cache = QueryCache()
+    cache.get_or_load('k', lambda: 1, ttl=0)
+    assert cache.stats()['entries'] == 0
+
+def test_least_recently_used_is_evicted(clock):
+    cache = QueryCache(max_entries=2)
+    cache.get_or_load('a', lambda: 'a', ttl=60)
+    cache.get_or_load('b', lambda: 'b', ttl=60)
+    cache.get_or_load('a', lambda: 'a2', ttl=60)  # 'a' is now the most recent
+    cache.get_or_load('c', lambda: 'c', ttl=60)
+    assert cache.get_or_load('a', lambda: 'reloaded', ttl=60) == 'a'
+    assert cache.get_or_load('b', lambda: 'reloaded', ttl=60) == 'reloaded'
+    assert cache.stats()['evictions'] == 2
+
+def test_byte_bound(clock):
+    cache = QueryCache(max_bytes=10, sizeof=len)
+    cache.get_or_load('a', lambda: 'x' * 6, ttl=60)
+    cache.get_or_load('b', lambda: 'y' * 6, ttl=60)
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (1, 6, 1)
+
+def test_concurrent_misses_run_one_loader():
+    cache = QueryCache()
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'value'
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(cache.get_or_load('k', loader, ttl=60)))
+    owner.start()
+    assert started.wait(5)
+    waiters = [threading.Thread(target=lambda: results.append(cache.get_or_load('k', loader, ttl=60)))
+               for _ in range(4)]
+    for thread in waiters:
+        thread.start()
+    wait_for(lambda: cache.stats()['coalesced'] == 4)
+    release.set()
+    for thread in [owner] + waiters:
+        thread.join(5)
+    assert calls == [1]
+    assert results == ['value'] * 5
+
+def test_loader_error_reaches_waiters_and_is_not_cached():
+    cache = QueryCache()
+    release = threading.Event()
+    started = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("down")
+
+    def call():
+        try:
+            cache.get_or_load('k', failing, ttl=60)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    owner = threading.Thread(target=call)
+    owner.start()
+    assert started.wait(5)
+    waiter = threading.Thread(target=call)
+    waiter.start()
+    wait_for(lambda: cache.stats()['coalesced'] == 1)
+    release.set()
+    owner.join(5)
+    waiter.join(5)
+    assert errors == ["down", "down"]
+    assert cache.get_or_load('k', lambda: 'ok', ttl=60) == 'ok'
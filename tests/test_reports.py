@@ -0,0 +1,52 @@
+# test_reports.py
+
+import pandas as pd
+import pytest
+import report_generator
+from data_handler import STAT_COLUMNS
+from metric_registry import fixed_metrics
+from query_cache import QueryCache
+from report_scheduler import ReportScheduler
+from report_store import ReportStore
+
+def stats():
+    keys = [(category, metric) for category, metrics in fixed_metrics.items() for metric in metrics]
+    return pd.DataFrame([[1.0, 2.0, 0.5, 1.5]] * len(keys), columns=STAT_COLUMNS,
+                        index=pd.MultiIndex.from_tuples(keys))
+
+def unreachable(*args, **kwargs):
+    raise ConnectionError("InfluxDB unreachable")
+
+@pytest.fixture
+def store(tmp_path):
+    return ReportStore(str(tmp_path / 'reports.sqlite3'))
+
+def test_report_from_stats():
+    text, pdf, filename = report_generator.generate_daily_report(stats())
+    assert "| 1.00 | 2.00 | 0.50 | 1.50 |" in text
+    assert "Error" not in text
+    assert pdf.startswith(b'%PDF') and filename.endswith('.pdf')
+
+def test_failed_fetch_raises(monkeypatch):
+    monkeypatch.setattr(report_generator, 'fetch_stats', unreachable)
+    with pytest.raises(ConnectionError):
+        report_generator.generate_daily_report()
+
+def test_failed_build_keeps_the_previous_snapshot(monkeypatch, store):
+    scheduler = ReportScheduler(store=store)
+    good = scheduler.run_once('rolling', lambda: report_generator.generate_daily_report(stats()))
+    assert good is not None
+    monkeypatch.setattr(report_generator, 'fetch_stats', unreachable)
+    assert scheduler.run_once('rolling', report_generator.generate_daily_report) is None
+    assert store.latest().version == good.version
+    assert (scheduler.builds, scheduler.failures) == (1, 1)
+
+def test_failed_build_is_not_cached(monkeypatch, store):
+    monkeypatch.setattr(report_generator, 'report_store', store)
+    monkeypatch.setattr(report_generator, 'report_cache', QueryCache(max_entries=4))
+    monkeypatch.setattr(report_generator, 'fetch_stats', unreachable)
+    with pytest.raises(ConnectionError):
+        report_generator.get_daily_report()
+    monkeypatch.setattr(report_generator, 'fetch_stats', lambda *args, **kwargs: stats())
+    text, _, _ = report_generator.get_daily_report()
+    assert "Error" not in text
@@ -0,0 +1,78 @@
+# test_series_store.py
+
+import time
+import numpy as np
+import pandas as pd
+from series_store import RingBuffer, SeriesStore, aggregate_last
+
+KEY = ('opcua', 'rTT102Val')
+S = 10**9
+
+def test_ring_buffer_wraps_in_time_order():
+    buffer = RingBuffer(4)
+    assert buffer.append([1, 2, 3], [1.0, 2.0, 3.0]) == 3
+    assert buffer.append([2, 3, 4, 5, 6], [0, 0, 4.0, 5.0, 6.0]) == 3  # 2 and 3 are already stored
+    times, values = buffer.since(0)
+    assert list(times) == [3, 4, 5, 6]
+    assert list(values) == [3.0, 4.0, 5.0, 6.0]
+    assert (buffer.oldest(), buffer.newest()) == (3, 6)
+    assert list(buffer.since(5)[0]) == [5, 6]
+
+def test_ring_buffer_reopens_its_file(tmp_path):
+    path = str(tmp_path / 'series.npy')
+    buffer = RingBuffer(3, path)
+    buffer.append([10, 20, 30, 40], [1.0, 2.0, 3.0, 4.0])
+    buffer.flush()
+    del buffer
+    reopened = RingBuffer(3, path)
+    assert list(reopened.since(0)[0]) == [20, 30, 40]
+    assert reopened.covered_since == 20
+
+def test_aggregate_last_keeps_the_last_point_per_window():
+    times = np.array([1, 4, 11, 19, 21]) * S
+    values = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+    stamped, kept = aggregate_last(times, values, 10 * S, 25 * S)
+    assert list(stamped) == [10 * S, 20 * S, 25 * S]
+    assert list(kept) == [2.0, 4.0, 5.0]
+
+def frame(times_ns, values):
+    return pd.DataFrame({'_time': pd.to_datetime(times_ns, utc=True), '_value': values})
+
+def backfilled_store(seconds, capacity=1000):
+    now = time.time_ns()
+    store = SeriesStore(capacity=capacity, directory=None, max_lag=60)
+    store.track(*KEY)
+    cursors = store.cursors()
+    assert cursors == {KEY: None}
+    read_from = now - seconds * S
+    times = [read_from + i * S for i in range(seconds)]
+    store.sync(cursors, {KEY: frame(times, [float(i) for i in range(seconds)])}, now, now, read_from=read_from)
+    return store
+
+def test_window_served_inside_the_backfill():
+    store = backfilled_store(600)
+    df = store.window(*KEY, period_seconds=300, window_seconds=60)
+    assert df is not None and 5 <= len(df) <= 6
+    assert df['_value'].iloc[-1] == 599.0
+    assert store.stats()['hits'] == 1
+
+def test_window_beyond_the_coverage_is_a_miss():
+    store = backfilled_store(600)
+    assert store.window(*KEY, period_seconds=3600, window_seconds=60) is None
+    assert store.window('opcua', 'untracked', period_seconds=60, window_seconds=10) is None
+    assert store.stats()['misses'] == 2
+
+def test_stale_store_is_a_miss():
+    store = backfilled_store(600)
+    store.synced_at -= 120 * S
+    assert store.window(*KEY, period_seconds=60, window_seconds=10) is None
+
+def test_wrapped_ring_shrinks_the_coverage():
+    store = backfilled_store(600, capacity=100)
+    assert store.window(*KEY, period_seconds=300, window_seconds=60) is None
+    assert store.window(*KEY, period_seconds=60, window_seconds=10) is not None
+
+def test_unsynced_store_is_a_miss():
+    store = SeriesStore(capacity=10, directory=None)
+    store.track(*KEY)
+    assert store.window(*KEY, period_seconds=60, window_seconds=10) is None
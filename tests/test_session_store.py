@@ -0,0 +1,65 @@
+# test_session_store.py
+
+import os
+import sqlite3
+import subprocess
+import sys
+from session_store import SessionStore
+
+RULE = ('opcua', 'udiRiempitrice1Cnt', 'change', None, 0.0, 0.0, -1)
+LEVEL_RULE = ('opcua', 'rTT102Val', 'above', 90.0, 2.0, 60.0, -1)
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite3')
+    store = SessionStore(path, flush_interval=0)
+    store.authorize(1)
+    store.authorize(2)
+    store.revoke(2)
+    assert store.toggle_monitoring(1) is True
+    store.add_alert(1, RULE)
+    store.add_alert(1, LEVEL_RULE)
+    store.record_message(1, 10)
+    store.set_media_file_id('file:welcome', 'F1')
+    store.close()
+
+    store = SessionStore(path)
+    assert store.authorized() == {1}
+    assert store.monitoring_chats() == {1}
+    assert store.alerts() == {1: {RULE, LEVEL_RULE}}
+    assert store.chat_messages(1) == [10]
+    assert store.media_file_id('file:welcome') == 'F1'
+    store.remove_alerts(1)
+    store.close()
+    assert SessionStore(path).alerts() == {}
+
+def test_rules_without_level_are_stored_once(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite3')
+    # Two stores adding the same rule, as after a restart with writes still pending
+    for _ in range(2):
+        store = SessionStore(path)
+        store._connect()
+        store._alerts = {}
+        store.add_alert(1, RULE)
+        store.close()
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT count(*) FROM alert_subscriptions").fetchone() == (1,)
+
+def test_duplicates_from_older_files_are_dropped(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite3')
+    with sqlite3.connect(path) as connection:
+        connection.execute("""CREATE TABLE alert_subscriptions (
+            chat_id INTEGER NOT NULL, category TEXT NOT NULL, metric TEXT NOT NULL, kind TEXT NOT NULL,
+            level REAL, hysteresis REAL NOT NULL, delay REAL NOT NULL, bits INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, category, metric, kind, level, hysteresis, delay, bits))""")
+        connection.executemany("INSERT INTO alert_subscriptions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(1, *RULE)] * 3)
+    store = SessionStore(path)
+    assert store.alerts() == {1: {RULE}}
+    store.close()
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT count(*) FROM alert_subscriptions").fetchone() == (1,)
+
+def test_importing_the_handlers_has_no_side_effects(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = f"import sys; sys.path.insert(0, {root!r}); import bot_handlers, monitoring"
+    subprocess.run([sys.executable, '-c', code], cwd=tmp_path, check=True, timeout=120)
+    assert list(tmp_path.iterdir()) == []
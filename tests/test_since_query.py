@@ -0,0 +1,58 @@
+# test_since_query.py
+
+import pandas as pd
+from query_builder import since_query, since_starts
+from data_handler import since_frames
+from series_store import SeriesStore, SeriesPoller
+
+NOW = pd.Timestamp('2026-10-17 12:00', tz='UTC')
+A = ('opcua', 'rTT102Val')
+B = ('opcua', 'rTT102Set')
+
+def test_each_series_starts_at_its_own_cursor():
+    starts = since_starts({A: NOW - pd.Timedelta('10s'), B: NOW - pd.Timedelta('30s')}, now=NOW)
+    assert starts == {A: NOW - pd.Timedelta('10s'), B: NOW - pd.Timedelta('30s')}
+
+def test_series_without_cursor_does_not_move_the_others():
+    cursor = NOW - pd.Timedelta('10m')
+    query, params = since_query({A: cursor, B: None}, lookback='-1m', now=NOW)
+    # The older cursor is still read in full; the new series only adds its lookback
+    assert pd.Timestamp(params['_start']) == cursor
+    query, params = since_query({A: NOW - pd.Timedelta('5s'), B: None}, lookback='-1m', now=NOW)
+    assert pd.Timestamp(params['_start']) == NOW - pd.Timedelta('1m')
+
+def test_old_cursors_are_capped():
+    stale = NOW - pd.Timedelta('3d')
+    query, params = since_query({A: stale, B: NOW - pd.Timedelta('5s')}, max_lookback='-6h', now=NOW)
+    assert pd.Timestamp(params['_start']) == NOW - pd.Timedelta('6h')
+
+def test_since_frames_drops_points_already_read():
+    times = [NOW - pd.Timedelta(f'{s}s') for s in (30, 20, 10)]
+    result = pd.DataFrame({
+        '_time': times * 2,
+        '_value': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+        '_measurement': 'opcua',
+        'metric': [A[1]] * 3 + [B[1]] * 3,
+    })
+    frames = since_frames(result, {A: times[1], B: None})
+    assert frames[A]['_value'].tolist() == [3.0]
+    assert frames[B]['_value'].tolist() == [4.0, 5.0, 6.0]
+
+def test_poller_backfills_series_left_behind_by_an_outage():
+    store = SeriesStore(capacity=100, directory=None)
+    store.track(*A)
+    calls = []
+
+    def fetch(cursors, lookback, max_lookback):
+        calls.append((dict(cursors), lookback, max_lookback))
+        return {}
+
+    poller = SeriesPoller(store, fetch, interval=5, backfill='-1h')
+    poller.poll()
+    assert calls[0][1:] == ('-1h', '-1h')
+    first = store._buffers[A].covered_since
+    assert first is not None
+    # A cursor older than the backfill leaves a gap: coverage restarts at the floor
+    store._buffers[A].watermark = int((pd.Timestamp.now(tz='UTC') - pd.Timedelta('1d')).value)
+    poller.poll()
+    assert store._buffers[A].covered_since > first
@@ -0,0 +1,112 @@
+import http.client
+import json
+import threading
+import pytest
+from webhook import SECRET_HEADER, WebhookServer
+
+SECRET = 'test-secret'
+
+UPDATE = {
+    'update_id': 100,
+    'message': {
+        'message_id': 7,
+        'date': 1700000000,
+        'chat': {'id': 42, 'type': 'private', 'first_name': 'Test'},
+        'from': {'id': 42, 'is_bot': False, 'first_name': 'Test'},
+        'text': '/start',
+    },
+}
+
+class FakeBot:
+    def __init__(self):
+        self.updates = []
+        self.seen = threading.Event()
+
+    def process_new_updates(self, updates):
+        self.updates.extend(updates)
+        self.seen.set()
+
+def post(server, body, secret=SECRET, headers=None, path=None):
+    host, port = server.address
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    sent = {'Content-Type': 'application/json'}
+    if secret is not None:
+        sent[SECRET_HEADER] = secret
+    sent.update(headers or {})
+    if headers and 'Content-Length' in headers:
+        conn.putrequest('POST', path or server.path)
+        for name, value in sent.items():
+            conn.putheader(name, value)
+        conn.endheaders()
+        conn.send(body)
+    else:
+        conn.request('POST', path or server.path, body=body, headers=sent)
+    status = conn.getresponse().status
+    conn.close()
+    return status
+
+@pytest.fixture
+def server():
+    bot = FakeBot()
+    server = WebhookServer(bot, host='127.0.0.1', port=0, secret=SECRET, batch_wait=0.01)
+    server.start()
+    yield server
+    server.stop()
+
+def test_secret_is_required():
+    with pytest.raises(ValueError):
+        WebhookServer(FakeBot(), host='127.0.0.1', port=0, secret='')
+
+def test_update_is_queued_and_dispatched(server):
+    assert post(server, json.dumps(UPDATE).encode()) == 200
+    assert server.bot.seen.wait(5)
+    assert [update.update_id for update in server.bot.updates] == [100]
+    assert server.bot.updates[0].message.text == '/start'
+    assert server.stats()['received'] == 1
+
+def test_wrong_or_missing_secret_is_forbidden(server):
+    body = json.dumps(UPDATE).encode()
+    assert post(server, body, secret='guess') == 403
+    assert post(server, body, secret=None) == 403
+    assert server.stats()['rejected'] == 2
+    assert server.bot.updates == []
+
+def test_malformed_body_is_rejected(server):
+    assert post(server, b'{not json') == 400
+    assert server.stats()['rejected'] == 1
+
+def test_bad_content_length_is_rejected(server):
+    assert post(server, b'{}', headers={'Content-Length': 'abc'}) == 400
+    assert post(server, b'{}', headers={'Content-Length': '-1'}) == 400
+    assert server.stats()['rejected'] == 2
+
+def test_oversized_body_is_refused_before_reading():
+    bot = FakeBot()
+    server = WebhookServer(bot, host='127.0.0.1', port=0, secret=SECRET, max_body=64)
+    server.start()
+    try:
+        # No body follows these headers; an answer proves the server did not wait to read it
+        assert post(server, b'', headers={'Content-Length': str(10**9)}) == 413
+        body = json.dumps(UPDATE).encode()
+        assert len(body) > 64
+        assert post(server, body) == 413
+        assert server.stats()['rejected'] == 2
+    finally:
+        server.stop()
+
+def test_unauthorized_body_is_not_read(server):
+    assert post(server, b'', secret='guess', headers={'Content-Length': str(10**9)}) == 403
+    assert post(server, b'', headers={'Content-Length': str(10**9)}, path='/other') == 404
+
+def test_full_queue_answers_429():
+    # Not started, so nothing drains the queue
+    server = WebhookServer(FakeBot(), host='127.0.0.1', port=0, secret=SECRET, queue_size=1)
+    try:
+        headers = {SECRET_HEADER: SECRET}
+        body = json.dumps(UPDATE).encode()
+        assert server.receive(server.path, headers, body) == 200
+        assert server.receive(server.path, headers, body) == 429
+        stats = server.stats()
+        assert (stats['received'], stats['dropped'], stats['queued']) == (1, 1, 1)
+    finally:
+        server._server.server_close()
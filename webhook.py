@@ -0,0 +1,201 @@
+# webhook.py
+
+import hmac
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot.types import Update
+from config import (WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+                    WEBHOOK_QUEUE_SIZE, WEBHOOK_BATCH_SIZE, WEBHOOK_BATCH_WAIT, WEBHOOK_MAX_BODY)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class WebhookServer:
+    """
+    Local HTTP endpoint that receives Telegram updates pushed by the webhook.
+
+    Requests are checked against the secret token given to setWebhook, decoded
+    and put on a bounded queue, and answered right away so Telegram never waits
+    on a handler. A dispatch thread drains the queue in batches of up to
+    `batch_size` updates into `bot.process_new_updates`, the same entry point
+    polling uses, so the registered handlers run unchanged.
+
+    A secret is required: handlers trust the chat id of an update, so anyone
+    able to post to the endpoint could otherwise act as an authorized chat.
+    The path and secret are checked before the body is read, and bodies over
+    `max_body` bytes are refused.
+
+    Sessions, alert rules and the monitoring loops are local to the process,
+    so webhook mode serves a single bot process; it cannot be scaled out
+    behind a load balancer.
+    """
+
+    def __init__(self, bot, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                 secret=WEBHOOK_SECRET, queue_size=WEBHOOK_QUEUE_SIZE,
+                 batch_size=WEBHOOK_BATCH_SIZE, batch_wait=WEBHOOK_BATCH_WAIT,
+                 max_body=WEBHOOK_MAX_BODY):
+        if not secret:
+            raise ValueError("Webhook mode needs WEBHOOK_SECRET; set it to a long random string.")
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_body = max_body
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.received = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.dispatched = 0
+        self.batches = 0
+
+    @property
+    def address(self):
+        """
+        (host, port) the server is bound to; useful when started on port 0.
+        """
+        return self._server.server_address[:2]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so Telegram can reuse connections across pushes
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                status = server.authorize(self.path, self.headers) or server.check_length(self.headers)
+                if status is None:
+                    status = server.accept(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+                else:
+                    # The body was not read; drop the connection rather than skip it
+                    self.close_connection = True
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass  # one line per update would flood the log
+
+        return Handler
+
+    def receive(self, path, headers, body):
+        """
+        Validates and queues one webhook request.
+
+        Returns:
+        - int: HTTP status for the response. 404 on another path, 403 on a
+          wrong secret, 413 on a body over max_body, 400 on a malformed body,
+          429 when the queue is full, otherwise 200.
+        """
+        status = self.authorize(path, headers)
+        if status is None and len(body) > self.max_body:
+            self._count('rejected')
+            status = 413
+        return status or self.accept(body)
+
+    def authorize(self, path, headers):
+        """
+        Checks the path and secret of a request; returns an error status, or None if it may go on.
+        """
+        if path != self.path:
+            return 404
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, '').encode(), self.secret.encode()):
+            self._count('rejected')
+            return 403
+        return None
+
+    def check_length(self, headers):
+        """
+        Checks the Content-Length of an authorized request; returns 400 or 413, or None if it may be read.
+        """
+        try:
+            length = int(headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._count('rejected')
+            return 400
+        if length > self.max_body:
+            self._count('rejected')
+            return 413
+        return None
+
+    def accept(self, body):
+        """
+        Decodes and queues the body of an authorized request; returns 400, 429 or 200.
+        """
+        try:
+            update = Update.de_json(json.loads(body))
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"Rejected malformed update: {e}")
+            self._count('rejected')
+            return 400
+        try:
+            self._queue.put_nowait(update)
+        except queue.Full:
+            # Telegram redelivers updates that were not answered with 2xx
+            self._count('dropped')
+            return 429
+        self._count('received')
+        return 200
+
+    def _count(self, counter, n=1):
+        # Requests are handled on one thread each
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.bot.process_new_updates(batch)
+            except Exception as e:
+                print(f"Error dispatching updates: {e}")
+            self._count('dispatched', len(batch))
+            self._count('batches')
+
+    def start(self):
+        """
+        Starts the dispatch thread and the HTTP server in the background.
+        """
+        with self._lock:
+            if self._threads:
+                return
+            for target, name in ((self._dispatch, 'webhook-dispatch'), (self._server.serve_forever, 'webhook-http')):
+                thread = threading.Thread(target=target, name=name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self.start()
+        self._threads[-1].join()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'received': self.received,
+                'rejected': self.rejected,
+                'dropped': self.dropped,
+                'dispatched': self.dispatched,
+                'batches': self.batches,
+                'queued': self._queue.qsize(),
+            }